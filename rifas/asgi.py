@@ -13,4 +13,10 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rifas.settings')
 
+# Servidor soportado en producción: uvicorn, un proceso por núcleo, p. ej.
+#   uvicorn rifas.asgi:application --workers 2
+# Solo con ASGI el stream de avance (views.sorteo_events) queda abierto sin ocupar un
+# hilo. rifas.wsgi sigue funcionando (gunicorn con --threads), pero ese stream se
+# reduce a consultas periódicas.
+
 application = get_asgi_application()
@@ -50,6 +50,7 @@ PHONENUMBER_DEFAULT_REGION = "VE"
 PHONENUMBER_DB_FORMAT = "NATIONAL"  
 
 MIDDLEWARE = [
+    'sorteo.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -63,7 +64,8 @@ ROOT_URLCONF = 'rifas.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'sorteo.template_backends.DjangoTemplates',
+        'NAME': 'django',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -91,10 +93,25 @@ DATABASES = {
         'HOST': os.getenv('DB_HOST'),
         'OPTIONS': {
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
+            # El predeterminado de Django; la verificación de pagos cuenta con él (ver
+            # services._verify_sorteo_group).
+            'isolation_level': 'read committed',
         },
     }
 }
 
+# Réplicas de lectura para las vistas públicas (ver sorteo/routers.py), separadas por
+# comas en DB_REPLICA_HOSTS. Sin réplicas, todo se lee de `default`.
+READ_REPLICAS = []
+for index, host in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    DATABASES[f'replica{index}'] = {**DATABASES['default'], 'HOST': host.strip(), 'TEST': {'MIRROR': 'default'}}
+    READ_REPLICAS.append(f'replica{index}')
+DATABASE_ROUTERS = ['sorteo.routers.ReplicaRouter']
+# Segundos que un navegador lee de la base principal después de registrar un pago.
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 10))
+# Segundos que una réplica que no respondió queda fuera antes de volver a intentarlo.
+REPLICA_RETRY_SECONDS = int(os.getenv('REPLICA_RETRY_SECONDS', 30))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -140,6 +157,9 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Configuración de archivos multimedia (subidos por el usuario)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Servir MEDIA_ROOT desde Django (con rangos de bytes, ver sorteo/media.py). Por defecto
+# solo en desarrollo; en producción puede activarse si el servidor web no sirve /media/.
+SERVE_MEDIA = os.getenv('SERVE_MEDIA', '1' if DEBUG else '') == '1'
 
 # Configuración HSTS (HTTP Strict Transport Security)
 SECURE_HSTS_SECONDS = 30 * 24 * 60 * 60  # 30 días en segundos
@@ -159,3 +179,37 @@ X_FRAME_OPTIONS = 'DENY'
 # Protección XSS
 SECURE_BROWSER_XSS_FILTER = True
 SECURE_CONTENT_TYPE_NOSNIFF = True
+
+# Verificación de pagos en segundo plano
+# Los pagos con esta cantidad de tickets o más se encolan y los procesa `manage.py process_verifications`.
+VERIFICATION_QUEUE_THRESHOLD = int(os.getenv('VERIFICATION_QUEUE_THRESHOLD', 200))
+# Intentos máximos de un trabajo de verificación antes de marcarlo como fallido.
+VERIFICATION_MAX_ATTEMPTS = int(os.getenv('VERIFICATION_MAX_ATTEMPTS', 5))
+# Minutos que un pago en espera mantiene apartados sus tickets; al vencer los libera
+# `manage.py release_expired_holds` (p. ej. desde cron cada pocos minutos).
+PAYMENT_HOLD_MINUTES = int(os.getenv('PAYMENT_HOLD_MINUTES', 24 * 60))
+
+# Caché compartida por todos los procesos del servidor (página de inicio, fragmentos de plantilla).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')),
+        'TIMEOUT': 300,
+    }
+}
+
+# Métricas por petición (consultas SQL, tiempos, Server-Timing). Desactivadas por defecto.
+REQUEST_METRICS = os.getenv('REQUEST_METRICS', '') == '1'
+# Peticiones recientes por vista que se guardan para calcular los percentiles.
+REQUEST_METRICS_WINDOW = int(os.getenv('REQUEST_METRICS_WINDOW', 500))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'sorteo.metrics': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
@@ -13,4 +13,7 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'rifas.settings')
 
+# El servidor soportado es ASGI (ver rifas/asgi.py); este módulo se mantiene para
+# servidores WSGI, con el stream de avance reducido a consultas periódicas.
+
 application = get_wsgi_application()
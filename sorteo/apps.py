@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SorteoConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'sorteo'
+
+    def ready(self):
+        from . import signals  # noqa: F401
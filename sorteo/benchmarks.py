@@ -0,0 +1,327 @@
+"""
+Benchmarks de las rutas más usadas de la app, para el comando `manage.py bench`.
+
+Cada benchmark prepara sus datos fuera de la medición y devuelve una función que
+hace la petición número `i` con el cliente de pruebas de Django. Se mide la
+latencia de punta a punta (middleware, vista y plantilla) y las consultas SQL que
+hizo cada petición.
+"""
+import math
+import time
+from datetime import date
+
+from django.db import connection
+from django.db.models import F
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .metrics import percentile
+from .models import Payment, SalesBucket, Sorteo, SorteoStats, Ticket
+from .pagination import keyset_paginate
+from .search import build_search_text
+from .serials import permute
+
+FIRST_NAMES = ['Ana', 'Luis', 'María', 'José', 'Carmen', 'Pedro', 'Rosa', 'Andrés', 'Lucía', 'Jesús']
+LAST_NAMES = ['Pérez', 'González', 'Rodríguez', 'Hernández', 'Martínez', 'López', 'Díaz', 'Rivas']
+
+
+class SeedData:
+    """
+    Datos sembrados para una corrida: el sorteo, los clientes y las muestras para las búsquedas.
+    """
+
+    def __init__(self, sorteo, staff_client, public_client, owners, rng):
+        self.sorteo = sorteo
+        self.staff_client = staff_client
+        self.public_client = public_client
+        self.owners = owners
+        self.rng = rng
+        self.counter = 0
+
+    def next_ci(self):
+        # Cédulas fuera del rango sembrado para no chocar con los datos existentes.
+        self.counter += 1
+        return str(90000000 + self.counter)
+
+
+def seed(payments, tickets_per_payment, fill, headroom, user, rng):
+    """
+    Crea un sorteo principal con `payments` pagos (70% verificados, 20% en espera,
+    10% cancelados) y los tickets de los verificados, usando inserciones en lote.
+    `fill` es la fracción del sorteo que queda vendida; `headroom` son tickets extra
+    para lo que vendan los propios benchmarks.
+    """
+    states = ['V'] * 7 + ['E'] * 2 + ['C']
+    plan = []
+    for index in range(payments):
+        name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        ci = str(10000000 + index)
+        plan.append({
+            'owner_name': name,
+            'owner_ci': ci,
+            'owner_email': f"{name.split()[0].lower()}.{ci}@example.com",
+            # Única por pago: (banco, referencia) tiene un índice único.
+            'reference': f"{rng.randrange(10**5):05d}{index:07d}",
+            'state': rng.choice(states),
+            'tickets_quantity': rng.randint(1, tickets_per_payment * 2 - 1),
+        })
+
+    sold = sum(item['tickets_quantity'] for item in plan if item['state'] == 'V')
+    Sorteo.objects.filter(is_main=True).update(is_main=False)
+    sorteo = Sorteo.objects.create(
+        title='Benchmark', description='Sorteo generado por manage.py bench.',
+        prize_picture='premios/bench.png', ticket_price=2, state='A',
+        total_tickets=math.ceil(sold / fill) + headroom, lottery_conditions='-',
+        date_lottery_text='Al alcanzar el 100%', is_main=True,
+    )
+
+    Payment.objects.bulk_create([
+        Payment(
+            sorteo=sorteo, method='P', bank_of_transfer='0102', type_CI='V',
+            owner_phone='+584141234567', transferred_date=date.today(),
+            transferred_amount=sorteo.ticket_price * item['tickets_quantity'],
+            serial=f"REF-BENCH-{index}", state_order=Payment.STATE_ORDER[item['state']],
+            search_text=build_search_text(
+                item['owner_name'], item['owner_ci'], item['owner_email'], item['reference'], f"REF-BENCH-{index}"
+            ),
+            **item,
+        )
+        for index, item in enumerate(plan)
+    ], batch_size=1000)
+
+    # bulk_create no devuelve las claves primarias en MySQL, así que se leen de nuevo.
+    tickets, position = [], 0
+    for payment in Payment.objects.filter(sorteo=sorteo, state='V').order_by('pk').iterator():
+        for _ in range(payment.tickets_quantity):
+            serial = permute(position, sorteo.total_tickets, sorteo.serial_key) + 1
+            tickets.append(Ticket.for_payment(payment, serial, sorteo))
+            position += 1
+        if len(tickets) >= 5000:
+            Ticket.objects.bulk_create(tickets)
+            tickets = []
+    Ticket.objects.bulk_create(tickets)
+    Sorteo.objects.filter(pk=sorteo.pk).update(tickets_solds=position, serial_cursor=position)
+    # bulk_create no pasa por Payment.save, así que las estadísticas se calculan al final.
+    SorteoStats.rebuild(sorteo.pk)
+    SalesBucket.rebuild(sorteo.pk)
+    sorteo.refresh_from_db()
+
+    # `secure=True` evita la redirección a HTTPS de SECURE_SSL_REDIRECT.
+    staff_client = Client(secure=True)
+    staff_client.force_login(user)
+    owners = [(item['owner_name'], item['owner_ci'], item['owner_email'], item['reference']) for item in plan]
+    return SeedData(sorteo, staff_client, Client(secure=True), owners, rng)
+
+
+def _home(data, count):
+    return lambda i: data.public_client.get(reverse('home'))
+
+
+def _process_payment(data, count):
+    url = reverse('process_payment', args=[data.sorteo.slug])
+
+    def run(i):
+        ci = data.next_ci()
+        return data.public_client.post(url, {
+            'tickets_quantity': 2, 'owner_name': 'Compra Benchmark', 'type_CI': 'V', 'owner_ci': ci,
+            'owner_email': f"bench.{ci}@example.com", 'owner_phone': '+584141234567', 'method': 'P',
+            'bank_of_transfer': '0102', 'reference': f"B{ci}", 'transferred_date': date.today().isoformat(),
+            'transferred_amount': data.sorteo.ticket_price * 2,
+        })
+    return run
+
+
+def _verify_payment(data, count):
+    # Un pago en espera nuevo por petición, creado antes de empezar a medir.
+    payments = []
+    for _ in range(count):
+        ci = data.next_ci()
+        payments.append(Payment.objects.create(
+            sorteo=data.sorteo, owner_name='Verificación Benchmark', owner_ci=ci,
+            owner_email=f"bench.{ci}@example.com", owner_phone='+584141234567', method='P',
+            bank_of_transfer='0102', reference=f"V{ci}", state='E', tickets_quantity=5,
+            transferred_amount=data.sorteo.ticket_price * 5, transferred_date=date.today(),
+        ))
+    url = reverse('verify_payment')
+    return lambda i: data.staff_client.post(
+        url, {'payment_id': payments[i].pk}, content_type='application/json'
+    )
+
+
+def _payment_list_search(data, count):
+    # Alterna los tipos de búsqueda: nombre (texto completo), cédula, correo y referencia.
+    url = reverse('payment_list')
+    queries = []
+    for i in range(count):
+        name, ci, email, reference = data.rng.choice(data.owners)
+        queries.append([name.split()[1], ci, email, reference][i % 4])
+    return lambda i: data.staff_client.get(url, {'q': queries[i]})
+
+
+def _ticket_list(data, count):
+    # Recorre páginas cada vez más profundas (volviendo a la primera al llegar al
+    # final); los cursores se calculan antes de medir.
+    queryset = Ticket.objects.filter(sorteo=data.sorteo)
+    cursors = [None]
+    while len(cursors) < count:
+        page = keyset_paginate(queryset, [('serial', False)], after=cursors[-1], per_page=20)
+        cursors.append(page.next_cursor)
+    url = reverse('ticket_list', args=[data.sorteo.pk])
+    return lambda i: data.staff_client.get(url, {'after': cursors[i]} if cursors[i] else {})
+
+
+def _verify_tickets(data, count):
+    url = reverse('verify_tickets')
+    queries = []
+    for i in range(count):
+        _, ci, email, _ = data.rng.choice(data.owners)
+        queries.append(ci if i % 2 else email)
+    return lambda i: data.public_client.get(url, {'q': queries[i]})
+
+
+BENCHMARKS = {
+    'home': _home,
+    'process_payment': _process_payment,
+    'verify_payment': _verify_payment,
+    'payment_list_search': _payment_list_search,
+    'ticket_list': _ticket_list,
+    'verify_tickets': _verify_tickets,
+}
+
+
+def _fill_to(sorteo, payment, sold):
+    """
+    Vende en lote las siguientes posiciones del cursor hasta tener `sold` tickets,
+    igual que las habría asignado verify_payment.
+    """
+    sorteo.refresh_from_db()
+    for start in range(sorteo.serial_cursor, sold, 20000):
+        Ticket.objects.bulk_create([
+            Ticket.for_payment(payment, permute(position, sorteo.total_tickets, sorteo.serial_key) + 1, sorteo)
+            for position in range(start, min(start + 20000, sold))
+        ], batch_size=5000)
+    Sorteo.objects.filter(pk=sorteo.pk).update(
+        tickets_solds=F('tickets_solds') + sold - sorteo.serial_cursor, serial_cursor=sold
+    )
+
+
+def _fill_wrapped(sorteo, payment, sold, rng):
+    """
+    Vende en lote números al azar hasta tener `sold` tickets y deja el cursor ya
+    pasado de vuelta, como después de muchas reservas liberadas: los números libres
+    quedan repartidos detrás del cursor.
+    """
+    sorteo.refresh_from_db()
+    taken = set(Ticket.objects.filter(sorteo=sorteo).values_list('serial', flat=True))
+    free = [number for number in range(1, sorteo.total_tickets + 1) if number not in taken]
+    numbers = rng.sample(free, max(sold - len(taken), 0))
+    for start in range(0, len(numbers), 20000):
+        Ticket.objects.bulk_create([
+            Ticket.for_payment(payment, number, sorteo) for number in numbers[start:start + 20000]
+        ], batch_size=5000)
+    Sorteo.objects.filter(pk=sorteo.pk).update(
+        tickets_solds=F('tickets_solds') + len(numbers),
+        serial_cursor=max(sorteo.serial_cursor, sorteo.total_tickets),
+    )
+
+
+def fill_sweep(total_tickets, levels, iterations, user, wrapped=False, rng=None):
+    """
+    Latencia de verify_payment (pagos de 5 tickets) sobre un mismo sorteo de
+    `total_tickets` a medida que se llena: para cada fracción de `levels` se venden
+    en lote los tickets que faltan y se miden `iterations` verificaciones. La
+    fracción 1 deja libres justo los tickets que venden las mediciones, así que la
+    última termina con el sorteo agotado. Con `wrapped`, los tickets se venden al
+    azar con el cursor ya pasado de vuelta (ver _fill_wrapped).
+    """
+    quantity = 5
+    headroom = iterations * quantity
+    sorteo = Sorteo.objects.create(
+        title='Benchmark llenado', description='Sorteo generado por manage.py bench --fill-sweep.',
+        prize_picture='premios/bench.png', ticket_price=2, state='A', total_tickets=total_tickets,
+        lottery_conditions='-', date_lottery_text='Al alcanzar el 100%',
+    )
+    seed_payment = Payment.objects.create(
+        sorteo=sorteo, owner_name='Llenado Benchmark', owner_ci='80000000', owner_email='llenado@example.com',
+        owner_phone='+584141234567', method='P', bank_of_transfer='0102', reference='LLENADO',
+        state='V', tickets_quantity=0, transferred_amount=0, transferred_date=date.today(),
+    )
+    # `secure=True` evita la redirección a HTTPS de SECURE_SSL_REDIRECT.
+    client = Client(secure=True)
+    client.force_login(user)
+    url = reverse('verify_payment')
+
+    results = []
+    for level in sorted(levels):
+        target = min(int(total_tickets * level), total_tickets - headroom)
+        if wrapped:
+            _fill_wrapped(sorteo, seed_payment, target, rng)
+        else:
+            _fill_to(sorteo, seed_payment, target)
+        payments = [
+            Payment.objects.create(
+                sorteo=sorteo, owner_name='Verificación Benchmark', owner_ci=str(81000000 + index),
+                owner_email=f"llenado.{index}@example.com", owner_phone='+584141234567', method='P',
+                bank_of_transfer='0102', reference=f"L{level}-{index}", state='E', tickets_quantity=quantity,
+                transferred_amount=sorteo.ticket_price * quantity, transferred_date=date.today(),
+            )
+            for index in range(iterations)
+        ]
+        latencies, query_counts, errors = [], [], 0
+        for payment in payments:
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = client.post(url, {'payment_id': payment.pk}, content_type='application/json')
+                latencies.append((time.perf_counter() - started) * 1000)
+            query_counts.append(len(queries.captured_queries))
+            errors += response.status_code >= 400
+        latencies.sort()
+        sorteo.refresh_from_db()
+        results.append({
+            'fill': level,
+            'sold_before': target,
+            'sold_after': sorteo.tickets_solds,
+            'errors': errors,
+            'p50_ms': round(percentile(latencies, 0.50), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'queries_max': max(query_counts),
+        })
+    return results
+
+
+def run_benchmark(name, data, iterations, warmup):
+    """
+    Ejecuta un benchmark y devuelve sus estadísticas. Las peticiones de calentamiento
+    no se cuentan.
+    """
+    request = BENCHMARKS[name](data, iterations + warmup)
+    latencies, query_counts, query_times, errors = [], [], [], 0
+    for i in range(iterations + warmup):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = request(i)
+            elapsed = time.perf_counter() - started
+        if i < warmup:
+            continue
+        if response.status_code >= 400:
+            errors += 1
+        latencies.append(elapsed * 1000)
+        query_counts.append(len(queries.captured_queries))
+        query_times.append(sum(float(query['time']) for query in queries.captured_queries) * 1000)
+
+    latencies.sort()
+    query_counts.sort()
+    query_times.sort()
+    return {
+        'iterations': iterations,
+        'errors': errors,
+        'mean_ms': round(sum(latencies) / len(latencies), 3) if latencies else None,
+        'p50_ms': round(percentile(latencies, 0.50), 3) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95), 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99), 3) if latencies else None,
+        'queries_p50': percentile(query_counts, 0.50),
+        'queries_max': query_counts[-1] if query_counts else None,
+        'sql_ms_p50': round(percentile(query_times, 0.50), 3) if query_times else None,
+        'sql_ms_p95': round(percentile(query_times, 0.95), 3) if query_times else None,
+    }
@@ -0,0 +1,44 @@
+"""
+Operaciones sobre mapas de bits guardados como bytes: el bit `i` es el bit `i % 8`
+del byte `i // 8`. Los usan los bloques de números de los sorteos con elección de
+números (ver NumberBlock).
+"""
+
+
+def empty(size):
+    return bytearray((size + 7) // 8)
+
+
+def as_int(bits):
+    return int.from_bytes(bytes(bits), 'little')
+
+
+def is_set(bits, index):
+    return bool(bits[index >> 3] & (1 << (index & 7)))
+
+
+def set_bits(bits, indexes):
+    for index in indexes:
+        bits[index >> 3] |= 1 << (index & 7)
+
+
+def clear_bits(bits, indexes):
+    for index in indexes:
+        bits[index >> 3] &= ~(1 << (index & 7)) & 0xFF
+
+
+def free_positions(sold, held, first, last, limit):
+    """
+    Posiciones libres (ni vendidas ni apartadas) entre `first` y `last` inclusive, y
+    cuántas hay en total. Devuelve como mucho `limit` posiciones. Todo el rango se
+    resuelve con operaciones sobre enteros de Python, sin recorrer bit por bit.
+    """
+    width = last - first + 1
+    free = ~(as_int(sold) | as_int(held)) >> first & ((1 << width) - 1)
+    count = bin(free).count('1')
+    positions = []
+    while free and len(positions) < limit:
+        lowest = free & -free
+        positions.append(first + lowest.bit_length() - 1)
+        free ^= lowest
+    return positions, count
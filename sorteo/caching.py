@@ -0,0 +1,42 @@
+"""
+Caché de la página de inicio.
+
+El sorteo principal y sus premios se guardan en la caché con `HOME_CACHE_KEY`, y los
+bloques pesados de `home.html` (premio, progreso y video) se cachean como fragmentos
+con la clave `sorteo.pk` + `sorteo.version`. Cualquier cambio del sorteo, de sus
+premios o de los tickets vendidos sube `version` y borra `HOME_CACHE_KEY`, así que la
+siguiente visita vuelve a leer la base de datos y los fragmentos viejos dejan de usarse.
+"""
+from django.core.cache import cache
+from django.db import transaction
+
+from .routers import use_primary
+
+HOME_CACHE_KEY = 'sorteo:home'
+HOME_CACHE_TIMEOUT = 300
+
+
+async def aget_home_sorteo():
+    """
+    Devuelve (sorteo, premios) del sorteo principal, leyendo la base de datos solo si no
+    están en caché.
+    """
+    from .models import Premio, Sorteo
+
+    cached = await cache.aget(HOME_CACHE_KEY)
+    if cached is not None:
+        return cached
+
+    with use_primary():
+        sorteo = await Sorteo.objects.filter(is_main=True).afirst()
+        premios = [premio async for premio in Premio.objects.filter(sorteo=sorteo).order_by('position')]
+    await cache.aset(HOME_CACHE_KEY, (sorteo, premios), HOME_CACHE_TIMEOUT)
+    return sorteo, premios
+
+
+def invalidate_home_cache():
+    """
+    Borra el sorteo principal de la caché cuando termine la transacción en curso, para
+    que ninguna visita vuelva a guardar los datos anteriores al cambio.
+    """
+    transaction.on_commit(lambda: cache.delete(HOME_CACHE_KEY))
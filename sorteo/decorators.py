@@ -0,0 +1,54 @@
+"""
+Versiones async de `condition` y `cache_control`: en Django 4.2 los decoradores de
+django.views.decorators solo aceptan vistas síncronas.
+"""
+import datetime
+from functools import wraps
+
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+
+def async_condition(etag_func=None, last_modified_func=None):
+    """
+    Como django.views.decorators.http.condition, con funciones de ETag y Last-Modified
+    async que reciben los mismos argumentos que la vista.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            etag = await etag_func(request, *args, **kwargs) if etag_func else None
+            etag = quote_etag(etag) if etag is not None else None
+            last_modified = await last_modified_func(request, *args, **kwargs) if last_modified_func else None
+            if last_modified:
+                if not timezone.is_aware(last_modified):
+                    last_modified = timezone.make_aware(last_modified, datetime.timezone.utc)
+                last_modified = int(last_modified.timestamp())
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+
+            if request.method in ('GET', 'HEAD'):
+                if last_modified and not response.has_header('Last-Modified'):
+                    response.headers['Last-Modified'] = http_date(last_modified)
+                if etag:
+                    response.headers.setdefault('ETag', etag)
+            return response
+        return inner
+    return decorator
+
+
+def async_cache_control(**options):
+    """
+    Como django.views.decorators.cache.cache_control, para vistas async.
+    """
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            response = await view(request, *args, **kwargs)
+            patch_cache_control(response, **options)
+            return response
+        return inner
+    return decorator
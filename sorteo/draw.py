@@ -0,0 +1,138 @@
+"""
+Sorteo de los ganadores de cada premio.
+
+Los ganadores salen de un generador `random.Random` inicializado con una semilla que
+se guarda en el sorteo, así que cualquiera puede repetir el sorteo con la misma
+semilla y comprobar que da los mismos números. Los candidatos se toman directamente
+del espacio de números 1..total_tickets y se comprueban en bloque contra el índice
+único (sorteo, serial), sin cargar los tickets en memoria.
+"""
+import random
+import secrets
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Premio, Sorteo, Ticket
+
+# Candidatos que se comprueban por consulta.
+PROBE_BATCH = 256
+# Con menos de 1 ticket vendido cada tantos números, se sortea por posición en el
+# índice en lugar de probar números al azar.
+SPARSE_RATIO = 100
+
+
+def generate_seed():
+    return secrets.token_hex(16)
+
+
+def _draw_by_probing(sorteo, rng, exclude):
+    """
+    Prueba números al azar del rango completo hasta dar con uno vendido. El orden de
+    los candidatos lo fija el generador; los bloques solo agrupan las consultas.
+    """
+    while True:
+        candidates = [rng.randint(1, sorteo.total_tickets) for _ in range(PROBE_BATCH)]
+        sold = dict(
+            Ticket.objects.filter(sorteo=sorteo, serial__in=candidates).values_list('serial', 'pk')
+        )
+        for serial in candidates:
+            if serial in sold and serial not in exclude:
+                return serial, sold[serial]
+
+
+def _draw_by_rank(sorteo, rng, exclude, sold_count):
+    """
+    Elige una posición al azar entre los tickets vendidos y la busca en el índice.
+    Solo se usa cuando hay pocos tickets, así que el OFFSET es barato.
+    """
+    while True:
+        rank = rng.randrange(sold_count)
+        serial, pk = Ticket.objects.filter(sorteo=sorteo).order_by('serial').values_list('serial', 'pk')[rank]
+        if serial not in exclude:
+            return serial, pk
+
+
+def draw_plan(sorteo):
+    """
+    Modo del sorteo ('R' por posición, 'P' probando números al azar) y tickets
+    vendidos con que se calcula. Se guardan junto con la semilla para que la
+    verificación repita exactamente el mismo cálculo.
+    """
+    # El contador del sorteo evita un COUNT(*) sobre millones de tickets; el conteo
+    # exacto solo hace falta cuando hay pocos y se sortea por posición.
+    if sorteo.tickets_solds * SPARSE_RATIO < sorteo.total_tickets:
+        return 'R', Ticket.objects.filter(sorteo=sorteo).count()
+    return 'P', sorteo.tickets_solds
+
+
+def draw_winners(sorteo, seed, mode, sold_count):
+    """
+    Calcula el número ganador de cada premio del sorteo, en orden de posición, sin
+    guardar nada. Devuelve una lista de (premio, serial, ticket_id).
+    Un mismo número no puede ganar dos premios.
+    """
+    premios = list(Premio.objects.filter(sorteo=sorteo).order_by('position', 'pk'))
+    if not premios:
+        raise ValidationError("El sorteo no tiene premios.")
+    if sold_count < len(premios):
+        raise ValidationError("Hay menos tickets vendidos que premios.")
+
+    rng = random.Random(seed)
+    winners, exclude = [], set()
+    for premio in premios:
+        if mode == 'R':
+            serial, ticket_id = _draw_by_rank(sorteo, rng, exclude, sold_count)
+        else:
+            serial, ticket_id = _draw_by_probing(sorteo, rng, exclude)
+        exclude.add(serial)
+        winners.append((premio, serial, ticket_id))
+    return winners
+
+
+def run_draw(sorteo, seed=None):
+    """
+    Sortea los premios y guarda la semilla, el modo y los ganadores. El sorteo debe
+    estar finalizado o vendido, y desde que se sortea no se verifican más pagos (ver
+    services.verify_payments), para que los tickets ya no cambien y el resultado se
+    pueda volver a verificar.
+    """
+    if sorteo.state not in ('F', 'V'):
+        raise ValidationError("Solo se pueden sortear los premios de un sorteo finalizado o vendido.")
+
+    seed = seed or generate_seed()
+    with transaction.atomic():
+        # Con la fila bloqueada, una verificación en curso termina antes de calcular los
+        # ganadores, y las siguientes ven drawn_at y se rechazan.
+        locked = Sorteo.objects.select_for_update().get(pk=sorteo.pk)
+        if locked.drawn_at:
+            raise ValidationError("Este sorteo ya fue realizado.")
+        mode, sold_count = draw_plan(locked)
+        winners = draw_winners(locked, seed, mode, sold_count)
+        Sorteo.objects.filter(pk=sorteo.pk).update(
+            draw_seed=seed, draw_mode=mode, draw_sold=sold_count, drawn_at=timezone.now(),
+            **Sorteo.bump_version()
+        )
+        for premio, _, ticket_id in winners:
+            Premio.objects.filter(pk=premio.pk).update(winning_ticket_id=ticket_id)
+    sorteo.refresh_from_db()
+    return winners
+
+
+def verify_draw(sorteo):
+    """
+    Repite el sorteo con la semilla, el modo y los tickets vendidos guardados y
+    devuelve una lista de (premio, serial esperado, serial registrado) y si todos
+    coinciden.
+    """
+    if not sorteo.draw_seed:
+        raise ValidationError("Este sorteo todavía no se ha realizado.")
+    recorded = dict(
+        Premio.objects.filter(sorteo=sorteo).values_list('pk', 'winning_ticket__serial')
+    )
+    rows = [
+        (premio, serial, recorded.get(premio.pk))
+        for premio, serial, _ in draw_winners(sorteo, sorteo.draw_seed, sorteo.draw_mode, sorteo.draw_sold)
+    ]
+    return rows, all(expected == actual for _, expected, actual in rows)
@@ -33,6 +33,13 @@ class PaymentForm(forms.ModelForm):
         ),
         input_formats=['%Y-%m-%d']
     )
+    # Solo en sorteos con elección de números: números separados por comas o espacios.
+    # Si se deja vacío, los números se asignan al azar al verificar el pago.
+    chosen_numbers = forms.CharField(
+        label="Números elegidos",
+        required=False,
+        widget=forms.TextInput(attrs={'placeholder': 'Ej: 7, 1234, 2500'}),
+    )
 
     def __init__(self, *args, **kwargs):
         # Extraemos 'sorteo' de los kwargs para usarlo en las validaciones.
@@ -40,6 +47,19 @@ class PaymentForm(forms.ModelForm):
         self.sorteo = kwargs.pop('sorteo', None)
         super().__init__(*args, **kwargs)
 
+    def clean_chosen_numbers(self):
+        """
+        Convierte el texto en una lista ordenada de números sin repetir.
+        """
+        text = self.cleaned_data.get('chosen_numbers', '').replace(',', ' ')
+        try:
+            numbers = sorted({int(part) for part in text.split()})
+        except ValueError:
+            raise forms.ValidationError("Escribe solo números separados por comas.")
+        if numbers and self.sorteo and not self.sorteo.choose_numbers:
+            raise forms.ValidationError("Este sorteo no permite elegir números.")
+        return numbers
+
     def clean(self):
         """
         Sobrescribimos el método clean para añadir validaciones personalizadas
@@ -62,10 +82,13 @@ class PaymentForm(forms.ModelForm):
                 # Asociamos el error al campo 'transferred_amount' para que se muestre junto a él.
                 self.add_error('transferred_amount', 'El monto transferido no coincide con el precio y la cantidad de boletos seleccionados.')
 
-        # 3. Validación: El número de referencia no debe estar duplicado.
-        reference = cleaned_data.get('reference')
-        if reference and Payment.objects.filter(reference=reference).exists():
-            self.add_error('reference', 'Este número de referencia ya ha sido registrado en otro pago.')
+        # 3. Validación: si se eligen números, deben ser tantos como boletos.
+        chosen_numbers = cleaned_data.get('chosen_numbers')
+        if chosen_numbers and tickets_quantity is not None and len(chosen_numbers) != tickets_quantity:
+            self.add_error('chosen_numbers', f'Elegiste {len(chosen_numbers)} números para {tickets_quantity} boletos.')
+
+        # La referencia duplicada no se consulta aquí: la rechaza el índice único al
+        # guardar (Payment.save), y la vista la muestra como error de este formulario.
 
     class Meta:
         model = Payment
@@ -102,4 +125,18 @@ class AdminPaymentForm(forms.ModelForm):
             'transferred_date': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
             'transferred_amount': forms.NumberInput(attrs={'class': 'form-control'}),
             'tickets_quantity': forms.NumberInput(attrs={'class': 'form-control'}),
-        }
\ No newline at end of file
+        }
+class BankStatementForm(forms.Form):
+    """
+    Formulario para subir el estado de cuenta de un banco y conciliarlo con los pagos en espera.
+    """
+    bank = forms.ChoiceField(
+        label="Banco",
+        choices=Payment.BANK_CHOICES,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    statement = forms.FileField(
+        label="Estado de cuenta (CSV)",
+        help_text="Debe tener columnas de referencia, monto y fecha.",
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,text/csv'}),
+    )
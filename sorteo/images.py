@@ -0,0 +1,107 @@
+"""
+Versiones reducidas en WebP y JPEG de las imágenes subidas, para servir con srcset.
+
+Las variantes se guardan junto al original en una carpeta `variants/` con un
+manifiesto JSON que registra la fecha de modificación del original; solo se vuelven
+a generar cuando el original cambia.
+"""
+import json
+import os
+
+from PIL import Image, ImageOps
+
+# Anchos de las variantes. El original nunca se agranda: si es más angosto, la
+# variante mayor tiene su ancho.
+VARIANT_WIDTHS = (480, 960, 1440)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 6}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def _variants_dir(name):
+    directory, filename = os.path.split(name)
+    return os.path.join(directory, 'variants'), os.path.splitext(filename)[0]
+
+
+def _manifest_name(name):
+    directory, stem = _variants_dir(name)
+    return os.path.join(directory, f"{stem}.json")
+
+
+def _read_manifest(storage, name):
+    try:
+        with storage.open(_manifest_name(name)) as manifest:
+            return json.load(manifest)
+    except (OSError, ValueError):
+        return None
+
+
+def _save(image, path, image_format, options):
+    # Se escribe a un temporal y se renombra, para no servir nunca un archivo a medias.
+    temporary = f"{path}.tmp"
+    image.save(temporary, image_format, **options)
+    os.replace(temporary, path)
+
+
+def _flatten(image):
+    """
+    JPEG no admite transparencia: se compone sobre fondo blanco.
+    """
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def generate_variants(field_file, force=False):
+    """
+    Genera las variantes de una imagen (un FieldFile de un ImageField) si faltan o si
+    el original cambió desde la última vez. Devuelve el manifiesto.
+    """
+    storage, name = field_file.storage, field_file.name
+    source = storage.path(name)
+    source_mtime = os.path.getmtime(source)
+    manifest = _read_manifest(storage, name)
+    if manifest and manifest['source_mtime'] == source_mtime and not force:
+        return manifest
+
+    directory, stem = _variants_dir(name)
+    os.makedirs(storage.path(directory), exist_ok=True)
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        width, height = image.size
+        widths = sorted({w for w in VARIANT_WIDTHS if w < width} | {min(width, VARIANT_WIDTHS[-1])})
+        variants = {extension: [] for extension in VARIANT_FORMATS}
+        for variant_width in widths:
+            resized = image if variant_width == width else image.resize(
+                (variant_width, round(height * variant_width / width)), Image.LANCZOS
+            )
+            for extension, (image_format, options) in VARIANT_FORMATS.items():
+                variant_name = os.path.join(directory, f"{stem}-{variant_width}w.{extension}")
+                _save(resized if extension == 'webp' else _flatten(resized), storage.path(variant_name), image_format, options)
+                variants[extension].append([variant_width, variant_name])
+
+    manifest = {'source_mtime': source_mtime, 'width': width, 'height': height, 'variants': variants}
+    manifest_path = storage.path(_manifest_name(name))
+    with open(f"{manifest_path}.tmp", 'w') as output:
+        json.dump(manifest, output)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+    return manifest
+
+
+def current_variants(field_file):
+    """
+    Manifiesto de las variantes si existen y corresponden al original actual; None si
+    hay que servir el original. No genera nada: solo lee el manifiesto y la fecha del original.
+    """
+    if not field_file:
+        return None
+    manifest = _read_manifest(field_file.storage, field_file.name)
+    try:
+        fresh = manifest and manifest['source_mtime'] == os.path.getmtime(field_file.storage.path(field_file.name))
+    except OSError:
+        return None
+    return manifest if fresh else None
@@ -0,0 +1,140 @@
+import json
+import random
+import subprocess
+import tempfile
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from sorteo.benchmarks import BENCHMARKS, fill_sweep, run_benchmark, seed
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide la latencia y las consultas SQL de las rutas principales sobre una base de "
+        "pruebas sembrada con datos sintéticos. Nunca toca la base de datos real."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--payments', type=int, default=5000, help="Pagos a sembrar.")
+        parser.add_argument('--tickets-per-payment', type=int, default=5, help="Tickets promedio por pago.")
+        parser.add_argument('--fill', type=float, default=0.5, help="Fracción del sorteo vendida (0-1].")
+        parser.add_argument('--iterations', type=int, default=50, help="Peticiones medidas por benchmark.")
+        parser.add_argument('--warmup', type=int, default=3, help="Peticiones de calentamiento que no se miden.")
+        parser.add_argument('--seed', type=int, default=1, help="Semilla de los datos, para corridas reproducibles.")
+        parser.add_argument(
+            '--only', nargs='+', choices=sorted(BENCHMARKS), help="Ejecuta solo estos benchmarks."
+        )
+        parser.add_argument('--output', help="Archivo JSON donde guardar los resultados.")
+        parser.add_argument('--keepdb', action='store_true', help="Reutiliza la base de pruebas entre corridas.")
+        parser.add_argument(
+            '--no-cache', action='store_true',
+            help="Usa una caché que nunca guarda nada, para comparar las vistas sin su caché.",
+        )
+        parser.add_argument(
+            '--fill-sweep', type=float, nargs='+', metavar='FRACCION',
+            help="En lugar de los benchmarks, mide verify_payment con el sorteo vendido en cada "
+                 "fracción indicada (p. ej. 0 0.5 0.9 0.99 1).",
+        )
+        parser.add_argument(
+            '--sweep-tickets', type=int, default=1000000, help="Tamaño del sorteo de --fill-sweep."
+        )
+        parser.add_argument(
+            '--sweep-wrapped', action='store_true',
+            help="En --fill-sweep, vende números al azar con el cursor ya pasado de vuelta, "
+                 "como después de muchas reservas liberadas.",
+        )
+
+    def handle(self, *args, **options):
+        if not 0 < options['fill'] <= 1:
+            raise CommandError("--fill debe estar entre 0 y 1.")
+        names = options['only'] or list(BENCHMARKS)
+
+        runner = DiscoverRunner(interactive=False, keepdb=options['keepdb'], verbosity=0)
+        runner.setup_test_environment()
+        old_config = runner.setup_databases()
+        try:
+            # Caché en un directorio temporal para no mezclarse con la de la app en marcha.
+            with tempfile.TemporaryDirectory() as cache_dir:
+                cache = {**settings.CACHES['default'], 'LOCATION': cache_dir}
+                if options['no_cache']:
+                    cache = {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+                with override_settings(CACHES={'default': cache}):
+                    if options['fill_sweep']:
+                        results = {'fill_sweep': self.run_sweep(options)}
+                    else:
+                        results = self.run_all(names, options)
+        finally:
+            runner.teardown_databases(old_config)
+            runner.teardown_test_environment()
+
+        report = {'meta': self.meta(options), 'benchmarks': results}
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Resultados guardados en {options['output']}"))
+
+    def run_all(self, names, options):
+        rng = random.Random(options['seed'])
+        user = User.objects.create_superuser('bench', 'bench@example.com', None)
+        self.stdout.write(f"Sembrando {options['payments']} pagos...")
+        # Margen para los pagos que verifica el benchmark de verify_payment (5 tickets cada uno).
+        headroom = (options['iterations'] + options['warmup']) * 5
+        data = seed(options['payments'], options['tickets_per_payment'], options['fill'], headroom, user, rng)
+        self.stdout.write(
+            f"Sorteo con {data.sorteo.tickets_solds} de {data.sorteo.total_tickets} tickets vendidos.\n"
+        )
+
+        self.stdout.write(f"{'benchmark':<22}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'consultas':>11}{'sql ms':>10}{'errores':>9}")
+        results = {}
+        for name in names:
+            result = run_benchmark(name, data, options['iterations'], options['warmup'])
+            results[name] = result
+            self.stdout.write(
+                f"{name:<22}{result['p50_ms']:>10}{result['p95_ms']:>10}{result['p99_ms']:>10}"
+                f"{result['queries_p50']:>11}{result['sql_ms_p50']:>10}{result['errors']:>9}"
+            )
+        return results
+
+    def run_sweep(self, options):
+        if not all(0 <= level <= 1 for level in options['fill_sweep']):
+            raise CommandError("Las fracciones de --fill-sweep deben estar entre 0 y 1.")
+        user = User.objects.create_superuser('bench', 'bench@example.com', None)
+        self.stdout.write(f"Sorteo de {options['sweep_tickets']} tickets, {options['iterations']} verificaciones por fracción.")
+        self.stdout.write(f"{'vendido':<10}{'tickets':>12}{'p50 ms':>10}{'p95 ms':>10}{'consultas':>11}{'errores':>9}")
+        results = fill_sweep(
+            options['sweep_tickets'], options['fill_sweep'], options['iterations'], user,
+            wrapped=options['sweep_wrapped'], rng=random.Random(options['seed']),
+        )
+        for result in results:
+            self.stdout.write(
+                f"{result['fill']:<10}{result['sold_before']:>12}{result['p50_ms']:>10}{result['p95_ms']:>10}"
+                f"{result['queries_max']:>11}{result['errors']:>9}"
+            )
+        return results
+
+    def meta(self, options):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'timestamp': timezone.now().isoformat(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'options': {
+                key: options[key] for key in (
+                    'payments', 'tickets_per_payment', 'fill', 'iterations', 'warmup', 'seed', 'only',
+                    'fill_sweep', 'sweep_tickets', 'sweep_wrapped', 'no_cache',
+                )
+            },
+        }
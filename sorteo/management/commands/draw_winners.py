@@ -0,0 +1,50 @@
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from sorteo.draw import run_draw, verify_draw
+from sorteo.models import Sorteo
+
+
+class Command(BaseCommand):
+    help = "Sortea el ticket ganador de cada premio de un sorteo, o verifica un sorteo ya realizado."
+
+    def add_arguments(self, parser):
+        parser.add_argument('sorteo', help="ID o slug del sorteo.")
+        parser.add_argument(
+            '--seed',
+            help="Semilla a usar, por ejemplo un número publicado de antemano. Si no se indica se genera una al azar.",
+        )
+        parser.add_argument(
+            '--verify', action='store_true', help="Repite el sorteo con la semilla guardada y compara los ganadores."
+        )
+
+    def handle(self, *args, **options):
+        lookup = {'pk': options['sorteo']} if options['sorteo'].isdigit() else {'slug': options['sorteo']}
+        try:
+            sorteo = Sorteo.objects.get(**lookup)
+        except Sorteo.DoesNotExist:
+            raise CommandError(f"No existe el sorteo {options['sorteo']}.")
+
+        started = time.perf_counter()
+        try:
+            if options['verify']:
+                rows, ok = verify_draw(sorteo)
+            else:
+                winners = run_draw(sorteo, options['seed'])
+                rows, ok = [(premio, serial, serial) for premio, serial, _ in winners], True
+        except ValidationError as e:
+            raise CommandError(e.messages[0])
+        elapsed = (time.perf_counter() - started) * 1000
+
+        self.stdout.write(f"Sorteo: {sorteo.title}  Semilla: {sorteo.draw_seed}")
+        for premio, expected, recorded in rows:
+            line = f"{premio.position}. {premio.name}: ticket {expected}"
+            if expected != recorded:
+                line += f" (registrado: {recorded})"
+            self.stdout.write(line)
+        if ok:
+            self.stdout.write(self.style.SUCCESS(f"Listo en {elapsed:.1f} ms."))
+        else:
+            raise CommandError("Los ganadores registrados no coinciden con la semilla.")
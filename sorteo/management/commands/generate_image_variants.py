@@ -0,0 +1,39 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from sorteo.caching import invalidate_home_cache
+from sorteo.images import current_variants, generate_variants
+from sorteo.models import Sorteo
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera las variantes WebP/JPEG de las fotos de premios que falten o estén desactualizadas. "
+        "Corre fuera de las peticiones, p. ej. desde cron cada pocos minutos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Regenera aunque el original no haya cambiado.")
+
+    def handle(self, *args, **options):
+        for sorteo in Sorteo.objects.exclude(prize_picture=''):
+            picture = sorteo.prize_picture
+            if current_variants(picture) and not options['force']:
+                continue
+            try:
+                manifest = generate_variants(picture, force=options['force'])
+            except (OSError, ValueError) as e:
+                self.stderr.write(f"{picture.name}: {e}")
+                continue
+            # La página de inicio guardada sin srcset se vuelve a armar con las variantes.
+            Sorteo.objects.filter(pk=sorteo.pk).update(**Sorteo.bump_version())
+            invalidate_home_cache()
+            original = os.path.getsize(picture.path)
+            smallest = min(
+                os.path.getsize(picture.storage.path(name)) for _, name in manifest['variants']['webp']
+            )
+            self.stdout.write(
+                f"{picture.name}: {len(manifest['variants']['webp'])} anchos, "
+                f"original {original // 1024} KB, WebP más liviano {smallest // 1024} KB"
+            )
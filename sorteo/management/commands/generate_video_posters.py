@@ -0,0 +1,73 @@
+import os
+import shutil
+import subprocess
+import tempfile
+
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+
+from sorteo.caching import invalidate_home_cache
+from sorteo.models import Sorteo
+
+# Ancho máximo de la portada; el video se muestra a lo sumo a 800px.
+POSTER_WIDTH = 1280
+
+
+def extract_frame(ffmpeg, source, output, at):
+    """
+    Extrae un cuadro del video en el segundo `at` como JPEG. Devuelve False si el
+    video es más corto y no se obtuvo ninguna imagen.
+    """
+    subprocess.run(
+        [
+            ffmpeg, '-v', 'error', '-y', '-ss', str(at), '-i', source, '-frames:v', '1',
+            '-vf', f"scale='min({POSTER_WIDTH},iw)':-2", '-q:v', '3', output,
+        ],
+        check=True, capture_output=True, timeout=120,
+    )
+    return os.path.exists(output) and os.path.getsize(output) > 0
+
+
+class Command(BaseCommand):
+    help = "Extrae con ffmpeg una portada para los videos promocionales que no tengan una."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--at', type=float, default=1.0, help="Segundo del video del que se toma el cuadro.")
+        parser.add_argument('--force', action='store_true', help="Reemplaza también las portadas existentes.")
+
+    def handle(self, *args, **options):
+        ffmpeg = shutil.which('ffmpeg')
+        if not ffmpeg:
+            raise CommandError("No se encontró ffmpeg en el PATH.")
+
+        sorteos = Sorteo.objects.exclude(video_promo='').exclude(video_promo__isnull=True)
+        if not options['force']:
+            sorteos = sorteos.filter(video_poster='')
+        for sorteo in sorteos:
+            video = sorteo.video_promo
+            with tempfile.TemporaryDirectory() as directory:
+                output = os.path.join(directory, 'poster.jpg')
+                try:
+                    # Si el video dura menos que --at, se usa el primer cuadro.
+                    extracted = extract_frame(ffmpeg, video.path, output, options['at']) or \
+                        extract_frame(ffmpeg, video.path, output, 0)
+                except (OSError, subprocess.SubprocessError) as e:
+                    self.stderr.write(f"{video.name}: {e}")
+                    continue
+                if not extracted:
+                    self.stderr.write(f"{video.name}: no se pudo extraer ningún cuadro.")
+                    continue
+
+                stem = os.path.splitext(os.path.basename(video.name))[0]
+                storage = sorteo.video_poster.storage
+                with open(output, 'rb') as poster:
+                    name = storage.save(f"premios/posters/{stem}.jpg", File(poster))
+
+            previous = sorteo.video_poster.name
+            # UPDATE directo, como los demás procesos en segundo plano, para no pisar
+            # los contadores del sorteo.
+            Sorteo.objects.filter(pk=sorteo.pk).update(video_poster=name, **Sorteo.bump_version())
+            invalidate_home_cache()
+            if previous and previous != name:
+                storage.delete(previous)
+            self.stdout.write(f"{sorteo.title}: {name}")
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sorteo.metrics import percentile
+
+# Pedazos en que un cliente lento envía la petición y tamaño de cada lectura de la respuesta.
+SEND_PIECES = 4
+READ_CHUNK = 4096
+
+
+async def fetch(host, port, request, send_delay, read_delay):
+    """
+    Hace una petición como un cliente lento: envía los encabezados en pedazos con
+    pausas y lee la respuesta de a poco. Devuelve el código de estado.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        size = -(-len(request) // SEND_PIECES)
+        for start in range(0, len(request), size):
+            writer.write(request[start:start + size])
+            await writer.drain()
+            if send_delay:
+                await asyncio.sleep(send_delay / SEND_PIECES)
+        status_line = await reader.readline()
+        while await reader.read(READ_CHUNK):
+            if read_delay:
+                await asyncio.sleep(read_delay)
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+async def client(host, port, request, options, deadline, latencies, outcomes):
+    # Un cliente virtual repite peticiones, una conexión por vez, hasta la fecha límite.
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        try:
+            status = await asyncio.wait_for(
+                fetch(host, port, request, options['send_ms'] / 1000, options['read_ms'] / 1000),
+                options['timeout'],
+            )
+        except asyncio.TimeoutError:
+            outcomes['timeout'] += 1
+            continue
+        except (OSError, ValueError, IndexError):
+            outcomes['error'] += 1
+            await asyncio.sleep(0.1)
+            continue
+        outcomes[status] += 1
+        if status < 400:
+            latencies.append((time.monotonic() - started) * 1000)
+
+
+async def run_level(host, port, request, connections, options):
+    latencies, outcomes = [], Counter()
+    started = time.monotonic()
+    deadline = started + options['duration']
+    await asyncio.gather(*(
+        client(host, port, request, options, deadline, latencies, outcomes) for _ in range(connections)
+    ))
+    elapsed = time.monotonic() - started
+    latencies.sort()
+    return {
+        'connections': connections,
+        'ok': len(latencies),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.5) or 0, 1),
+        'p95_ms': round(percentile(latencies, 0.95) or 0, 1),
+        'timeouts': outcomes['timeout'],
+        'errors': sum(count for key, count in outcomes.items() if key == 'error' or (isinstance(key, int) and key >= 400)),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Prueba de carga con clientes lentos contra un servidor en marcha, para comparar "
+        "cuántas conexiones simultáneas atiende un worker WSGI (p. ej. gunicorn rifas.wsgi "
+        "-w 1 --threads 8) y uno ASGI (p. ej. uvicorn rifas.asgi:application --workers 1)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help="URL a pedir, p. ej. http://127.0.0.1:8000/")
+        parser.add_argument(
+            '--connections', type=int, nargs='+', default=[10, 50, 100, 200],
+            help="Clientes simultáneos de cada nivel.",
+        )
+        parser.add_argument('--duration', type=float, default=10, help="Segundos por nivel.")
+        parser.add_argument('--send-ms', type=float, default=0, help="Milisegundos que tarda el cliente en enviar la petición.")
+        parser.add_argument('--read-ms', type=float, default=0, help="Pausa en milisegundos entre lecturas de 4 KB de la respuesta.")
+        parser.add_argument('--timeout', type=float, default=30, help="Segundos antes de dar una petición por perdida.")
+        parser.add_argument('--output', help="Archivo JSON donde guardar los resultados.")
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError("Solo se admiten URLs http://host[:puerto]/ruta.")
+        path = (url.path or '/') + (f"?{url.query}" if url.query else '')
+        request = (
+            f"GET {path} HTTP/1.1\r\nHost: {url.netloc}\r\nUser-Agent: sorteo-loadtest\r\n"
+            f"Accept: text/html,application/json\r\nConnection: close\r\n\r\n"
+        ).encode()
+
+        self.stdout.write(f"{'conexiones':<12}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'timeouts':>10}{'errores':>9}")
+        results = []
+        for connections in options['connections']:
+            result = asyncio.run(run_level(url.hostname, url.port or 80, request, connections, options))
+            results.append(result)
+            self.stdout.write(
+                f"{connections:<12}{result['requests_per_second']:>10}{result['p50_ms']:>10}"
+                f"{result['p95_ms']:>10}{result['timeouts']:>10}{result['errors']:>9}"
+            )
+
+        if options['output']:
+            report = {
+                'url': options['url'],
+                'send_ms': options['send_ms'],
+                'read_ms': options['read_ms'],
+                'duration': options['duration'],
+                'levels': results,
+            }
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Resultados guardados en {options['output']}"))
@@ -0,0 +1,52 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections, connections
+
+from sorteo.services import claim_verification_jobs, run_verification_jobs
+
+
+class Command(BaseCommand):
+    help = "Procesa la cola de verificaciones de pagos. No necesita ningún broker externo: la cola es la tabla VerificationJob."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Procesa los trabajos disponibles y termina.")
+        parser.add_argument('--batch-size', type=int, default=50, help="Trabajos que toma cada hilo por ronda.")
+        parser.add_argument(
+            '--concurrency', type=int, default=1,
+            help="Hilos que verifican en paralelo. En SQLite conviene dejarlo en 1: solo admite un escritor a la vez."
+        )
+        parser.add_argument('--sleep', type=float, default=2.0, help="Segundos de espera cuando la cola está vacía.")
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while True:
+                processed = sum(executor.map(lambda _: self.process_batch(options['batch_size']), range(concurrency)))
+                if processed:
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+
+    def process_batch(self, batch_size):
+        """
+        Toma y procesa un lote de trabajos en el hilo actual. Devuelve cuántos procesó.
+        """
+        close_old_connections()
+        try:
+            jobs = claim_verification_jobs(batch_size)
+            if not jobs:
+                return 0
+            for job in run_verification_jobs(jobs):
+                self.stdout.write(f"Pago {job.payment_id}: {job.get_state_display()} - {job.message}")
+            return len(jobs)
+        except DatabaseError as e:
+            # Un bloqueo momentáneo de la base no debe tumbar al worker; los trabajos
+            # tomados y no terminados vuelven a la cola cuando se consideran abandonados.
+            self.stderr.write(f"Error de base de datos procesando la cola: {e}")
+            return 0
+        finally:
+            # Cada hilo abre su propia conexión; la cerramos para no acumularlas.
+            connections.close_all()
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from sorteo.models import NumberBlock, Sorteo
+
+
+class Command(BaseCommand):
+    help = "Recalcula desde cero el mapa de números vendidos y apartados de los sorteos con elección de números."
+
+    def add_arguments(self, parser):
+        parser.add_argument('sorteo_ids', nargs='*', type=int, help="IDs de los sorteos. Por defecto, todos los que permiten elegir números.")
+
+    def handle(self, *args, **options):
+        sorteos = Sorteo.objects.filter(choose_numbers=True)
+        if options['sorteo_ids']:
+            sorteos = sorteos.filter(pk__in=options['sorteo_ids'])
+        for sorteo_id in sorteos.values_list('pk', flat=True):
+            NumberBlock.rebuild(sorteo_id)
+            self.stdout.write(f"Sorteo {sorteo_id}: mapa de números recalculado.")
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from sorteo.models import SalesBucket, Sorteo
+
+
+class Command(BaseCommand):
+    help = "Recalcula desde cero las ventas por hora y por día de los sorteos (SalesBucket)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('sorteo_ids', nargs='*', type=int, help="IDs de los sorteos. Por defecto, todos.")
+
+    def handle(self, *args, **options):
+        sorteo_ids = options['sorteo_ids'] or Sorteo.objects.values_list('pk', flat=True)
+        for sorteo_id in sorteo_ids:
+            SalesBucket.rebuild(sorteo_id)
+            self.stdout.write(f"Sorteo {sorteo_id}: ventas por intervalo recalculadas.")
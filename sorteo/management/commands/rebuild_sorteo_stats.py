@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from sorteo.models import Sorteo, SorteoStats
+
+
+class Command(BaseCommand):
+    help = "Recalcula desde cero las estadísticas de pagos de los sorteos (SorteoStats)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('sorteo_ids', nargs='*', type=int, help="IDs de los sorteos. Por defecto, todos.")
+        parser.add_argument(
+            '--recount-tickets', action='store_true',
+            help="También recalcula los tickets vendidos y apartados del sorteo desde los tickets y "
+                 "los pagos en espera. Correr sin verificaciones en curso (worker detenido).",
+        )
+
+    def handle(self, *args, **options):
+        sorteo_ids = options['sorteo_ids'] or Sorteo.objects.values_list('pk', flat=True)
+        for sorteo_id in sorteo_ids:
+            SorteoStats.rebuild(sorteo_id)
+            self.stdout.write(f"Sorteo {sorteo_id}: estadísticas recalculadas.")
+            if options['recount_tickets']:
+                sorteo = Sorteo.objects.get(pk=sorteo_id)
+                sorteo.recount_tickets()
+                self.stdout.write(
+                    f"Sorteo {sorteo_id}: {sorteo.tickets_solds} tickets vendidos, {sorteo.tickets_held} apartados."
+                )
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from sorteo.models import Payment
+
+
+class Command(BaseCommand):
+    help = (
+        "Libera la capacidad y los números apartados por pagos en espera cuyo apartado venció "
+        "(PAYMENT_HOLD_MINUTES). Pensado para correr desde cron cada pocos minutos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Apartados que se liberan por transacción.")
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            released = Payment.release_expired_holds(options['batch_size'])
+            total += released
+            if released < options['batch_size']:
+                break
+        self.stdout.write(f"Apartados vencidos liberados: {total}.")
@@ -0,0 +1,140 @@
+"""
+Servicio de los archivos subidos (MEDIA_ROOT) con soporte de rangos de bytes.
+
+Reemplaza a django.conf.urls.static, que siempre envía el archivo completo: con
+videos eso obliga a descargar desde el principio cada vez que el usuario adelanta
+la reproducción. Esta vista responde `Range` con 206, revalida con `If-None-Match`
+e `If-Modified-Since`, y entrega el archivo con FileResponse para que el servidor
+WSGI pueda usar sendfile.
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_http_methods
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+BLOCK_SIZE = 64 * 1024
+
+
+class RangeFile:
+    """
+    Lee como máximo `length` bytes de un archivo abierto y ya posicionado.
+
+    No expone fileno(): así el servidor WSGI no intenta un sendfile del archivo
+    completo y envía solo el tramo pedido.
+    """
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def _etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def parse_range(header, size):
+    """
+    Interpreta un encabezado Range de un solo tramo y devuelve (inicio, fin) inclusive,
+    o None si no se puede usar. Los pedidos de varios tramos se responden con el
+    archivo completo, que la especificación permite.
+    Lanza ValueError si el tramo queda fuera del archivo (416).
+    """
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # "bytes=-N": los últimos N bytes.
+        length = int(last)
+        if not length:
+            raise ValueError("Rango vacío.")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("Rango fuera del archivo.")
+    return start, end
+
+
+def _range_applies(request, etag, mtime):
+    """
+    If-Range: el rango solo vale si el archivo sigue siendo el que el cliente conoce.
+    """
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == int(mtime)
+
+
+@require_http_methods(['GET', 'HEAD'])
+def serve_media(request, path):
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("Archivo no encontrado.")
+    try:
+        stat = os.stat(fullpath)
+    except OSError:
+        raise Http404("Archivo no encontrado.")
+    if not os.path.isfile(fullpath):
+        raise Http404("Archivo no encontrado.")
+
+    etag, size = _etag(stat), stat.st_size
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        return not_modified
+
+    content_type, encoding = mimetypes.guess_type(fullpath)
+    content_type = content_type or 'application/octet-stream'
+    byte_range = None
+    if 'Range' in request.headers and _range_applies(request, etag, stat.st_mtime):
+        try:
+            byte_range = parse_range(request.headers['Range'], size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            response['Accept-Ranges'] = 'bytes'
+            return response
+
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+        response['Content-Length'] = size
+    elif byte_range is None:
+        # Archivo completo: FileResponse deja el descriptor al servidor (wsgi.file_wrapper).
+        response = FileResponse(open(fullpath, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        file = open(fullpath, 'rb')
+        file.seek(start)
+        response = FileResponse(RangeFile(file, end - start + 1), status=206, content_type=content_type)
+        response.block_size = BLOCK_SIZE
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    return response
@@ -0,0 +1,147 @@
+"""
+Métricas de cada petición (consultas SQL, tiempo de base de datos y de plantillas) y
+un resumen móvil por vista, en memoria del proceso. Las llena RequestMetricsMiddleware.
+"""
+import math
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Métricas de la petición en curso; None fuera de una petición medida.
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+def percentile(values, fraction):
+    """
+    Percentil por rango más cercano de una lista ya ordenada.
+    """
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))]
+
+
+class RequestMetrics:
+    """
+    Acumula lo que ocurre durante una petición.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = Counter()
+        self.statements = Counter()
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.render_depth = 0
+
+    def record_query(self, sql, params, duration):
+        self.queries[(sql, repr(params))] += 1
+        self.statements[sql] += 1
+        self.db_time += duration
+
+    @property
+    def query_count(self):
+        return sum(self.queries.values())
+
+    @property
+    def duplicates(self):
+        """
+        Consultas repetidas con exactamente los mismos parámetros.
+        """
+        return self.query_count - len(self.queries)
+
+    @property
+    def similar(self):
+        """
+        Mayor número de veces que se repitió una misma sentencia con distintos
+        parámetros; un valor alto suele indicar un N+1.
+        """
+        return max(self.statements.values(), default=0)
+
+    def total_time(self):
+        return time.perf_counter() - self.started
+
+
+def query_wrapper(execute, sql, params, many, context):
+    """
+    Envoltorio de `execute_wrappers` que cuenta y cronometra las consultas.
+    """
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(sql, params, time.perf_counter() - started)
+
+
+@contextmanager
+def rendering():
+    """
+    Suma el tiempo del bloque al render de plantillas de la petición en curso. Los
+    renders anidados (una plantilla que renderiza otra) no se cuentan dos veces.
+    """
+    metrics = current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    metrics.render_depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.render_depth -= 1
+        if not metrics.render_depth:
+            metrics.render_time += time.perf_counter() - started
+
+
+class ViewStats:
+    """
+    Últimas `window` peticiones de cada vista, para calcular percentiles.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.lock = threading.Lock()
+        self.samples = defaultdict(lambda: deque(maxlen=self.window))
+        self.counts = Counter()
+
+    def add(self, view_name, total_ms, db_ms, render_ms, queries):
+        with self.lock:
+            self.samples[view_name].append((total_ms, db_ms, render_ms, queries))
+            self.counts[view_name] += 1
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+            self.counts.clear()
+
+    def summary(self):
+        """
+        Resumen por vista ordenado por el p95 de la latencia total, de mayor a menor.
+        """
+        with self.lock:
+            snapshot = {name: list(samples) for name, samples in self.samples.items()}
+            counts = dict(self.counts)
+
+        rows = []
+        for name, samples in snapshot.items():
+            total, db, render, queries = (sorted(column) for column in zip(*samples))
+            rows.append({
+                'view': name,
+                'requests': counts[name],
+                'window': len(samples),
+                'total_p50_ms': round(percentile(total, 0.50), 1),
+                'total_p95_ms': round(percentile(total, 0.95), 1),
+                'db_p50_ms': round(percentile(db, 0.50), 1),
+                'db_p95_ms': round(percentile(db, 0.95), 1),
+                'render_p95_ms': round(percentile(render, 0.95), 1),
+                'queries_p50': percentile(queries, 0.50),
+                'queries_max': queries[-1],
+            })
+        return sorted(rows, key=lambda row: row['total_p95_ms'], reverse=True)
+
+
+view_stats = ViewStats(window=500)
@@ -0,0 +1,84 @@
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .metrics import RequestMetrics, current_metrics, view_stats
+
+logger = logging.getLogger('sorteo.metrics')
+
+
+class RequestMetricsMiddleware:
+    """
+    Mide cada petición: consultas SQL, consultas duplicadas, tiempo de base de datos y
+    de plantillas. Lo envía en la cabecera `Server-Timing`, lo escribe en el log
+    `sorteo.metrics` y lo agrega al resumen por vista de la página de métricas.
+
+    Funciona igual bajo WSGI y ASGI: con un `get_response` async no obliga a pasar la
+    petición por un hilo. Las consultas las cuenta `query_wrapper`, que cada conexión
+    lleva puesto desde que se abre (ver signals.py), y el tiempo de plantillas lo mide
+    el motor `sorteo.template_backends.DjangoTemplates`.
+
+    Solo se activa con REQUEST_METRICS = True; si no, Django la descarta al arrancar.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_METRICS:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        view_stats.window = settings.REQUEST_METRICS_WINDOW
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.report(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        # Las consultas que el ORM async corre en hilos heredan este contexto.
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.report(request, response, metrics)
+
+    def report(self, request, response, metrics):
+        total_ms = metrics.total_time() * 1000
+        db_ms = metrics.db_time * 1000
+        render_ms = metrics.render_time * 1000
+        match = request.resolver_match
+        view_name = (match.view_name or match._func_path) if match else '-'
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={db_ms:.1f};desc="{metrics.query_count} consultas, {metrics.duplicates} duplicadas"',
+            f'render;dur={render_ms:.1f}',
+            f'total;dur={total_ms:.1f}',
+        ])
+        fields = {
+            'view': view_name,
+            'method': request.method,
+            'status': response.status_code,
+            'total_ms': round(total_ms, 1),
+            'db_ms': round(db_ms, 1),
+            'render_ms': round(render_ms, 1),
+            'queries': metrics.query_count,
+            'duplicates': metrics.duplicates,
+            'similar': metrics.similar,
+        }
+        logger.info(' '.join(f"{key}={value}" for key, value in fields.items()), extra={'metrics': fields})
+        if match:
+            view_stats.add(view_name, total_ms, db_ms, render_ms, metrics.query_count)
+        return response
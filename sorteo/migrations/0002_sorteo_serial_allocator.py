@@ -0,0 +1,46 @@
+# Generated by Django 4.2.23 on 2026-10-18 15:51
+
+import django.core.validators
+from django.db import migrations, models
+import sorteo.serials
+
+
+def assign_serial_keys(apps, schema_editor):
+    """
+    AddField evalúa el default una sola vez; cada sorteo necesita su propia clave.
+    """
+    Sorteo = apps.get_model('sorteo', 'Sorteo')
+    for instance in Sorteo.objects.all():
+        instance.serial_key = sorteo.serials.generate_serial_key()
+        instance.save(update_fields=['serial_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sorteo', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sorteo',
+            name='serial_cursor',
+            field=models.PositiveBigIntegerField(default=0, editable=False, verbose_name='Cursor de numeración'),
+        ),
+        migrations.AddField(
+            model_name='sorteo',
+            name='serial_key',
+            field=models.BigIntegerField(default=sorteo.serials.generate_serial_key, editable=False, verbose_name='Clave de numeración'),
+        ),
+        migrations.RunPython(assign_serial_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='payment',
+            name='owner_ci',
+            field=models.CharField(max_length=10, validators=[django.core.validators.MinLengthValidator(6)], verbose_name='Cedula del propietario'),
+        ),
+        migrations.AlterField(
+            model_name='ticket',
+            name='owner_ci',
+            field=models.CharField(max_length=10, validators=[django.core.validators.MinLengthValidator(6)], verbose_name='Cedula del propietario'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.23 on 2026-10-18 15:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sorteo', '0002_sorteo_serial_allocator'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VerificationJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(choices=[('P', 'Pendiente'), ('R', 'En proceso'), ('D', 'Completado'), ('F', 'Fallido')], default='P', max_length=1, verbose_name='Estado')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Intentos')),
+                ('message', models.CharField(blank=True, max_length=255, verbose_name='Mensaje')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Ejecutar a partir de')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Inicio del último intento')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Ultima actualización')),
+                ('payment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='verification_jobs', to='sorteo.payment', verbose_name='Pago')),
+            ],
+            options={
+                'verbose_name': 'Verificación en cola',
+                'verbose_name_plural': 'Verificaciones en cola',
+                'indexes': [models.Index(fields=['state', 'run_after'], name='sorteo_job_state_run_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-18 15:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sorteo', '0003_verificationjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sorteo',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Versión'),
+        ),
+    ]
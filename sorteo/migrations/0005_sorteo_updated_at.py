@@ -0,0 +1,19 @@
+# Generated by Django 4.2.23 on 2026-10-18 15:56
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sorteo', '0004_sorteo_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sorteo',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Ultima actualización'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.2.23 on 2026-10-18 15:57
+
+import django.core.validators
+from django.db import migrations, models
+
+from sorteo.search import build_search_text
+
+
+def fill_search_text(apps, schema_editor):
+    Payment = apps.get_model('sorteo', 'Payment')
+    batch = []
+    for payment in Payment.objects.only(
+        'owner_name', 'owner_ci', 'owner_email', 'reference', 'serial'
+    ).iterator(chunk_size=2000):
+        payment.search_text = build_search_text(
+            payment.owner_name, payment.owner_ci, payment.owner_email, payment.reference, payment.serial
+        )
+        batch.append(payment)
+        if len(batch) >= 2000:
+            Payment.objects.bulk_update(batch, ['search_text'])
+            batch = []
+    Payment.objects.bulk_update(batch, ['search_text'])
+
+
+def add_fulltext_index(apps, schema_editor):
+    # El índice FULLTEXT con parser ngram solo existe en MySQL; en otras bases la
+    # búsqueda cae a LIKE sobre search_text.
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute(
+            'CREATE FULLTEXT INDEX sorteo_payment_search_ft ON sorteo_payment (search_text) WITH PARSER ngram'
+        )
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('DROP INDEX sorteo_payment_search_ft ON sorteo_payment')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sorteo', '0005_sorteo_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Texto de búsqueda'),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='owner_ci',
+            field=models.CharField(db_index=True, max_length=10, validators=[django.core.validators.MinLengthValidator(6)], verbose_name='Cedula del propietario'),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='owner_email',
+            field=models.EmailField(db_index=True, max_length=254, verbose_name='Correo del propietario'),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='reference',
+            field=models.CharField(db_index=True, max_length=30, verbose_name='Referencia'),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='serial',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=50, verbose_name='Serial de la transacción'),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+        migrations.RunPython(add_fulltext_index, drop_fulltext_index),
+    ]
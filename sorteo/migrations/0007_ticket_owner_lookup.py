@@ -0,0 +1,43 @@
+# Generated by Django 4.2.23 on 2026-10-18 15:58
+
+from django.db import migrations, models
+from django.db.models.functions import Lower, Trim, Upper
+
+
+def fill_email_key(apps, schema_editor):
+    Ticket = apps.get_model('sorteo', 'Ticket')
+    Ticket.objects.update(owner_email_key=Lower(Trim('owner_email')))
+
+
+def normalize_owner_ci(apps, schema_editor):
+    """
+    verify_tickets busca la cédula por igualdad (índice sorteo_ticket_ci_idx); los
+    tickets existentes se pasan a la forma que usa Ticket.ci_key.
+    """
+    Ticket = apps.get_model('sorteo', 'Ticket')
+    Ticket.objects.update(owner_ci=Upper(Trim('owner_ci')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sorteo', '0006_payment_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='owner_email_key',
+            field=models.CharField(default='', editable=False, max_length=254, verbose_name='Correo normalizado'),
+        ),
+        migrations.RunPython(fill_email_key, migrations.RunPython.noop),
+        migrations.RunPython(normalize_owner_ci, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['owner_ci', 'created_at'], name='sorteo_ticket_ci_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['owner_email_key', 'created_at'], name='sorteo_ticket_email_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.23 on 2026-10-18 16:00
+
+from django.db import migrations, models
+from django.db.models import Case, Value, When
+
+
+def fill_state_order(apps, schema_editor):
+    Payment = apps.get_model('sorteo', 'Payment')
+    Payment.objects.update(state_order=Case(
+        When(state='E', then=Value(1)),
+        When(state='V', then=Value(2)),
+        When(state='C', then=Value(3)),
+        default=Value(4),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sorteo', '0007_ticket_owner_lookup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='state_order',
+            field=models.PositiveSmallIntegerField(default=4, editable=False, verbose_name='Orden del estado'),
+        ),
+        migrations.RunPython(fill_state_order, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='ticket',
+            unique_together={('sorteo', 'serial')},
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['state_order', '-created_at', '-id'], name='sorteo_payment_list_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.23 on 2026-10-18 16:06
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sorteo', '0008_payment_state_order'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='premio',
+            name='winning_ticket',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='premios_ganados', to='sorteo.ticket', verbose_name='Ticket ganador'),
+        ),
+        migrations.AddField(
+            model_name='sorteo',
+            name='draw_seed',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='Semilla del sorteo'),
+        ),
+        migrations.AddField(
+            model_name='sorteo',
+            name='drawn_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Fecha de realización'),
+        ),
+        migrations.AddField(
+            model_name='sorteo',
+            name='draw_mode',
+            field=models.CharField(blank=True, choices=[('R', 'Por posición'), ('P', 'Números al azar')], editable=False, max_length=1, verbose_name='Modo del sorteo'),
+        ),
+        migrations.AddField(
+            model_name='sorteo',
+            name='draw_sold',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Tickets vendidos al sortear'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.23 on 2026-10-18 16:07
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def fill_stats(apps, schema_editor):
+    Payment = apps.get_model('sorteo', 'Payment')
+    SorteoStats = apps.get_model('sorteo', 'SorteoStats')
+    verified = Q(state='V')
+    rows = Payment.objects.values('sorteo_id').annotate(
+        pending_count=Count('pk', filter=Q(state='E')),
+        pending_amount=Sum('transferred_amount', filter=Q(state='E')),
+        verified_count=Count('pk', filter=verified),
+        verified_amount=Sum('transferred_amount', filter=verified),
+        verified_tickets=Sum('tickets_quantity', filter=verified),
+        cancelled_count=Count('pk', filter=Q(state='C')),
+        cancelled_amount=Sum('transferred_amount', filter=Q(state='C')),
+        unique_buyers=Count('owner_ci', filter=verified, distinct=True),
+    ).order_by()
+    SorteoStats.objects.bulk_create([
+        SorteoStats(**{field: value or 0 for field, value in row.items()})
+        for row in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sorteo', '0009_sorteo_draw'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SorteoStats',
+            fields=[
+                ('sorteo', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='sorteo.sorteo', verbose_name='Sorteo')),
+                ('pending_count', models.PositiveIntegerField(default=0, verbose_name='Pagos en espera')),
+                ('pending_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Monto en espera')),
+                ('verified_count', models.PositiveIntegerField(default=0, verbose_name='Pagos verificados')),
+                ('verified_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Monto verificado')),
+                ('verified_tickets', models.PositiveIntegerField(default=0, verbose_name='Tickets verificados')),
+                ('cancelled_count', models.PositiveIntegerField(default=0, verbose_name='Pagos cancelados')),
+                ('cancelled_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Monto cancelado')),
+                ('unique_buyers', models.PositiveIntegerField(default=0, verbose_name='Compradores únicos')),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Ultima actualización')),
+            ],
+            options={
+                'verbose_name': 'Estadísticas del sorteo',
+                'verbose_name_plural': 'Estadísticas de los sorteos',
+            },
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.23 on 2026-10-18 16:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sorteo', '0010_sorteostats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('H', 'Hora'), ('D', 'Día')], max_length=1, verbose_name='Granularidad')),
+                ('start', models.DateTimeField(verbose_name='Inicio del intervalo')),
+                ('method', models.CharField(max_length=50, verbose_name='Método de Pago')),
+                ('bank_of_transfer', models.CharField(max_length=4, verbose_name='Banco de transferencia')),
+                ('registered_count', models.PositiveIntegerField(default=0, verbose_name='Pagos registrados')),
+                ('registered_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Monto registrado')),
+                ('verified_count', models.PositiveIntegerField(default=0, verbose_name='Pagos verificados')),
+                ('verified_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Monto verificado')),
+                ('verified_tickets', models.PositiveIntegerField(default=0, verbose_name='Tickets verificados')),
+                ('cancelled_count', models.PositiveIntegerField(default=0, verbose_name='Pagos cancelados')),
+                ('cancelled_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Monto cancelado')),
+                ('sorteo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_buckets', to='sorteo.sorteo', verbose_name='Sorteo')),
+            ],
+            options={
+                'verbose_name': 'Ventas por intervalo',
+                'verbose_name_plural': 'Ventas por intervalo',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='salesbucket',
+            constraint=models.UniqueConstraint(fields=('sorteo', 'granularity', 'start', 'method', 'bank_of_transfer'), name='sorteo_salesbucket_unique'),
+        ),
+    ]
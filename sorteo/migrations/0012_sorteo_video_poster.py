@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-18 16:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sorteo', '0011_salesbucket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sorteo',
+            name='video_poster',
+            field=models.ImageField(blank=True, help_text='Imagen que se muestra antes de reproducir el video. Si se deja vacía, se extrae un cuadro del video.', upload_to='premios/posters/', verbose_name='Portada del video'),
+        ),
+    ]
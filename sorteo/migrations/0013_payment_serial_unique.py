@@ -0,0 +1,53 @@
+# Generated by Django 4.2.23 on 2026-10-18 16:13
+
+from django.db import migrations, models
+from django.db.models import Count
+
+from sorteo.search import build_search_text
+from sorteo.serials import generate_payment_serial
+
+
+def deduplicate_serials(apps, schema_editor):
+    """
+    Antes del índice único: el pago más antiguo de cada serial repetido lo conserva
+    (es el que tiene el enlace de confirmación) y los demás, junto con los que no
+    tienen serial, reciben uno nuevo basado en su fecha de creación.
+    """
+    Payment = apps.get_model('sorteo', 'Payment')
+    duplicated = list(
+        Payment.objects.values('serial').annotate(total=Count('pk')).filter(total__gt=1)
+        .values_list('serial', flat=True)
+    )
+    payments = (
+        Payment.objects.filter(serial__in=duplicated + [''])
+        .order_by('serial', 'pk')
+        .only('pk', 'serial', 'created_at', 'owner_name', 'owner_ci', 'owner_email', 'reference')
+    )
+    kept = set()
+    for payment in payments.iterator():
+        if payment.serial and payment.serial not in kept:
+            kept.add(payment.serial)
+            continue
+        serial = generate_payment_serial(payment.created_at)
+        Payment.objects.filter(pk=payment.pk).update(
+            serial=serial,
+            search_text=build_search_text(
+                payment.owner_name, payment.owner_ci, payment.owner_email, payment.reference, serial
+            ),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sorteo', '0012_sorteo_video_poster'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_serials, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='payment',
+            name='serial',
+            field=models.CharField(blank=True, editable=False, max_length=50, unique=True, verbose_name='Serial de la transacción'),
+        ),
+    ]
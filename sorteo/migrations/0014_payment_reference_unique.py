@@ -0,0 +1,65 @@
+# Generated by Django 4.2.23 on 2026-10-18 16:15
+
+from itertools import groupby
+from operator import attrgetter
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+from sorteo.search import build_search_text
+
+# Qué pago conserva una referencia repetida: el verificado antes que el que está en
+# espera, y este antes que el cancelado; a igual estado, el más antiguo.
+KEEP_ORDER = {'V': 0, 'E': 1, 'C': 2}
+
+
+def deduplicate_references(apps, schema_editor):
+    """
+    Antes del índice único: de cada (referencia, banco) repetido se conserva un pago y
+    a los demás se les agrega a la referencia el sufijo "-D<id>", para poder
+    encontrarlos y revisarlos.
+    """
+    Payment = apps.get_model('sorteo', 'Payment')
+    duplicated = (
+        Payment.objects.values('reference', 'bank_of_transfer').annotate(total=Count('pk')).filter(total__gt=1)
+    )
+    condition = Q(pk__in=[])
+    for group in duplicated:
+        condition |= Q(reference=group['reference'], bank_of_transfer=group['bank_of_transfer'])
+    payments = (
+        Payment.objects.filter(condition)
+        .order_by('reference', 'bank_of_transfer', 'pk')
+        .only('pk', 'state', 'serial', 'owner_name', 'owner_ci', 'owner_email', 'reference', 'bank_of_transfer')
+    )
+    for _, group in groupby(payments, key=attrgetter('reference', 'bank_of_transfer')):
+        group = sorted(group, key=lambda payment: (KEEP_ORDER.get(payment.state, 3), payment.pk))
+        for payment in group[1:]:
+            suffix = f"-D{payment.pk}"
+            reference = payment.reference[:30 - len(suffix)] + suffix
+            Payment.objects.filter(pk=payment.pk).update(
+                reference=reference,
+                search_text=build_search_text(
+                    payment.owner_name, payment.owner_ci, payment.owner_email, reference, payment.serial
+                ),
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sorteo', '0013_payment_serial_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_references, migrations.RunPython.noop),
+        # El índice único empieza por la referencia y reemplaza al índice simple.
+        migrations.AddConstraint(
+            model_name='payment',
+            constraint=models.UniqueConstraint(fields=('reference', 'bank_of_transfer'), name='sorteo_payment_reference_unique'),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='reference',
+            field=models.CharField(max_length=30, verbose_name='Referencia'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.23 on 2026-10-18 16:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+import sorteo.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sorteo', '0014_payment_reference_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='chosen_numbers',
+            field=models.JSONField(blank=True, default=list, editable=False, verbose_name='Números elegidos'),
+        ),
+        migrations.AddField(
+            model_name='sorteo',
+            name='choose_numbers',
+            field=models.BooleanField(default=False, help_text='Los compradores pueden elegir sus números al pagar; los demás se asignan al azar.', verbose_name='Permitir elegir números'),
+        ),
+        migrations.CreateModel(
+            name='NumberBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField(verbose_name='Bloque')),
+                ('sold', models.BinaryField(default=sorteo.models.empty_number_block, verbose_name='Números vendidos')),
+                ('held', models.BinaryField(default=sorteo.models.empty_number_block, verbose_name='Números apartados')),
+                ('sorteo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='number_blocks', to='sorteo.sorteo', verbose_name='Sorteo')),
+            ],
+            options={
+                'verbose_name': 'Bloque de números',
+                'verbose_name_plural': 'Bloques de números',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='numberblock',
+            constraint=models.UniqueConstraint(fields=('sorteo', 'index'), name='sorteo_numberblock_unique'),
+        ),
+    ]
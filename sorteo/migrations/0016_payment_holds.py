@@ -0,0 +1,66 @@
+# Generated by Django 4.2.23 on 2026-10-18 16:28
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+from sorteo import bitmaps
+
+# Igual que NumberBlock.BLOCK_SIZE.
+BLOCK_SIZE = 8192
+
+
+def hold_pending_payments(apps, schema_editor):
+    """
+    Aparta la capacidad de los pagos en espera existentes, del más antiguo al más
+    nuevo, mientras alcance. Los que no caben quedan sin apartado, y sus números
+    elegidos se liberan del mapa del sorteo, como al vencer un apartado.
+    """
+    Sorteo = apps.get_model('sorteo', 'Sorteo')
+    Payment = apps.get_model('sorteo', 'Payment')
+    NumberBlock = apps.get_model('sorteo', 'NumberBlock')
+    expires_at = timezone.now() + timedelta(minutes=settings.PAYMENT_HOLD_MINUTES)
+    for sorteo in Sorteo.objects.only('pk', 'total_tickets', 'tickets_solds'):
+        free = sorteo.total_tickets - sorteo.tickets_solds
+        held, granted, released = 0, [], []
+        payments = Payment.objects.filter(sorteo=sorteo, state='E').order_by('created_at', 'pk')
+        for pk, quantity, numbers in payments.values_list('pk', 'tickets_quantity', 'chosen_numbers'):
+            if held + quantity <= free:
+                held += quantity
+                granted.append(pk)
+            else:
+                released.extend(numbers)
+        Payment.objects.filter(pk__in=granted).update(hold_expires_at=expires_at)
+        Sorteo.objects.filter(pk=sorteo.pk).update(tickets_held=held)
+
+        positions = {}
+        for number in released:
+            index, position = divmod(number - 1, BLOCK_SIZE)
+            positions.setdefault(index, []).append(position)
+        for block in NumberBlock.objects.filter(sorteo=sorteo, index__in=list(positions)):
+            bits = bytearray(block.held)
+            bitmaps.clear_bits(bits, positions[block.index])
+            NumberBlock.objects.filter(pk=block.pk).update(held=bytes(bits))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sorteo', '0015_number_blocks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='hold_expires_at',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, null=True, verbose_name='Vencimiento del apartado'),
+        ),
+        migrations.AddField(
+            model_name='sorteo',
+            name='tickets_held',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Tickets apartados'),
+        ),
+        migrations.RunPython(hold_pending_payments, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,19 @@
-from django.db import models
+from datetime import timedelta
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
 from phonenumber_field.modelfields import PhoneNumberField
 from django.core.exceptions import ValidationError
 from django.core.validators import MinLengthValidator
+from django.utils import timezone
 from django.utils.text import slugify
-import time
+from .caching import invalidate_home_cache
+from .search import build_search_text
+from .serials import generate_payment_serial, generate_serial_key, permute
+from . import bitmaps
 # Create your models here.
 class Sorteo(models.Model):
     ESTATE = [
@@ -12,6 +22,19 @@ class Sorteo(models.Model):
         ('F', 'FINALIZADO'),
         ('V', 'VENDIDO')
     ]
+    # Contadores, marcas de versión y resultado del sorteo: solo se modifican con UPDATE
+    # atómicos (ver reserve_tickets, hold_tickets y draw.run_draw).
+    COUNTER_FIELDS = (
+        'tickets_solds', 'tickets_held', 'serial_cursor', 'version', 'updated_at', 'draw_seed', 'drawn_at',
+        'draw_mode', 'draw_sold',
+    )
+    # Candidatos por consulta en take_serials: acota los parámetros del IN cuando
+    # quedan muy pocos números libres.
+    MAX_SERIAL_CANDIDATES = 5000
+    DRAW_MODES = [
+        ('R', 'Por posición'),
+        ('P', 'Números al azar'),
+    ]
 
     title = models.CharField(('Titulo'),max_length=50)
     slug = models.SlugField(unique=True, max_length=110, editable=False)
@@ -28,6 +51,8 @@ class Sorteo(models.Model):
     state = models.CharField(("Estado del sorteo"), choices=ESTATE, default='B', blank=False, max_length=150)
     total_tickets = models.PositiveIntegerField(("Máxima cantidad de tickets a vender"), blank=False, null=False)
     tickets_solds = models.PositiveIntegerField(("Tickets vendidos"), editable=False, default=0)
+    # Tickets de pagos en espera con apartado vigente (ver Payment.hold_expires_at).
+    tickets_held = models.PositiveIntegerField(("Tickets apartados"), editable=False, default=0)
     lottery_conditions = models.TextField(("Condiciones del sorteo"))
     minimun_tickets_buy = models.PositiveIntegerField(("Cantidad mínima de tickets a  comprar"), null=True, blank=True)
     video_promo = models.FileField(
@@ -37,11 +62,34 @@ class Sorteo(models.Model):
         blank=True,
         help_text="Sube un video promocional del sorteo"
     )
+    video_poster = models.ImageField(
+        ("Portada del video"),
+        upload_to='premios/posters/',
+        blank=True,
+        help_text="Imagen que se muestra antes de reproducir el video. Si se deja vacía, se extrae un cuadro del video."
+    )
     is_main = models.BooleanField(
         ("Sorteo Principal"),
         default=False,
         help_text="Marcar si este es el sorteo principal que se mostrará en la página de inicio. Solo uno puede ser principal."
     )
+    choose_numbers = models.BooleanField(
+        ("Permitir elegir números"),
+        default=False,
+        help_text="Los compradores pueden elegir sus números al pagar; los demás se asignan al azar."
+    )
+    # Estado del asignador de números: clave de la permutación y posición del cursor.
+    serial_key = models.BigIntegerField(("Clave de numeración"), default=generate_serial_key, editable=False)
+    serial_cursor = models.PositiveBigIntegerField(("Cursor de numeración"), default=0, editable=False)
+    # Sube con cada cambio visible del sorteo (datos, premios o tickets vendidos); invalida la caché.
+    version = models.PositiveIntegerField(("Versión"), default=0, editable=False)
+    updated_at = models.DateTimeField(("Ultima actualización"), default=timezone.now, editable=False)
+    # Semilla del sorteo de premios, para poder repetirlo y verificarlo (ver sorteo/draw.py).
+    draw_seed = models.CharField(("Semilla del sorteo"), max_length=64, blank=True, editable=False)
+    drawn_at = models.DateTimeField(("Fecha de realización"), null=True, blank=True, editable=False)
+    # Modo y tickets vendidos con que se sorteó: la verificación repite el mismo cálculo.
+    draw_mode = models.CharField(("Modo del sorteo"), max_length=1, choices=DRAW_MODES, blank=True, editable=False)
+    draw_sold = models.PositiveIntegerField(("Tickets vendidos al sortear"), null=True, blank=True, editable=False)
 
     class Meta:
         verbose_name = 'Sorteo'
@@ -50,12 +98,21 @@ class Sorteo(models.Model):
     def clean(self):
         """
         Validación para asegurar que se defina la fecha o el texto alternativo, pero no ambos.
+        La elección de números no se desactiva mientras haya pagos en espera con números
+        elegidos: al borrar el mapa, el azar podría repartir esos números a otros pagos.
         """
         super().clean()
         if self.date_lottery and self.date_lottery_text:
             raise ValidationError("No se puede definir una fecha específica y un texto alternativo al mismo tiempo. Por favor, elija solo una opción.")
         if not self.date_lottery and not self.date_lottery_text:
             raise ValidationError("Debe especificar una fecha para el sorteo o un texto alternativo (ej: 'Al alcanzar el 80%').")
+        if (
+            not self._state.adding and not self.choose_numbers
+            and Payment.objects.filter(sorteo_id=self.pk, state='E').exclude(chosen_numbers=[]).exists()
+        ):
+            raise ValidationError({
+                'choose_numbers': "Hay pagos en espera con números elegidos. Verifíquelos o cancélelos antes de desactivar la elección de números."
+            })
 
     @property
     def display_date(self):
@@ -66,14 +123,161 @@ class Sorteo(models.Model):
             return self.date_lottery.strftime("%d/%m/%Y")
         return self.date_lottery_text
     
+    @staticmethod
+    def bump_version():
+        """
+        Campos para un UPDATE que marque el sorteo como modificado. La versión y la
+        fecha alimentan la caché de la página de inicio, la ETag y Last-Modified.
+        """
+        return {'version': F('version') + 1, 'updated_at': timezone.now()}
+
     def percentage_sold(self):
         if self.total_tickets > 0:
             return (self.tickets_solds * 100) // self.total_tickets 
         return 0
 
+    def progress_data(self):
+        """
+        Avance de ventas que consultan la página de inicio y el stream de progreso.
+        """
+        return {
+            'slug': self.slug,
+            'state': self.state,
+            'total_tickets': self.total_tickets,
+            'tickets_solds': self.tickets_solds,
+            'percentage_sold': self.percentage_sold(),
+            'version': self.version,
+        }
+
+    def hold_tickets(self, quantity):
+        """
+        Aparta capacidad para los `quantity` tickets de un pago en espera. Un único
+        UPDATE condicional comprueba que los vendidos más los apartados no superen el
+        total, sin sumar los pagos en espera. Devuelve True si había capacidad.
+        """
+        return bool(Sorteo.objects.filter(
+            pk=self.pk, total_tickets__gte=F('tickets_solds') + F('tickets_held') + quantity
+        ).update(tickets_held=F('tickets_held') + quantity))
+
+    def reserve_tickets(self, quantity, held=0, serials=None):
+        """
+        Reserva capacidad para `quantity` tickets sin bloquear el sorteo durante la verificación.
+
+        Un único UPDATE condicional comprueba la capacidad, suma los tickets vendidos
+        y avanza el cursor de numeración, de modo que dos verificaciones simultáneas
+        nunca pueden sobrevender. `held` de esos tickets ya estaban apartados por sus
+        pagos: pasan de apartados a vendidos sin volver a pedir capacidad. Solo
+        `serials` de ellos (por omisión, todos) toman número del cursor; el resto son
+        números elegidos y no gastan posiciones.
+        Si se llama fuera de una transacción, el bloqueo de la fila dura solo ese
+        UPDATE y la lectura del cursor.
+        Devuelve la primera posición reservada del cursor, o None si no hay capacidad.
+        """
+        serials = quantity if serials is None else serials
+        with transaction.atomic():
+            updated = Sorteo.objects.filter(
+                pk=self.pk, total_tickets__gte=F('tickets_solds') + F('tickets_held') + (quantity - held)
+            ).update(
+                tickets_solds=F('tickets_solds') + quantity,
+                tickets_held=F('tickets_held') - held,
+                serial_cursor=F('serial_cursor') + serials,
+                **Sorteo.bump_version(),
+            )
+            if not updated:
+                return None
+            invalidate_home_cache()
+            self.tickets_solds, self.serial_cursor = Sorteo.objects.filter(pk=self.pk).values_list(
+                'tickets_solds', 'serial_cursor'
+            ).get()
+        return self.serial_cursor - serials
+
+    def release_tickets(self, quantity, held=0):
+        """
+        Devuelve al sorteo la capacidad reservada por una verificación que no llegó a
+        completarse. `held` de esos tickets vuelven a quedar apartados por sus pagos,
+        en lugar de quedar libres.
+        """
+        Sorteo.objects.filter(pk=self.pk).update(
+            tickets_solds=F('tickets_solds') - quantity,
+            tickets_held=F('tickets_held') + held,
+            **Sorteo.bump_version(),
+        )
+        invalidate_home_cache()
+
+    def recount_tickets(self):
+        """
+        Recalcula los contadores de capacidad: vendidos desde los tickets y apartados
+        desde los pagos en espera con apartado vigente.
+
+        reserve_tickets suma los vendidos en su propia transacción, antes de insertar
+        los tickets; si el proceso muere entre ambas, el contador queda inflado y nadie
+        lo corrige. Por la misma razón, esto solo debe correr sin verificaciones en curso
+        del sorteo (p. ej. con el worker detenido): una reserva que aún no insertó sus
+        tickets se perdería del contador.
+        """
+        with transaction.atomic():
+            Sorteo.objects.select_for_update().filter(pk=self.pk).get()
+            sold = Ticket.objects.filter(sorteo=self).count()
+            held = Payment.objects.filter(
+                sorteo=self, state='E', hold_expires_at__isnull=False
+            ).aggregate(total=Sum('tickets_quantity'))['total'] or 0
+            Sorteo.objects.filter(pk=self.pk).update(tickets_solds=sold, tickets_held=held, **Sorteo.bump_version())
+        invalidate_home_cache()
+        self.tickets_solds, self.tickets_held = sold, held
+
+    def take_serials(self, start, quantity, unavailable=()):
+        """
+        Convierte las posiciones reservadas del cursor en `quantity` números libres.
+
+        Cada número candidato sale de la permutación en O(1); la única consulta es una
+        búsqueda por índice de los candidatos, que descarta números ya ocupados
+        (tickets anteriores al asignador, números elegidos o posiciones que se repiten
+        cuando el cursor da la vuelta) y los de `unavailable` (números apartados en
+        pagos en espera). Si hace falta reemplazar candidatos ocupados, se reservan más
+        posiciones del cursor de forma atómica. Después de la vuelta solo queda libre
+        una fracción de las posiciones, así que se reservan tantas como hagan falta
+        para encontrar, en promedio, los números que faltan en una sola consulta.
+        """
+        serials = []
+        position, end = start, start + quantity
+        walked = 0
+        while True:
+            candidates = [
+                permute(cursor % self.total_tickets, self.total_tickets, self.serial_key) + 1
+                for cursor in range(position, end)
+            ]
+            walked += len(candidates)
+            taken = set(
+                Ticket.objects.filter(sorteo=self, serial__in=candidates).values_list('serial', flat=True)
+            )
+            free = [serial for serial in candidates if serial not in taken and serial not in unavailable]
+            serials.extend(free[:quantity - len(serials)])
+
+            missing = quantity - len(serials)
+            if not missing:
+                return serials
+            if walked >= self.total_tickets:
+                raise ValidationError("No hay suficientes números libres en este sorteo.")
+
+            batch = missing
+            if end >= self.total_tickets:
+                # Números sin ticket: los que el sorteo no vendió más los que aún nos faltan.
+                unsold = max(self.total_tickets - self.tickets_solds - len(unavailable) + missing, missing)
+                batch = min(
+                    -(-missing * self.total_tickets // unsold), self.total_tickets - walked, self.MAX_SERIAL_CANDIDATES
+                )
+            Sorteo.objects.filter(pk=self.pk).update(serial_cursor=F('serial_cursor') + batch)
+            end = Sorteo.objects.filter(pk=self.pk).values_list('serial_cursor', flat=True).get()
+            position = end - batch
+
     def save(self, *args, **kwargs):
         """
         Genera un slug único a partir del título si no existe.
+        Al editar un sorteo existente no se escriben los contadores, para no pisar con
+        valores viejos las ventas registradas mientras tanto, y se sube la versión.
+        Al activar o desactivar la elección de números se construye o se borra su mapa.
+        Las variantes de la foto del premio no se generan aquí sino con
+        `manage.py generate_image_variants`; mientras tanto se sirve el original.
         """
         if not self.slug:
             base_slug = slugify(self.title)
@@ -83,7 +287,21 @@ class Sorteo(models.Model):
                 slug = f"{base_slug}-{counter}"
                 counter += 1
             self.slug = slug
+        choose_numbers_was = None
+        if not self._state.adding:
+            choose_numbers_was = Sorteo.objects.filter(pk=self.pk).values_list('choose_numbers', flat=True).first()
+            if kwargs.get('update_fields') is None:
+                kwargs['update_fields'] = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key and field.name not in self.COUNTER_FIELDS
+                ]
         super().save(*args, **kwargs)
+        Sorteo.objects.filter(pk=self.pk).update(**Sorteo.bump_version())
+        if choose_numbers_was is not None and choose_numbers_was != self.choose_numbers:
+            if self.choose_numbers:
+                NumberBlock.rebuild(self.pk)
+            else:
+                NumberBlock.objects.filter(sorteo=self).delete()
 
     def __str__(self):
         return self.title
@@ -94,6 +312,10 @@ class Premio(models.Model):
     name = models.CharField("Nombre del premio", max_length=100)
     description = models.TextField("Descripción del premio")
     position = models.PositiveIntegerField("Orden", help_text="El orden en que se mostrará el premio (1, 2, 3...)")
+    winning_ticket = models.ForeignKey(
+        'Ticket', verbose_name="Ticket ganador", on_delete=models.SET_NULL,
+        null=True, blank=True, editable=False, related_name='premios_ganados',
+    )
 
     class Meta:
         verbose_name = 'Premio'
@@ -113,11 +335,59 @@ class Ticket(models.Model):
     sorteo = models.ForeignKey("sorteo.sorteo", verbose_name="Sorteo", on_delete=models.CASCADE, related_name='tickets', null=False, blank=False)
     payment = models.ForeignKey("sorteo.payment", verbose_name="Pago", on_delete=models.CASCADE, related_name='tickets', null=False, blank=False)
     created_at = models.DateTimeField(("Fecha de Creación"), auto_now_add=True, editable=False)
+    # Correo en minúsculas para buscar los tickets de un comprador por índice (verify_tickets).
+    owner_email_key = models.CharField(("Correo normalizado"), max_length=254, editable=False, default='')
 
     class Meta:
         verbose_name = 'Ticket'
         verbose_name_plural = 'Tickets'
-        unique_together = [['serial', 'sorteo']]
+        unique_together = [['sorteo', 'serial']]
+        indexes = [
+            models.Index(fields=['owner_ci', 'created_at'], name='sorteo_ticket_ci_idx'),
+            models.Index(fields=['owner_email_key', 'created_at'], name='sorteo_ticket_email_idx'),
+        ]
+
+    @staticmethod
+    def email_key(email):
+        return (email or '').strip().lower()
+
+    @staticmethod
+    def ci_key(ci):
+        # La cédula se guarda sin espacios y en mayúsculas, para buscarla por igualdad.
+        return (ci or '').strip().upper()
+
+    @classmethod
+    def owned_by(cls, query):
+        """
+        Tickets de un comprador buscado por correo o cédula, los más recientes primero.
+        Son dos igualdades sobre columnas normalizadas, cada una con su índice
+        (sorteo_ticket_email_idx y sorteo_ticket_ci_idx).
+        """
+        return cls.objects.filter(
+            Q(owner_email_key=cls.email_key(query)) | Q(owner_ci=cls.ci_key(query))
+        ).order_by('-created_at')
+
+    @classmethod
+    def for_payment(cls, payment, serial, sorteo):
+        """
+        Construye (sin guardar) el ticket `serial` de un pago, con las claves de búsqueda
+        ya calculadas; bulk_create no pasa por save().
+        """
+        return cls(
+            serial=serial,
+            owner_name=payment.owner_name,
+            owner_ci=cls.ci_key(payment.owner_ci),
+            owner_email=payment.owner_email,
+            owner_email_key=cls.email_key(payment.owner_email),
+            owner_phone=payment.owner_phone,
+            sorteo=sorteo,
+            payment=payment
+        )
+
+    def save(self, *args, **kwargs):
+        self.owner_ci = self.ci_key(self.owner_ci)
+        self.owner_email_key = self.email_key(self.owner_email)
+        super().save(*args, **kwargs)
 
 class Payment(models.Model):
     #TODO signal para el update_at
@@ -134,6 +404,9 @@ class Payment(models.Model):
         ('C', 'Cancelado')
     ]
 
+    # Orden de los estados en la lista de pagos: 'En Espera' primero.
+    STATE_ORDER = {'E': 1, 'V': 2, 'C': 3}
+
     CI_TYPE_CHOICES = [
         ('V', 'Venezolano'),
         ('E', 'Extranjero'),
@@ -166,29 +439,630 @@ class Payment(models.Model):
         ('0191', 'BNC Banco Nacional de Crédito'),
     ]
     owner_name = models.CharField(("Nombre del propietario"), max_length=50)
-    owner_ci = models.CharField(('Cedula del propietario'),max_length=10, validators=[MinLengthValidator(6)])
-    owner_email = models.EmailField(("Correo del propietario"), max_length=254)
+    owner_ci = models.CharField(('Cedula del propietario'),max_length=10, validators=[MinLengthValidator(6)], db_index=True)
+    owner_email = models.EmailField(("Correo del propietario"), max_length=254, db_index=True)
     owner_phone = PhoneNumberField(verbose_name='Telefono del propietario', region='VE')
     method = models.CharField(("Método de Pago"), max_length=50, choices=PAYMENT_METHODS)
+    # Única por banco (ver sorteo_payment_reference_unique), que también sirve de índice para buscarla.
     reference = models.CharField(('Referencia'),max_length=30)
     state = models.CharField(("Estado"), max_length=50, choices=PAYMENT_STATES)
+    state_order = models.PositiveSmallIntegerField(("Orden del estado"), default=4, editable=False)
     created_at = models.DateTimeField(("Fecha de creación"), auto_now_add=True, editable=False)
     updated_at = models.DateTimeField(("Ultima actualización"), auto_now=False, null=True, editable=False)
     tickets_quantity = models.PositiveBigIntegerField()
-    serial = models.CharField(("Serial de la transacción"), max_length=50, editable=False, blank=True)
+    serial = models.CharField(("Serial de la transacción"), max_length=50, editable=False, blank=True, unique=True)
     sorteo = models.ForeignKey('Sorteo', on_delete=models.CASCADE, related_name='pagos')
     transferred_amount = models.DecimalField(("Monto transferido"), max_digits=10, decimal_places=2)
     transferred_date = models.DateField(("Fecha de transferencia"), auto_now=False, auto_now_add=False)
     type_CI = models.CharField(("Tipo de cédula"), max_length=1, choices=CI_TYPE_CHOICES, default='V')
     bank_of_transfer = models.CharField(("Banco de transferencia"), max_length=4, choices=BANK_CHOICES)
+    # Números elegidos por el comprador en sorteos con elección de números; apartados
+    # en el mapa del sorteo (NumberBlock) mientras el pago está en espera.
+    chosen_numbers = models.JSONField(("Números elegidos"), default=list, blank=True, editable=False)
+    # Mientras no sea nulo, el pago tiene apartada su capacidad en el sorteo (y sus
+    # números elegidos); `manage.py release_expired_holds` los libera al vencer.
+    hold_expires_at = models.DateTimeField(("Vencimiento del apartado"), null=True, blank=True, editable=False, db_index=True)
+    # Campos buscables normalizados; en MySQL tiene un índice FULLTEXT (ver sorteo/search.py).
+    search_text = models.TextField(("Texto de búsqueda"), blank=True, default='', editable=False)
     class Meta:
         verbose_name = 'Pago'
         verbose_name_plural = 'Pagos'
+        indexes = [
+            # Orden de payment_list y cursor de su paginación.
+            models.Index(fields=['state_order', '-created_at', '-id'], name='sorteo_payment_list_idx'),
+        ]
+        constraints = [
+            # Una transferencia solo puede respaldar un pago. La comprueba el INSERT mismo,
+            # así que dos envíos simultáneos de la misma referencia no pueden pasar ambos.
+            models.UniqueConstraint(fields=['reference', 'bank_of_transfer'], name='sorteo_payment_reference_unique'),
+        ]
+
+    DUPLICATE_REFERENCE_MESSAGE = 'Este número de referencia ya ha sido registrado en otro pago.'
+    SOLD_OUT_MESSAGE = 'No quedan suficientes boletos disponibles para esta compra.'
+
+    def validate_constraints(self, exclude=None):
+        """
+        No consulta de antemano la unicidad de la referencia: esa la detecta save() al
+        fallar el INSERT, que es la única comprobación correcta con envíos simultáneos.
+        """
+        super().validate_constraints(exclude={*(exclude or ()), 'reference'})
+
+    def _check_duplicate_reference(self):
+        """
+        Tras un IntegrityError, convierte el choque con la referencia de otro pago en un
+        ValidationError del campo; cualquier otra violación se deja propagar.
+        """
+        duplicated = Payment.objects.filter(
+            reference=self.reference, bank_of_transfer=self.bank_of_transfer
+        ).exclude(pk=self.pk).exists()
+        if duplicated:
+            raise ValidationError({
+                'reference': ValidationError(self.DUPLICATE_REFERENCE_MESSAGE, code='duplicate_reference'),
+            })
 
     def save(self, *args, **kwargs):
-        
         if not self.serial:
-            self.serial = f"REF-{self.owner_ci[:4]}-{int(time.time())}"
+            self.serial = generate_payment_serial()
+        self.state_order = self.STATE_ORDER.get(self.state, 4)
+        self.search_text = build_search_text(
+            self.owner_name, self.owner_ci, self.owner_email, self.reference, self.serial
+        )
 
-        super().save(*args, **kwargs)
-        
+        adding = self._state.adding
+        if adding and self.state == 'E':
+            self.hold_expires_at = timezone.now() + timedelta(minutes=settings.PAYMENT_HOLD_MINUTES)
+        try:
+            # Un pago nuevo suma en las estadísticas de su sorteo en la misma transacción.
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                if adding:
+                    # Los números y la capacidad se apartan en la misma transacción: si
+                    # otro pago los tomó primero, el pago no se registra.
+                    if self.chosen_numbers:
+                        NumberBlock.hold(self.sorteo, self.chosen_numbers)
+                    if self.hold_expires_at and not self.sorteo.hold_tickets(self.tickets_quantity):
+                        raise ValidationError(self.SOLD_OUT_MESSAGE, code='sold_out')
+                    SorteoStats.record(self.sorteo_id, None, self.state, 1, self.transferred_amount)
+                    SalesBucket.record(
+                        self.sorteo_id, self.created_at, self.method, self.bank_of_transfer,
+                        'E', 1, self.transferred_amount,
+                    )
+        except IntegrityError:
+            self._check_duplicate_reference()
+            raise
+
+    def cancel(self):
+        """
+        Cancela el pago si sigue en espera y libera su apartado, si aún lo tenía. Los
+        UPDATE condicionales evitan cancelar un pago que otro operador verificó
+        mientras tanto y liberar dos veces el mismo apartado. Devuelve True si se canceló.
+        """
+        now = timezone.now()
+        changes = {'state': 'C', 'state_order': self.STATE_ORDER['C'], 'updated_at': now, 'hold_expires_at': None}
+        with transaction.atomic():
+            held = Payment.objects.filter(pk=self.pk, state='E', hold_expires_at__isnull=False).update(**changes)
+            updated = held or Payment.objects.filter(pk=self.pk, state='E').update(**changes)
+            if updated:
+                if held:
+                    Payment.return_holds([(self.sorteo_id, self.tickets_quantity, self.chosen_numbers)])
+                SorteoStats.record(self.sorteo_id, 'E', 'C', 1, self.transferred_amount)
+                SalesBucket.record(
+                    self.sorteo_id, now, self.method, self.bank_of_transfer, 'C', 1, self.transferred_amount
+                )
+        if updated:
+            self.state = 'C'
+            self.hold_expires_at = None
+        return bool(updated)
+
+    @staticmethod
+    def return_holds(holds):
+        """
+        Devuelve a sus sorteos la capacidad y los números apartados de una lista de
+        (sorteo, cantidad de tickets, números elegidos). Quien llama ya quitó el
+        apartado de los pagos, en la misma transacción.
+        """
+        holds = sorted(holds, key=itemgetter(0))
+        for sorteo_id, group in groupby(holds, key=itemgetter(0)):
+            group = list(group)
+            chosen = [number for _, _, numbers in group for number in numbers]
+            if chosen:
+                NumberBlock.release(sorteo_id, chosen)
+            Sorteo.objects.filter(pk=sorteo_id).update(
+                tickets_held=F('tickets_held') - sum(quantity for _, quantity, _ in group)
+            )
+
+    @classmethod
+    def take_holds(cls, payments):
+        """
+        Quita el apartado a los pagos en espera que lo tienen, para que la verificación
+        convierta esa capacidad en tickets vendidos (ver Sorteo.reserve_tickets).
+        Devuelve {id del pago: vencimiento del apartado}; ningún otro proceso puede
+        tomar el mismo apartado.
+        """
+        with transaction.atomic():
+            held = dict(
+                cls.objects.select_for_update()
+                .filter(pk__in=[payment.pk for payment in payments], state='E', hold_expires_at__isnull=False)
+                .values_list('pk', 'hold_expires_at')
+            )
+            cls.objects.filter(pk__in=held).update(hold_expires_at=None)
+        return held
+
+    @classmethod
+    def restore_holds(cls, holds):
+        """
+        Devuelve el apartado, con su vencimiento original, a los pagos de `holds` (como
+        los devolvió take_holds) que siguen en espera, cuando la verificación que los
+        tomó no se completó. Quien llama devuelve la capacidad apartada al sorteo; los
+        números elegidos siguen apartados. Devuelve los IDs de los pagos restaurados.
+        """
+        with transaction.atomic():
+            restored = set(
+                cls.objects.select_for_update()
+                .filter(pk__in=holds, state='E', hold_expires_at__isnull=True)
+                .values_list('pk', flat=True)
+            )
+            if restored:
+                cls.objects.filter(pk__in=restored).update(hold_expires_at=Case(
+                    *[When(pk=pk, then=Value(holds[pk])) for pk in restored],
+                    output_field=models.DateTimeField(),
+                ))
+        return restored
+
+    @classmethod
+    def release_expired_holds(cls, limit=1000):
+        """
+        Libera hasta `limit` apartados vencidos. Los pagos siguen en espera y se pueden
+        verificar si al hacerlo queda capacidad. Usa SKIP LOCKED para no esperar por
+        pagos que se están verificando o cancelando. Devuelve cuántos liberó.
+        """
+        with transaction.atomic():
+            expired = list(
+                cls.objects.select_for_update(skip_locked=True)
+                .filter(state='E', hold_expires_at__lte=timezone.now())
+                .values_list('pk', 'sorteo_id', 'tickets_quantity', 'chosen_numbers')[:limit]
+            )
+            cls.objects.filter(pk__in=[pk for pk, *_ in expired]).update(hold_expires_at=None)
+            cls.return_holds([hold for _, *hold in expired])
+        return len(expired)
+
+
+class SorteoStats(models.Model):
+    """
+    Totales de pagos de un sorteo, mantenidos con UPDATE incrementales en la misma
+    transacción que cada cambio de estado de un pago, para leerlos sin recorrer los
+    pagos. `manage.py rebuild_sorteo_stats` los recalcula desde cero.
+    """
+    # Prefijo de los campos de cada estado de pago.
+    STATE_FIELDS = {'E': 'pending', 'V': 'verified', 'C': 'cancelled'}
+
+    sorteo = models.OneToOneField(Sorteo, on_delete=models.CASCADE, primary_key=True, related_name='stats', verbose_name="Sorteo")
+    pending_count = models.PositiveIntegerField(("Pagos en espera"), default=0)
+    pending_amount = models.DecimalField(("Monto en espera"), max_digits=14, decimal_places=2, default=0)
+    verified_count = models.PositiveIntegerField(("Pagos verificados"), default=0)
+    verified_amount = models.DecimalField(("Monto verificado"), max_digits=14, decimal_places=2, default=0)
+    verified_tickets = models.PositiveIntegerField(("Tickets verificados"), default=0)
+    cancelled_count = models.PositiveIntegerField(("Pagos cancelados"), default=0)
+    cancelled_amount = models.DecimalField(("Monto cancelado"), max_digits=14, decimal_places=2, default=0)
+    unique_buyers = models.PositiveIntegerField(("Compradores únicos"), default=0)
+    updated_at = models.DateTimeField(("Ultima actualización"), default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Estadísticas del sorteo'
+        verbose_name_plural = 'Estadísticas de los sorteos'
+
+    @classmethod
+    def record(cls, sorteo_id, old_state, new_state, count, amount, tickets=0, new_buyers=0):
+        """
+        Mueve `count` pagos por `amount` en total de `old_state` a `new_state` (None para
+        un pago nuevo). Al verificar también suma los tickets y los compradores nuevos.
+        Debe llamarse dentro de la transacción que cambia los pagos.
+        """
+        deltas = {}
+        for state, sign in ((old_state, -1), (new_state, 1)):
+            prefix = cls.STATE_FIELDS.get(state)
+            if prefix:
+                deltas[f'{prefix}_count'] = deltas.get(f'{prefix}_count', 0) + sign * count
+                deltas[f'{prefix}_amount'] = deltas.get(f'{prefix}_amount', 0) + sign * amount
+        if new_state == 'V':
+            deltas['verified_tickets'] = tickets
+            deltas['unique_buyers'] = new_buyers
+
+        changes = {field: F(field) + delta for field, delta in deltas.items() if delta}
+        if not changes:
+            return
+        changes['updated_at'] = timezone.now()
+        if not cls.objects.filter(sorteo_id=sorteo_id).update(**changes):
+            # Primer movimiento del sorteo: se crea la fila y se aplica el cambio.
+            cls.objects.get_or_create(sorteo_id=sorteo_id)
+            cls.objects.filter(sorteo_id=sorteo_id).update(**changes)
+
+    @classmethod
+    def rebuild(cls, sorteo_id):
+        """
+        Recalcula las estadísticas de un sorteo a partir de sus pagos.
+
+        La fila se bloquea antes de agregar: los cambios confirmados antes ya están en
+        el agregado y los que estén en curso aplican su incremento al terminar, así que
+        no se pierde ninguno.
+        """
+        verified = Q(state='V')
+        with transaction.atomic():
+            stats, _ = cls.objects.get_or_create(sorteo_id=sorteo_id)
+            cls.objects.select_for_update().filter(pk=stats.pk).get()
+            totals = Payment.objects.filter(sorteo_id=sorteo_id).aggregate(
+                pending_count=Count('pk', filter=Q(state='E')),
+                pending_amount=Sum('transferred_amount', filter=Q(state='E')),
+                verified_count=Count('pk', filter=verified),
+                verified_amount=Sum('transferred_amount', filter=verified),
+                verified_tickets=Sum('tickets_quantity', filter=verified),
+                cancelled_count=Count('pk', filter=Q(state='C')),
+                cancelled_amount=Sum('transferred_amount', filter=Q(state='C')),
+                unique_buyers=Count('owner_ci', filter=verified, distinct=True),
+            )
+            cls.objects.filter(pk=stats.pk).update(
+                updated_at=timezone.now(), **{field: value or 0 for field, value in totals.items()}
+            )
+
+    def __str__(self):
+        return f"Estadísticas de {self.sorteo_id}"
+
+
+class SalesBucket(models.Model):
+    """
+    Ventas de un sorteo agregadas por hora o por día, método de pago y banco.
+    Se actualizan con cada cambio de estado de un pago, igual que SorteoStats, para que
+    los gráficos lean unas pocas filas en lugar de agrupar los pagos.
+    `manage.py rebuild_sales_buckets` las recalcula desde cero.
+    """
+    GRANULARITIES = [
+        ('H', 'Hora'),
+        ('D', 'Día'),
+    ]
+    # Campos de cada estado de pago; los pagos registrados se cuentan al crearse.
+    STATE_FIELDS = {'E': 'registered', 'V': 'verified', 'C': 'cancelled'}
+
+    sorteo = models.ForeignKey(Sorteo, on_delete=models.CASCADE, related_name='sales_buckets', verbose_name="Sorteo")
+    granularity = models.CharField(("Granularidad"), max_length=1, choices=GRANULARITIES)
+    start = models.DateTimeField(("Inicio del intervalo"))
+    method = models.CharField(("Método de Pago"), max_length=50)
+    bank_of_transfer = models.CharField(("Banco de transferencia"), max_length=4)
+    registered_count = models.PositiveIntegerField(("Pagos registrados"), default=0)
+    registered_amount = models.DecimalField(("Monto registrado"), max_digits=14, decimal_places=2, default=0)
+    verified_count = models.PositiveIntegerField(("Pagos verificados"), default=0)
+    verified_amount = models.DecimalField(("Monto verificado"), max_digits=14, decimal_places=2, default=0)
+    verified_tickets = models.PositiveIntegerField(("Tickets verificados"), default=0)
+    cancelled_count = models.PositiveIntegerField(("Pagos cancelados"), default=0)
+    cancelled_amount = models.DecimalField(("Monto cancelado"), max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = 'Ventas por intervalo'
+        verbose_name_plural = 'Ventas por intervalo'
+        constraints = [
+            # También sirve las consultas por rango de fechas de un sorteo.
+            models.UniqueConstraint(
+                fields=['sorteo', 'granularity', 'start', 'method', 'bank_of_transfer'],
+                name='sorteo_salesbucket_unique',
+            ),
+        ]
+
+    @staticmethod
+    def bucket_starts(moment):
+        """
+        Inicio de la hora y del día (en la zona horaria del sitio) que contienen `moment`.
+        """
+        hour = timezone.localtime(moment).replace(minute=0, second=0, microsecond=0)
+        return {'H': hour, 'D': hour.replace(hour=0)}
+
+    @classmethod
+    def record(cls, sorteo_id, moment, method, bank, state, count, amount, tickets=0):
+        """
+        Suma `count` pagos por `amount` al estado `state` en la hora y el día de `moment`.
+        Debe llamarse dentro de la transacción que cambia los pagos, después de
+        SorteoStats.record (rebuild se apoya en ese orden de bloqueo).
+        """
+        prefix = cls.STATE_FIELDS[state]
+        changes = {
+            f'{prefix}_count': F(f'{prefix}_count') + count,
+            f'{prefix}_amount': F(f'{prefix}_amount') + amount,
+        }
+        if state == 'V':
+            changes['verified_tickets'] = F('verified_tickets') + tickets
+
+        for granularity, start in cls.bucket_starts(moment).items():
+            lookup = {
+                'sorteo_id': sorteo_id, 'granularity': granularity, 'start': start,
+                'method': method, 'bank_of_transfer': bank,
+            }
+            if not cls.objects.filter(**lookup).update(**changes):
+                cls.objects.get_or_create(**lookup)
+                cls.objects.filter(**lookup).update(**changes)
+
+    @classmethod
+    def rebuild(cls, sorteo_id):
+        """
+        Recalcula los intervalos de un sorteo a partir de sus pagos. Los pagos se
+        cuentan como registrados en su fecha de creación y como verificados o
+        cancelados en su última actualización.
+
+        Bloquea la fila de SorteoStats del sorteo, que cada cambio de estado actualiza
+        antes que los intervalos, para no perder los cambios en curso.
+        """
+        with transaction.atomic():
+            stats, _ = SorteoStats.objects.get_or_create(sorteo_id=sorteo_id)
+            SorteoStats.objects.select_for_update().filter(pk=stats.pk).get()
+            cls.objects.filter(sorteo_id=sorteo_id).delete()
+
+            buckets = {}
+            payments = Payment.objects.filter(sorteo_id=sorteo_id).values_list(
+                'created_at', 'updated_at', 'state', 'method', 'bank_of_transfer',
+                'transferred_amount', 'tickets_quantity',
+            )
+            for created_at, updated_at, state, method, bank, amount, tickets in payments.iterator():
+                events = [('E', created_at)]
+                if state in ('V', 'C'):
+                    events.append((state, updated_at or created_at))
+                for event_state, moment in events:
+                    prefix = cls.STATE_FIELDS[event_state]
+                    for granularity, start in cls.bucket_starts(moment).items():
+                        bucket = buckets.setdefault((granularity, start, method, bank), cls(
+                            sorteo_id=sorteo_id, granularity=granularity, start=start,
+                            method=method, bank_of_transfer=bank,
+                        ))
+                        setattr(bucket, f'{prefix}_count', getattr(bucket, f'{prefix}_count') + 1)
+                        setattr(bucket, f'{prefix}_amount', getattr(bucket, f'{prefix}_amount') + amount)
+                        if event_state == 'V':
+                            bucket.verified_tickets += tickets
+            cls.objects.bulk_create(buckets.values(), batch_size=1000)
+
+    def __str__(self):
+        return f"{self.sorteo_id} {self.get_granularity_display()} {self.start:%Y-%m-%d %H:%M}"
+
+
+
+def empty_number_block():
+    return bytes(NumberBlock.BLOCK_SIZE // 8)
+
+
+class NumberBlock(models.Model):
+    """
+    Mapa de bits de los números vendidos y apartados de un sorteo con elección de
+    números, en bloques de BLOCK_SIZE números (1 KB por mapa). El número `n` está en el
+    bit `(n - 1) % BLOCK_SIZE` del bloque `(n - 1) // BLOCK_SIZE`.
+
+    Solo se mantiene en los sorteos con `choose_numbers`. Los cambios se hacen con la
+    fila del bloque bloqueada, en la misma transacción que crea el pago o los tickets;
+    el índice único de Ticket sigue siendo la última garantía contra números repetidos.
+    `manage.py rebuild_number_blocks` los recalcula desde cero.
+    """
+    BLOCK_SIZE = 8192
+
+    sorteo = models.ForeignKey(Sorteo, on_delete=models.CASCADE, related_name='number_blocks', verbose_name="Sorteo")
+    index = models.PositiveIntegerField(("Bloque"))
+    sold = models.BinaryField(("Números vendidos"), default=empty_number_block)
+    held = models.BinaryField(("Números apartados"), default=empty_number_block)
+
+    class Meta:
+        verbose_name = 'Bloque de números'
+        verbose_name_plural = 'Bloques de números'
+        constraints = [
+            models.UniqueConstraint(fields=['sorteo', 'index'], name='sorteo_numberblock_unique'),
+        ]
+
+    @classmethod
+    def _split(cls, numbers):
+        """
+        Agrupa los números por bloque: {bloque: [posiciones dentro del bloque]}.
+        """
+        positions = {}
+        for number in numbers:
+            index, position = divmod(number - 1, cls.BLOCK_SIZE)
+            positions.setdefault(index, []).append(position)
+        return positions
+
+    @classmethod
+    def _lock(cls, sorteo_id, indexes=None, create=True):
+        """
+        Bloquea los bloques indicados (todos los del sorteo si `indexes` es None),
+        creándolos si hace falta. Devuelve {índice: bloque} con los mapas como bytearray.
+
+        Los bloques existentes se bloquean primero, en orden de índice; los que faltan
+        se insertan después, para no pedir un INSERT sobre filas que ya existen (en
+        MySQL toma un bloqueo compartido que luego choca con el FOR UPDATE de otro).
+        """
+        blocks = cls.objects.select_for_update().filter(sorteo_id=sorteo_id).order_by('index')
+        locked = {block.index: block for block in (blocks if indexes is None else blocks.filter(index__in=indexes))}
+        missing = sorted(set(indexes or ()) - set(locked)) if create else []
+        if missing:
+            cls.objects.bulk_create(
+                [cls(sorteo_id=sorteo_id, index=index) for index in missing], ignore_conflicts=True
+            )
+            locked.update((block.index, block) for block in blocks.filter(index__in=missing))
+        for block in locked.values():
+            block.sold, block.held = bytearray(block.sold), bytearray(block.held)
+        return locked
+
+    @classmethod
+    def lock_all(cls, sorteo_id):
+        """
+        Bloquea todo el mapa del sorteo, para asignar números al azar sin que se
+        aparten mientras tanto. Debe llamarse dentro de una transacción.
+        """
+        return cls._lock(sorteo_id)
+
+    @classmethod
+    def is_taken(cls, blocks, number):
+        """
+        Si `number` está vendido o apartado según los bloques bloqueados con _lock o lock_all.
+        """
+        index, position = divmod(number - 1, cls.BLOCK_SIZE)
+        block = blocks.get(index)
+        return block is not None and (bitmaps.is_set(block.sold, position) or bitmaps.is_set(block.held, position))
+
+    @classmethod
+    def hold(cls, sorteo, numbers):
+        """
+        Aparta los números elegidos en un pago. Lanza ValidationError si alguno está
+        fuera del sorteo, vendido o apartado por otro pago. Debe llamarse dentro de la
+        transacción que crea el pago.
+        """
+        out_of_range = sorted(number for number in numbers if not 1 <= number <= sorteo.total_tickets)
+        if out_of_range:
+            raise ValidationError(
+                {'chosen_numbers': f"Estos números no existen en el sorteo: {', '.join(map(str, out_of_range))}."},
+                code='invalid_number',
+            )
+        positions = cls._split(numbers)
+        blocks = cls._lock(sorteo.pk, sorted(positions))
+        taken = sorted(number for number in numbers if cls.is_taken(blocks, number))
+        if taken:
+            raise ValidationError(
+                {'chosen_numbers': f"Estos números ya no están disponibles: {', '.join(map(str, taken))}."},
+                code='number_taken',
+            )
+        for index, block_positions in positions.items():
+            bitmaps.set_bits(blocks[index].held, block_positions)
+            cls.objects.filter(pk=blocks[index].pk).update(held=bytes(blocks[index].held))
+
+    @classmethod
+    def release(cls, sorteo_id, numbers):
+        """
+        Libera los números apartados por un pago cancelado o con el apartado vencido.
+        """
+        positions = cls._split(numbers)
+        # Sin bloque no hay nada apartado (p. ej. el sorteo dejó de permitir elegir números).
+        blocks = cls._lock(sorteo_id, sorted(positions), create=False)
+        for index, block_positions in positions.items():
+            if index not in blocks:
+                continue
+            bitmaps.clear_bits(blocks[index].held, block_positions)
+            cls.objects.filter(pk=blocks[index].pk).update(held=bytes(blocks[index].held))
+
+    @classmethod
+    def held_numbers(cls, blocks):
+        """
+        Números apartados en los bloques devueltos por lock_all.
+        """
+        held = set()
+        for index, block in blocks.items():
+            bits = bitmaps.as_int(block.held)
+            while bits:
+                lowest = bits & -bits
+                held.add(index * cls.BLOCK_SIZE + lowest.bit_length())
+                bits ^= lowest
+        return held
+
+    @classmethod
+    def sell(cls, sorteo_id, numbers):
+        """
+        Marca como vendidos los números de los tickets creados y deja de apartarlos.
+        Debe llamarse en la transacción que crea los tickets.
+        """
+        positions = cls._split(numbers)
+        blocks = cls._lock(sorteo_id, sorted(positions))
+        for index, block_positions in positions.items():
+            block = blocks[index]
+            bitmaps.set_bits(block.sold, block_positions)
+            bitmaps.clear_bits(block.held, block_positions)
+            cls.objects.filter(pk=block.pk).update(sold=bytes(block.sold), held=bytes(block.held))
+
+    @classmethod
+    def free_numbers(cls, sorteo, start, end, limit):
+        """
+        Números libres entre `start` y `end` inclusive (recortados al sorteo): devuelve
+        hasta `limit` de ellos y cuántos hay en total. Lee solo los bloques del rango.
+        """
+        start, end = max(start, 1), min(end, sorteo.total_tickets)
+        if start > end:
+            return [], 0
+        first, last = (start - 1) // cls.BLOCK_SIZE, (end - 1) // cls.BLOCK_SIZE
+        stored = {
+            index: (sold, held) for index, sold, held in cls.objects.filter(
+                sorteo=sorteo, index__gte=first, index__lte=last
+            ).values_list('index', 'sold', 'held')
+        }
+        empty = bitmaps.empty(cls.BLOCK_SIZE)
+        numbers, count = [], 0
+        for index in range(first, last + 1):
+            sold, held = stored.get(index, (empty, empty))
+            offset = index * cls.BLOCK_SIZE
+            positions, block_count = bitmaps.free_positions(
+                sold, held, max(start - 1 - offset, 0), min(end - 1 - offset, cls.BLOCK_SIZE - 1),
+                limit - len(numbers),
+            )
+            numbers.extend(offset + position + 1 for position in positions)
+            count += block_count
+        return numbers, count
+
+    @classmethod
+    def rebuild(cls, sorteo_id):
+        """
+        Recalcula el mapa de un sorteo a partir de sus tickets y de los números
+        elegidos en sus pagos en espera con apartado vigente. Bloquea los bloques
+        existentes mientras tanto.
+        """
+        with transaction.atomic():
+            cls._lock(sorteo_id)
+            cls.objects.filter(sorteo_id=sorteo_id).delete()
+            blocks = {}
+
+            def block(index):
+                return blocks.setdefault(index, cls(
+                    sorteo_id=sorteo_id, index=index,
+                    sold=bitmaps.empty(cls.BLOCK_SIZE), held=bitmaps.empty(cls.BLOCK_SIZE),
+                ))
+
+            serials = Ticket.objects.filter(sorteo_id=sorteo_id).values_list('serial', flat=True)
+            for index, positions in cls._split(serials.iterator()).items():
+                bitmaps.set_bits(block(index).sold, positions)
+            pending = Payment.objects.filter(
+                sorteo_id=sorteo_id, state='E', hold_expires_at__isnull=False
+            ).values_list('chosen_numbers', flat=True)
+            chosen = [number for numbers in pending.iterator() for number in numbers]
+            for index, positions in cls._split(chosen).items():
+                bitmaps.set_bits(block(index).held, positions)
+            for item in blocks.values():
+                item.sold, item.held = bytes(item.sold), bytes(item.held)
+            cls.objects.bulk_create(blocks.values(), batch_size=100)
+
+    def __str__(self):
+        return f"{self.sorteo_id} bloque {self.index}"
+
+
+class VerificationJob(models.Model):
+    """
+    Verificación de un pago encolada para que la procese el comando `process_verifications`
+    fuera del ciclo de la petición HTTP.
+    """
+    JOB_STATES = [
+        ('P', 'Pendiente'),
+        ('R', 'En proceso'),
+        ('D', 'Completado'),
+        ('F', 'Fallido'),
+    ]
+    ACTIVE_STATES = ['P', 'R']
+
+    payment = models.ForeignKey(Payment, verbose_name="Pago", on_delete=models.CASCADE, related_name='verification_jobs')
+    state = models.CharField(("Estado"), max_length=1, choices=JOB_STATES, default='P')
+    attempts = models.PositiveSmallIntegerField(("Intentos"), default=0)
+    message = models.CharField(("Mensaje"), max_length=255, blank=True)
+    run_after = models.DateTimeField(("Ejecutar a partir de"), default=timezone.now)
+    started_at = models.DateTimeField(("Inicio del último intento"), null=True, blank=True)
+    created_at = models.DateTimeField(("Fecha de creación"), auto_now_add=True, editable=False)
+    updated_at = models.DateTimeField(("Ultima actualización"), auto_now=True)
+
+    class Meta:
+        verbose_name = 'Verificación en cola'
+        verbose_name_plural = 'Verificaciones en cola'
+        indexes = [models.Index(fields=['state', 'run_after'], name='sorteo_job_state_run_idx')]
+
+    @classmethod
+    def enqueue(cls, payment):
+        """
+        Encola la verificación del pago, reutilizando el trabajo activo si ya existe uno.
+        """
+        job = cls.objects.filter(payment=payment, state__in=cls.ACTIVE_STATES).first()
+        return job or cls.objects.create(payment=payment)
+
+    def __str__(self):
+        return f"Verificación del pago {self.payment_id} ({self.get_state_display()})"
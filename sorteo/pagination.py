@@ -0,0 +1,142 @@
+"""
+Paginación por cursor (keyset) para listados grandes.
+
+En lugar de COUNT(*) + OFFSET, cada página se pide "después" o "antes" de la última
+fila vista, filtrando por las columnas del orden. Con un índice sobre esas columnas,
+la página 1000 cuesta lo mismo que la primera.
+"""
+import base64
+import datetime
+import json
+import uuid
+from decimal import Decimal
+
+from django.db import connection
+from django.db.models import Q
+
+
+class KeysetPage:
+    """
+    Página de resultados con los cursores para moverse a la siguiente y a la anterior.
+    """
+
+    def __init__(self, object_list, next_cursor, previous_cursor, approximate_total=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.approximate_total = approximate_total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _json_value(value):
+    # isoformat() conserva los microsegundos. DjangoJSONEncoder los recorta a
+    # milisegundos y el cursor saltaría o repetiría filas creadas en el mismo milisegundo.
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (Decimal, uuid.UUID)):
+        return str(value)
+    raise TypeError(f"No se puede poner {type(value).__name__} en un cursor.")
+
+
+def _encode(values):
+    raw = json.dumps(values, default=_json_value).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _decode(cursor, model, fields):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if len(values) != len(fields):
+            return None
+        return [model._meta.get_field(name).to_python(value) for (name, _), value in zip(fields, values)]
+    except Exception:
+        # Un cursor manipulado o viejo simplemente vuelve a la primera página.
+        return None
+
+
+def _after(fields, values):
+    """
+    Condición lexicográfica "viene después de `values`" según el orden `fields`.
+    """
+    condition = Q()
+    for index, (name, descending) in enumerate(fields):
+        step = Q(**{f"{name}__{'lt' if descending else 'gt'}": values[index]})
+        for previous_index in range(index):
+            step &= Q(**{fields[previous_index][0]: values[previous_index]})
+        condition |= step
+    return condition
+
+
+def _ordering(fields):
+    return [f"-{name}" if descending else name for name, descending in fields]
+
+
+def keyset_paginate(queryset, fields, after=None, before=None, per_page=20, approximate_total=None):
+    """
+    Devuelve una KeysetPage de `queryset` ordenado por `fields`, una lista de
+    (nombre_de_campo, descendente). El último campo debe ser único (por ejemplo el id)
+    para que el orden sea total.
+    """
+    model = queryset.model
+    reverse_fields = [(name, not descending) for name, descending in fields]
+
+    after_values = _decode(after, model, fields) if after else None
+    before_values = _decode(before, model, fields) if before else None
+
+    if before_values is not None:
+        rows = list(
+            queryset.filter(_after(reverse_fields, before_values)).order_by(*_ordering(reverse_fields))[:per_page + 1]
+        )
+        has_more_before = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        has_more_after = True
+    else:
+        if after_values is not None:
+            queryset = queryset.filter(_after(fields, after_values))
+        rows = list(queryset.order_by(*_ordering(fields))[:per_page + 1])
+        has_more_after = len(rows) > per_page
+        rows = rows[:per_page]
+        has_more_before = after_values is not None
+
+    def cursor_for(row):
+        return _encode([getattr(row, name) for name, _ in fields])
+
+    return KeysetPage(
+        rows,
+        next_cursor=cursor_for(rows[-1]) if rows and has_more_after else None,
+        previous_cursor=cursor_for(rows[0]) if rows and has_more_before else None,
+        approximate_total=approximate_total,
+    )
+
+
+def approximate_count(model):
+    """
+    Total aproximado de filas de la tabla, sin recorrerla. En MySQL sale de las
+    estadísticas de InnoDB; en otras bases se hace un COUNT(*) normal.
+    """
+    if connection.vendor == 'mysql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                [model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        return row[0] if row else None
+    return model.objects.count()
@@ -0,0 +1,153 @@
+"""
+Difusión en el proceso del avance de ventas de cada sorteo, para el stream SSE.
+
+Cada conexión al stream es una `Subscription` que solo guarda el último avance
+recibido: a quien mira la barra de progreso no le sirven los estados intermedios.
+`publish_progress` se llama al confirmar una verificación y reparte el avance con una
+sola llamada por event loop, sin importar cuántos suscriptores haya.
+
+Las verificaciones hechas en otros procesos no pasan por aquí; para ellas, mientras
+un sorteo tenga suscriptores en este proceso, una tarea consulta su versión cada
+POLL_SECONDS (una consulta por sorteo y proceso, no por suscriptor).
+"""
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+POLL_SECONDS = 5
+
+
+class Subscription:
+    """
+    Último avance publicado para un suscriptor, que espera en su propio event loop.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.data = None
+        self.event = asyncio.Event()
+
+    def deliver(self, data):
+        self.data = data
+        self.event.set()
+
+    async def next(self, timeout):
+        """
+        Espera un avance nuevo hasta `timeout` segundos; None si no llegó ninguno.
+        """
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self.event.clear()
+        return self.data
+
+
+def _deliver_all(subscriptions, data):
+    for subscription in subscriptions:
+        subscription.deliver(data)
+
+
+class ProgressBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+        # (event loop, sorteo) -> tarea que consulta la versión del sorteo.
+        self._pollers = {}
+
+    def subscribe(self, sorteo_id):
+        """
+        Suscribe al avance del sorteo; debe llamarse desde el event loop que va a esperar.
+        """
+        loop = asyncio.get_running_loop()
+        subscription = Subscription(loop)
+        with self._lock:
+            self._subscriptions[sorteo_id].add(subscription)
+            if (loop, sorteo_id) not in self._pollers:
+                self._pollers[(loop, sorteo_id)] = loop.create_task(self._poll(loop, sorteo_id))
+        return subscription
+
+    def unsubscribe(self, sorteo_id, subscription):
+        with self._lock:
+            self._subscriptions[sorteo_id].discard(subscription)
+            if not self._subscriptions[sorteo_id]:
+                del self._subscriptions[sorteo_id]
+
+    def has_subscribers(self, sorteo_id):
+        return sorteo_id in self._subscriptions
+
+    def publish(self, sorteo_id, data):
+        """
+        Entrega `data` a todos los suscriptores del sorteo. Puede llamarse desde
+        cualquier hilo.
+        """
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(sorteo_id, ()))
+        by_loop = defaultdict(list)
+        for subscription in subscriptions:
+            by_loop[subscription.loop].append(subscription)
+        for loop, group in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_deliver_all, group, data)
+            except RuntimeError:
+                # El event loop ya se cerró; sus suscriptores se irán con él.
+                pass
+
+    async def _poll(self, loop, sorteo_id):
+        version = None
+        try:
+            while self.has_subscribers(sorteo_id):
+                await asyncio.sleep(POLL_SECONDS)
+                try:
+                    data = await _fetch_progress(sorteo_id)
+                except Exception as e:
+                    logging.error(f"No se pudo consultar el avance del sorteo {sorteo_id}: {e}")
+                    continue
+                if data and data['version'] != version:
+                    version = data['version']
+                    self.publish(sorteo_id, data)
+        finally:
+            with self._lock:
+                self._pollers.pop((loop, sorteo_id), None)
+
+
+broker = ProgressBroker()
+
+
+def _progress(sorteo_id):
+    from .models import Sorteo
+
+    sorteo = Sorteo.objects.filter(pk=sorteo_id).only(
+        'slug', 'state', 'total_tickets', 'tickets_solds', 'version'
+    ).first()
+    return sorteo.progress_data() if sorteo else None
+
+
+def _poll_progress(sorteo_id):
+    # La tarea que consulta corre fuera de una petición y nadie cierra su conexión: se
+    # respeta CONN_MAX_AGE a mano, como al empezar y terminar una petición.
+    # publish_progress no lo hace porque corre en el hilo de la petición que verificó.
+    close_old_connections()
+    try:
+        return _progress(sorteo_id)
+    finally:
+        close_old_connections()
+
+
+_fetch_progress = sync_to_async(_poll_progress)
+
+
+def publish_progress(sorteo_id):
+    """
+    Publica el avance actual del sorteo si alguien lo está mirando en este proceso.
+    Pensada para transaction.on_commit.
+    """
+    if not broker.has_subscribers(sorteo_id):
+        return
+    data = _progress(sorteo_id)
+    if data:
+        broker.publish(sorteo_id, data)
@@ -0,0 +1,172 @@
+"""
+Conciliación de pagos en espera contra estados de cuenta bancarios en CSV.
+
+El estado de cuenta se lee línea por línea, sin cargar el archivo completo, y cada
+movimiento se busca en un diccionario de los pagos en espera del banco indexado por
+(referencia, monto, fecha), así que conciliar miles de movimientos toma una sola
+consulta y un recorrido del archivo.
+"""
+import csv
+import io
+import itertools
+import re
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+
+from .models import Payment
+
+# Nombres de columna aceptados en la cabecera del estado de cuenta.
+COLUMN_ALIASES = {
+    'reference': {'referencia', 'ref', 'reference', 'nro referencia', 'numero de referencia', 'número de referencia'},
+    'amount': {'monto', 'importe', 'amount', 'credito', 'crédito', 'abono'},
+    'date': {'fecha', 'date', 'fecha valor', 'fecha operacion', 'fecha operación'},
+}
+DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d/%m/%y', '%Y/%m/%d']
+CENT = Decimal('0.01')
+# Montos sin coma cuyos puntos solo separan miles: "1.234", "12.345.678".
+THOUSANDS_ONLY = re.compile(r'-?[1-9]\d{0,2}(\.\d{3})+')
+
+
+def normalize_reference(value):
+    """
+    Referencia comparable: sin espacios, en mayúsculas y sin ceros a la izquierda,
+    que algunos bancos agregan y otros no.
+    """
+    return ''.join(value.split()).upper().lstrip('0')
+
+
+def parse_amount(value):
+    """
+    Interpreta montos como "1.234,56", "1234.56", "1.234" o "Bs. 1234,56". Sin coma,
+    un punto seguido de exactamente tres dígitos separa miles, igual que en "1.234,56".
+    """
+    # El punto de "Bs." no es parte del monto.
+    text = ''.join(ch for ch in value if ch.isdigit() or ch in ',.-').lstrip(',.')
+    if ',' in text and '.' in text:
+        # El último separador es el decimal.
+        if text.rfind(',') > text.rfind('.'):
+            text = text.replace('.', '').replace(',', '.')
+        else:
+            text = text.replace(',', '')
+    elif ',' in text:
+        text = text.replace(',', '.')
+    elif THOUSANDS_ONLY.fullmatch(text):
+        text = text.replace('.', '')
+    try:
+        return Decimal(text).quantize(CENT)
+    except InvalidOperation:
+        raise ValueError(f"Monto inválido: {value!r}")
+
+
+def parse_date(value):
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), date_format).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Fecha inválida: {value!r}")
+
+
+def _column_positions(header):
+    positions = {}
+    for index, name in enumerate(header):
+        name = name.strip().lower()
+        for column, aliases in COLUMN_ALIASES.items():
+            if name in aliases and column not in positions:
+                positions[column] = index
+    missing = [column for column in COLUMN_ALIASES if column not in positions]
+    if missing:
+        raise ValidationError(
+            "El estado de cuenta debe tener columnas de referencia, monto y fecha en la primera línea."
+        )
+    return positions
+
+
+def read_statement(uploaded_file):
+    """
+    Recorre el CSV subido y produce un movimiento por línea:
+    {'line', 'reference', 'amount', 'date'} o {'line', 'raw', 'error'} si no se pudo leer.
+    Acepta separador coma, punto y coma o tabulador.
+    """
+    stream = io.TextIOWrapper(uploaded_file, encoding='utf-8-sig', errors='replace', newline='')
+    first_line = stream.readline()
+    try:
+        dialect = csv.Sniffer().sniff(first_line, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(itertools.chain([first_line], stream), dialect)
+
+    positions = _column_positions(next(reader, []))
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        try:
+            yield {
+                'line': reader.line_num,
+                'reference': row[positions['reference']].strip(),
+                'amount': parse_amount(row[positions['amount']]),
+                'date': parse_date(row[positions['date']]),
+            }
+        except (IndexError, ValueError) as e:
+            yield {'line': reader.line_num, 'raw': dialect.delimiter.join(row), 'error': str(e) or 'Línea incompleta.'}
+
+
+def reconcile(bank, movements):
+    """
+    Cruza los movimientos del estado de cuenta con los pagos en espera del banco.
+
+    Devuelve un informe con:
+    - exact: el movimiento coincide en referencia, monto y fecha con un único pago.
+    - ambiguous: coincide con más de un pago; hay que revisarlo a mano.
+    - partial: la referencia coincide pero el monto o la fecha no.
+    - duplicated: el pago ya se había conciliado con otro movimiento del archivo.
+    - unmatched: ningún pago en espera tiene esa referencia.
+    - missing: pagos en espera del banco que no aparecen en el estado de cuenta.
+    - errors: líneas que no se pudieron leer.
+    """
+    pending = list(
+        Payment.objects.filter(state='E', bank_of_transfer=bank)
+        .select_related('sorteo')
+        .only(
+            'pk', 'owner_name', 'owner_ci', 'reference', 'serial', 'tickets_quantity',
+            'transferred_amount', 'transferred_date', 'sorteo__title',
+        )
+    )
+    by_key = defaultdict(list)
+    by_reference = defaultdict(list)
+    for payment in pending:
+        reference = normalize_reference(payment.reference)
+        by_key[(reference, payment.transferred_amount.quantize(CENT), payment.transferred_date)].append(payment)
+        by_reference[reference].append(payment)
+
+    report = {key: [] for key in ('exact', 'ambiguous', 'partial', 'duplicated', 'unmatched', 'errors')}
+    matched = set()
+    for movement in movements:
+        if 'error' in movement:
+            report['errors'].append(movement)
+            continue
+
+        reference = normalize_reference(movement['reference'])
+        candidates = by_key.get((reference, movement['amount'], movement['date']), [])
+        available = [payment for payment in candidates if payment.pk not in matched]
+        if len(available) == 1:
+            matched.add(available[0].pk)
+            report['exact'].append({**movement, 'payment': available[0]})
+        elif available:
+            report['ambiguous'].append({**movement, 'payments': available})
+        elif candidates:
+            report['duplicated'].append({**movement, 'payment': candidates[0]})
+        elif reference in by_reference:
+            report['partial'].append({**movement, 'payments': by_reference[reference]})
+        else:
+            report['unmatched'].append(movement)
+
+    seen = matched | {
+        payment.pk for entry in report['partial'] + report['ambiguous'] for payment in entry['payments']
+    }
+    report['missing'] = [payment for payment in pending if payment.pk not in seen]
+    report['pending_count'] = len(pending)
+    return report
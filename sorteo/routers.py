@@ -0,0 +1,135 @@
+"""
+Lecturas de las vistas públicas en réplicas de la base de datos.
+
+Solo las vistas marcadas con `read_from_replica` leen de una réplica; todo lo demás
+(escrituras, transacciones como verify_payment y el panel de administración) sigue
+en `default`. Tras registrar un pago, el navegador queda fijado a la base principal
+unos segundos con una cookie, para que vea su propio pago aunque la réplica vaya
+atrasada. Si una réplica no responde se marca como caída un tiempo y la vista se
+repite contra la base principal.
+"""
+import asyncio
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, InterfaceError, OperationalError, connections
+
+# Base de la que leen las consultas de la vista en curso; None para `default`.
+read_database = ContextVar('read_database', default=None)
+
+PIN_COOKIE = 'db_primary'
+# Errores de conexión con la réplica; los demás se propagan como en cualquier vista.
+CONNECTION_ERRORS = (OperationalError, InterfaceError)
+PRIMARY_APPS = {'sessions', 'auth', 'contenttypes'}
+
+# Réplica -> momento (time.monotonic) hasta el que se considera caída.
+_down_until = {}
+
+
+class ReplicaRouter:
+    """
+    Envía las lecturas a la réplica elegida para la petición en curso, si hay una.
+    """
+
+    def db_for_read(self, model, **hints):
+        # Sesiones y usuarios siempre de la principal: una sesión recién creada que aún
+        # no llegó a la réplica se daría por inexistente y cerraría la sesión del usuario.
+        if model._meta.app_label in PRIMARY_APPS:
+            return DEFAULT_DB_ALIAS
+        return read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Las réplicas tienen los mismos datos que la principal.
+        return True
+
+
+def _mark_down(alias, error):
+    logging.warning(f"Réplica {alias} no disponible, se lee de la base principal: {error}")
+    _down_until[alias] = time.monotonic() + settings.REPLICA_RETRY_SECONDS
+    connections[alias].close()
+
+
+def choose_replica():
+    """
+    Elige al azar una réplica disponible; None si no hay ninguna. No se conecta: la
+    conexión se abre con la primera lectura enviada a la réplica, así que una vista
+    que no lee de ella (la portada servida desde la caché) no la abre, y si la réplica
+    no responde, read_from_replica repite la vista contra la base principal.
+    """
+    now = time.monotonic()
+    replicas = [alias for alias in settings.READ_REPLICAS if _down_until.get(alias, 0) <= now]
+    return random.choice(replicas) if replicas else None
+
+
+def is_pinned(request):
+    return PIN_COOKIE in request.COOKIES
+
+
+def pin_to_primary(response):
+    """
+    Hace que las próximas lecturas del navegador vayan a la base principal durante
+    REPLICA_PIN_SECONDS, el retraso máximo que se espera de las réplicas.
+    """
+    response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax')
+    return response
+
+
+@contextmanager
+def use_primary():
+    """
+    Lee de la base principal dentro del bloque, aunque la vista lea de una réplica.
+    """
+    token = read_database.set(None)
+    try:
+        yield
+    finally:
+        read_database.reset(token)
+
+
+def read_from_replica(view):
+    """
+    Ejecuta la vista (y sus funciones de ETag, si se aplica por encima de condition)
+    leyendo de una réplica. Si la réplica falla a mitad de la vista, esta se repite
+    contra la base principal: las vistas marcadas no escriben, así que es seguro.
+    Acepta vistas síncronas y async.
+    """
+    if asyncio.iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            alias = None if is_pinned(request) else choose_replica()
+            if alias is None:
+                return await view(request, *args, **kwargs)
+            # Las consultas que el ORM async corre en hilos heredan este contexto.
+            token = read_database.set(alias)
+            try:
+                return await view(request, *args, **kwargs)
+            except CONNECTION_ERRORS as e:
+                await sync_to_async(_mark_down)(alias, e)
+            finally:
+                read_database.reset(token)
+            return await view(request, *args, **kwargs)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        alias = None if is_pinned(request) else choose_replica()
+        if alias is None:
+            return view(request, *args, **kwargs)
+        token = read_database.set(alias)
+        try:
+            return view(request, *args, **kwargs)
+        except CONNECTION_ERRORS as e:
+            _mark_down(alias, e)
+        finally:
+            read_database.reset(token)
+        return view(request, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,77 @@
+"""
+Búsqueda indexada de pagos.
+
+Cada pago guarda en `search_text` sus campos buscables normalizados (minúsculas y sin
+acentos). En MySQL esa columna tiene un índice FULLTEXT con el parser ngram, de modo
+que buscar un fragmento de nombre o correo no recorre la tabla; en otras bases se usa
+LIKE sobre esa única columna. Las búsquedas que parecen una cédula, una referencia, un
+serial o un correo completo van primero por los índices exactos de esas columnas, y
+solo si no encuentran nada se busca el fragmento en `search_text`.
+"""
+import unicodedata
+
+from django.db.models import BooleanField, F, Func, Q
+
+
+def normalize(text):
+    """
+    Pasa el texto a minúsculas y le quita los acentos.
+    """
+    decomposed = unicodedata.normalize('NFKD', str(text or ''))
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).lower().strip()
+
+
+def build_search_text(*values):
+    return ' '.join(normalize(value) for value in values if value)
+
+
+class SearchMatch(Func):
+    """
+    Filtro booleano sobre una columna de búsqueda: MATCH ... AGAINST en MySQL y LIKE en
+    el resto de bases.
+    """
+    output_field = BooleanField()
+    conditional = True
+
+    def __init__(self, field, query):
+        self.query = normalize(query)
+        super().__init__(F(field))
+
+    def as_sql(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.source_expressions[0])
+        pattern = f"%{connection.ops.prep_for_like_query(self.query)}%"
+        return f"{sql} {connection.operators['contains'] % '%s'}", [*params, pattern]
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.source_expressions[0])
+        # Entre comillas, el parser ngram busca el fragmento como frase.
+        phrase = '"%s"' % self.query.replace('"', ' ')
+        return f"MATCH ({sql}) AGAINST (%s IN BOOLEAN MODE)", [*params, phrase]
+
+
+def _exact_filter(query):
+    # Filtro por índice exacto según la forma del texto, o None si no parece ningún campo.
+    if query.isdigit():
+        # Cédula o número de referencia.
+        return Q(owner_ci=query) | Q(reference=query)
+    if query.upper().startswith('REF-'):
+        return Q(serial=query.upper())
+    if '@' in query and ' ' not in query:
+        return Q(owner_email__iexact=query)
+    return None
+
+
+def search_payments(queryset, query):
+    """
+    Filtra `queryset` por `query`. Si el texto parece una cédula, referencia, serial
+    o correo y hay pagos con ese valor exacto, se devuelven esos (búsqueda por índice);
+    si no, se busca el texto como fragmento, así que "1234" encuentra la cédula
+    12345678 y "ana@" encuentra ana@example.com.
+    """
+    query = query.strip()
+    exact = _exact_filter(query)
+    if exact is not None:
+        matches = queryset.filter(exact)
+        if matches.exists():
+            return matches
+    return queryset.filter(SearchMatch('search_text', query))
@@ -0,0 +1,81 @@
+"""
+Permutación pseudoaleatoria de los números de ticket de un sorteo.
+
+Cada sorteo guarda una clave (`serial_key`) y un cursor (`serial_cursor`). La
+posición `i` del cursor se traduce al número `permute(i, total_tickets, key) + 1`,
+así que repartir `k` números aleatorios cuesta O(k) sin importar cuántos tickets
+se hayan vendido, y nunca se repite un número mientras el cursor no dé la vuelta.
+
+También genera los seriales de los pagos (generate_payment_serial).
+"""
+import secrets
+import time
+
+_MASK64 = (1 << 64) - 1
+_ROUNDS = 4
+# Base32 de Crockford: sin I, L, O ni U, para que el serial se pueda dictar sin confusiones.
+_CROCKFORD = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+
+def generate_serial_key():
+    """
+    Genera una clave aleatoria para la permutación de un sorteo.
+    Cabe en un BigIntegerField con signo.
+    """
+    return secrets.randbits(62)
+
+
+def _mix(value):
+    """
+    Función de mezcla splitmix64: barata y con buena difusión de bits.
+    """
+    value = (value + 0x9E3779B97F4A7C15) & _MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return value ^ (value >> 31)
+
+
+def permute(index, size, key):
+    """
+    Devuelve el elemento en la posición `index` de una permutación de range(size)
+    determinada por `key`.
+
+    Usa una red de Feistel balanceada sobre el menor dominio de 2^(2n) elementos
+    que contiene a `size` y aplica "cycle walking" para quedarse dentro de
+    range(size). Como el dominio es como mucho 4 veces `size`, el número esperado
+    de vueltas es pequeño.
+    """
+    if not 0 <= index < size:
+        raise ValueError("El índice está fuera del rango de la permutación.")
+    if size == 1:
+        return 0
+
+    half_bits = max(1, ((size - 1).bit_length() + 1) // 2)
+    half_mask = (1 << half_bits) - 1
+
+    value = index
+    while True:
+        left, right = value >> half_bits, value & half_mask
+        for round_number in range(_ROUNDS):
+            round_key = _mix(key ^ (round_number << 56))
+            left, right = right, left ^ (_mix(right ^ round_key) & half_mask)
+        value = (left << half_bits) | right
+        if value < size:
+            return value
+
+
+def generate_payment_serial(moment=None):
+    """
+    Serial de un pago: "REF-" seguido de 26 caracteres en base32, con los
+    milisegundos de `moment` (o del momento actual) en los 48 bits altos y 80 bits
+    aleatorios en los bajos, como un ULID. Ordenar los seriales ordena los pagos por
+    fecha de creación, y dos pagos del mismo milisegundo solo coinciden con
+    probabilidad 2^-80; el índice único de Payment.serial descarta el resto.
+    """
+    timestamp = moment.timestamp() if moment else time.time()
+    value = (int(timestamp * 1000) << 80) | secrets.randbits(80)
+    characters = []
+    for _ in range(26):
+        value, digit = divmod(value, 32)
+        characters.append(_CROCKFORD[digit])
+    return 'REF-' + ''.join(reversed(characters))
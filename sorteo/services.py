@@ -0,0 +1,276 @@
+"""
+Lógica de verificación de pagos compartida por las vistas y los comandos.
+"""
+import logging
+from datetime import timedelta
+from itertools import groupby
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from .models import NumberBlock, Payment, SalesBucket, Sorteo, SorteoStats, Ticket, VerificationJob
+from .pubsub import publish_progress
+
+UNEXPECTED_ERROR = 'Ocurrió un error inesperado en el servidor.'
+DRAWN_ERROR = 'Los premios de este sorteo ya fueron sorteados; no se pueden verificar más pagos.'
+
+
+def _result(payment_id, status, message):
+    return {'payment_id': payment_id, 'status': status, 'message': message}
+
+
+def verify_payments(payments):
+    """
+    Verifica una lista de pagos y genera sus tickets.
+
+    Los pagos se agrupan por sorteo; para cada sorteo se reserva la capacidad de
+    todo el grupo con un solo UPDATE, se toman todos los números en una pasada y se
+    insertan todos los tickets con un único bulk_create. Los pagos con números
+    elegidos reciben esos números; los demás, números al azar.
+    Devuelve un resultado por pago, en el mismo orden recibido.
+    """
+    results = {}
+    pending = []
+    for payment in payments:
+        if payment.state != 'E':
+            results[payment.pk] = _result(payment.pk, 'error', 'Este pago no está en espera de verificación.')
+        else:
+            pending.append(payment)
+
+    pending.sort(key=lambda payment: payment.sorteo_id)
+    for _, group in groupby(pending, key=lambda payment: payment.sorteo_id):
+        for result in _verify_sorteo_group(list(group)):
+            results[result['payment_id']] = result
+
+    return [results[payment.pk] for payment in payments]
+
+
+def _reserve_group(sorteo, payments, held):
+    """
+    Reserva la capacidad del grupo completo; la de los pagos en `held` ya estaba
+    apartada y solo pasa a vendida. Si no alcanza para todos, reserva pago por pago
+    en orden hasta agotar la capacidad.
+    Devuelve una lista de (posición inicial, pagos) y los pagos que no cupieron.
+    """
+    def reserve(group):
+        return sorteo.reserve_tickets(
+            sum(payment.tickets_quantity for payment in group),
+            held=sum(payment.tickets_quantity for payment in group if payment.pk in held),
+            serials=sum(payment.tickets_quantity for payment in group if not payment.chosen_numbers),
+        )
+
+    start = reserve(payments)
+    if start is not None:
+        return [(start, payments)], []
+
+    reservations, rejected = [], []
+    for payment in payments:
+        start = reserve([payment])
+        if start is None:
+            rejected.append(payment)
+        else:
+            reservations.append((start, [payment]))
+    return reservations, rejected
+
+
+def _release_numbers(sorteo, payments):
+    # Números de pagos que perdieron su apartado sin llegar a verificarse.
+    numbers = [number for payment in payments for number in payment.chosen_numbers]
+    if numbers:
+        NumberBlock.release(sorteo.pk, numbers)
+
+
+def _undo_reservation(sorteo, payments, held):
+    """
+    Deshace la reserva de capacidad de `payments` tras una verificación que no se
+    completó. Los pagos que tenían apartado y siguen en espera lo recuperan tal como
+    estaba (capacidad, números y vencimiento): quien ya pagó no pierde sus números
+    por un error pasajero. La capacidad y los números de los demás se liberan.
+    """
+    with transaction.atomic():
+        restored = Payment.restore_holds({payment.pk: held[payment.pk] for payment in payments if payment.pk in held})
+        _release_numbers(sorteo, [payment for payment in payments if payment.pk in held and payment.pk not in restored])
+        sorteo.release_tickets(
+            sum(payment.tickets_quantity for payment in payments),
+            held=sum(payment.tickets_quantity for payment in payments if payment.pk in restored),
+        )
+
+
+def _verify_sorteo_group(payments):
+    sorteo = payments[0].sorteo
+    # Tickets nuevos después del sorteo de premios cambiarían su verificación.
+    if sorteo.drawn_at:
+        return [_result(payment.pk, 'error', DRAWN_ERROR) for payment in payments]
+    # Los pagos con apartado vigente tienen su capacidad garantizada; la verificación
+    # se queda con el apartado para que el barrido de vencidos no lo libere a la vez.
+    held = Payment.take_holds(payments)
+    reservations, rejected = _reserve_group(sorteo, payments, held)
+    # Solo pasa si la capacidad se redujo por debajo de lo apartado: se devuelve el apartado.
+    Payment.return_holds([
+        (sorteo.pk, payment.tickets_quantity, payment.chosen_numbers)
+        for payment in rejected if payment.pk in held
+    ])
+    results = [
+        _result(payment.pk, 'error', 'No hay suficientes tickets disponibles para este sorteo.')
+        for payment in rejected
+    ]
+    reserved = [payment for _, group in reservations for payment in group]
+    if not reserved:
+        return results
+
+    verified = []
+    unavailable = set()
+    try:
+        with transaction.atomic():
+            # Solo verificamos los pagos que siguen en espera; otro operador pudo
+            # haberlos verificado o cancelado mientras tanto.
+            claimable = set(
+                Payment.objects.select_for_update()
+                .filter(pk__in=[payment.pk for payment in reserved], state='E')
+                .values_list('pk', flat=True)
+            )
+
+            held_numbers = set()
+            if sorteo.choose_numbers:
+                # Con el mapa bloqueado nadie aparta números mientras se eligen los del azar.
+                blocks = NumberBlock.lock_all(sorteo.pk)
+                held_numbers = NumberBlock.held_numbers(blocks)
+                # Los números de un pago cuyo apartado venció pudieron pasar a otro comprador.
+                unavailable = {
+                    payment.pk for payment in reserved
+                    if payment.pk in claimable and payment.pk not in held
+                    and any(NumberBlock.is_taken(blocks, number) for number in payment.chosen_numbers)
+                }
+                claimable -= unavailable
+
+            now = timezone.now()
+            Payment.objects.filter(pk__in=claimable).update(
+                state='V', state_order=Payment.STATE_ORDER['V'], updated_at=now
+            )
+
+            new_tickets = []
+            for start, group in reservations:
+                group = [payment for payment in group if payment.pk in claimable]
+                quantity = sum(payment.tickets_quantity for payment in group if not payment.chosen_numbers)
+                serials = iter(sorteo.take_serials(start, quantity, unavailable=held_numbers))
+                for payment in group:
+                    numbers = payment.chosen_numbers or [next(serials) for _ in range(payment.tickets_quantity)]
+                    for serial in numbers:
+                        new_tickets.append(Ticket.for_payment(payment, serial, sorteo))
+                    payment.state = 'V'
+                    verified.append(payment)
+
+            Ticket.objects.bulk_create(new_tickets, batch_size=1000)
+            if sorteo.choose_numbers:
+                NumberBlock.sell(sorteo.pk, [ticket.serial for ticket in new_tickets])
+
+            if verified:
+                # El sorteo de premios bloquea esta fila mientras calcula los ganadores: si
+                # se realizó mientras tanto, la verificación se deshace.
+                if Sorteo.objects.select_for_update().values_list('drawn_at', flat=True).get(pk=sorteo.pk):
+                    raise ValidationError(DRAWN_ERROR)
+                # Quienes miran el progreso del sorteo lo reciben al confirmarse la verificación.
+                transaction.on_commit(lambda: publish_progress(sorteo.pk))
+                # Compradores que no tenían otro pago verificado en el sorteo (índice de owner_ci).
+                # Se leen con la fila del sorteo bloqueada: las verificaciones del mismo sorteo
+                # pasan por aquí de a una y, en READ COMMITTED, cada una ve los pagos que
+                # confirmó la anterior, así que un comprador nuevo se cuenta una sola vez.
+                buyers = {payment.owner_ci for payment in verified}
+                returning = set(
+                    Payment.objects.filter(sorteo=sorteo, state='V', owner_ci__in=buyers)
+                    .exclude(pk__in=claimable)
+                    .values_list('owner_ci', flat=True)
+                )
+                SorteoStats.record(
+                    sorteo.pk, 'E', 'V', len(verified),
+                    sum(payment.transferred_amount for payment in verified),
+                    tickets=sum(payment.tickets_quantity for payment in verified),
+                    new_buyers=len(buyers - returning),
+                )
+                channel = attrgetter('method', 'bank_of_transfer')
+                for (method, bank), channel_payments in groupby(sorted(verified, key=channel), key=channel):
+                    channel_payments = list(channel_payments)
+                    SalesBucket.record(
+                        sorteo.pk, now, method, bank, 'V', len(channel_payments),
+                        sum(payment.transferred_amount for payment in channel_payments),
+                        tickets=sum(payment.tickets_quantity for payment in channel_payments),
+                    )
+    except Exception as e:
+        _undo_reservation(sorteo, reserved, held)
+        for payment in reserved:
+            payment.state = 'E'
+        message = e.messages[0] if isinstance(e, ValidationError) else UNEXPECTED_ERROR
+        if not isinstance(e, ValidationError):
+            logging.error(f"Error al verificar pagos del sorteo {sorteo.pk}: {e}")
+        return results + [_result(payment.pk, 'error', message) for payment in reserved]
+
+    unclaimed = [payment for payment in reserved if payment.pk not in claimable]
+    if unclaimed:
+        # Un pago cancelado mientras tanto ya no tenía apartado que liberar al cancelarse.
+        _undo_reservation(sorteo, unclaimed, held)
+
+    results += [
+        _result(
+            payment.pk, 'error',
+            'Los números elegidos ya no están disponibles.' if payment.pk in unavailable
+            else 'Este pago no está en espera de verificación.',
+        )
+        for payment in unclaimed
+    ]
+    results += [
+        _result(payment.pk, 'success', 'Pago verificado y tickets generados exitosamente.')
+        for payment in verified
+    ]
+    return results
+
+
+def claim_verification_jobs(limit, stale_after=timedelta(minutes=10)):
+    """
+    Toma hasta `limit` trabajos pendientes y los marca "En proceso".
+
+    Usa SELECT ... FOR UPDATE SKIP LOCKED para que varios workers puedan correr a la
+    vez sin tomar el mismo trabajo. Los trabajos que quedaron "En proceso" por más de
+    `stale_after` (un worker que murió a mitad) vuelven a la cola.
+    """
+    now = timezone.now()
+    VerificationJob.objects.filter(state='R', started_at__lt=now - stale_after).update(state='P')
+
+    with transaction.atomic():
+        jobs = list(
+            VerificationJob.objects.select_for_update(skip_locked=True)
+            .filter(state='P', run_after__lte=now)
+            .order_by('run_after')[:limit]
+        )
+        VerificationJob.objects.filter(pk__in=[job.pk for job in jobs]).update(state='R', started_at=now)
+    return jobs
+
+
+def run_verification_jobs(jobs):
+    """
+    Procesa los trabajos tomados por `claim_verification_jobs` verificando sus pagos en lote.
+    Los errores inesperados se reintentan con espera exponencial; los errores de negocio
+    (pago ya procesado, sorteo sin capacidad) marcan el trabajo como fallido.
+    """
+    payments = {payment.pk: payment for payment in Payment.objects.select_related('sorteo').filter(
+        pk__in=[job.payment_id for job in jobs]
+    )}
+    results = {result['payment_id']: result for result in verify_payments(list(payments.values()))}
+
+    now = timezone.now()
+    for job in jobs:
+        result = results[job.payment_id]
+        job.attempts += 1
+        job.message = result['message']
+        job.updated_at = now
+        if result['status'] == 'success':
+            job.state = 'D'
+        elif result['message'] == UNEXPECTED_ERROR and job.attempts < settings.VERIFICATION_MAX_ATTEMPTS:
+            job.state = 'P'
+            job.run_after = now + timedelta(seconds=30 * 2 ** (job.attempts - 1))
+        else:
+            job.state = 'F'
+    VerificationJob.objects.bulk_update(jobs, ['state', 'attempts', 'message', 'run_after', 'updated_at'])
+    return jobs
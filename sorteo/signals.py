@@ -0,0 +1,32 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .caching import invalidate_home_cache
+from .metrics import query_wrapper
+from .models import Premio, Sorteo
+
+
+@receiver([post_save, post_delete], sender=Sorteo)
+def sorteo_changed(sender, instance, **kwargs):
+    invalidate_home_cache()
+
+
+@receiver([post_save, post_delete], sender=Premio)
+def premio_changed(sender, instance, **kwargs):
+    """
+    Un premio nuevo, editado o eliminado cambia lo que muestra su sorteo.
+    """
+    Sorteo.objects.filter(pk=instance.sorteo_id).update(**Sorteo.bump_version())
+    invalidate_home_cache()
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    """
+    Cada conexión lleva puesto el contador de consultas de RequestMetricsMiddleware.
+    Se pone aquí y no por petición porque bajo ASGI el ORM async usa conexiones de
+    otro hilo; fuera de una petición medida el contador no hace nada.
+    """
+    if query_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_wrapper)
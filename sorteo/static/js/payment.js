@@ -219,8 +219,83 @@ function updateTotal() {
   document.getElementById('total-amount').textContent = `Bs ${total.toFixed(2)}`;
 }
 
+// --- Progreso del sorteo ---
+// Segundos entre consultas del avance de ventas.
+const PROGRESS_POLL_SECONDS = 30;
+
+/**
+ * Consulta el avance de ventas del sorteo y actualiza la barra de progreso.
+ * `cache: 'no-cache'` hace que el navegador revalide con la ETag, así que si nada
+ * cambió el servidor responde 304 sin cuerpo.
+ */
+function refreshProgress(container) {
+  fetch(container.dataset.progressUrl, { cache: 'no-cache' })
+    .then(response => response.ok ? response.json() : null)
+    .then(data => { if (data) { showProgress(data); } })
+    .catch(error => console.error('Error:', error));
+}
+
+function showProgress(data) {
+  const bar = document.getElementById('sorteo-progress-bar');
+  const label = document.getElementById('sorteo-progress-label');
+  bar.style.width = `${data.percentage_sold}%`;
+  bar.setAttribute('aria-valuenow', data.percentage_sold);
+  label.textContent = `${data.percentage_sold}%`;
+}
+
+/**
+ * Recibe el avance por Server-Sent Events: el servidor lo envía al confirmarse cada
+ * verificación y EventSource se reconecta solo si se corta la conexión.
+ */
+function watchProgress(container) {
+  const source = new EventSource(container.dataset.eventsUrl);
+  source.addEventListener('progress', event => showProgress(JSON.parse(event.data)));
+}
+
+// --- Elección de números ---
+const FREE_NUMBERS_PAGE = 100;
+
+function chooseNumber(number) {
+  const input = document.getElementById('id_chosen_numbers');
+  const numbers = input.value.split(/[\s,]+/).filter(Boolean);
+  if (!numbers.includes(String(number))) { numbers.push(number); }
+  input.value = numbers.join(', ');
+}
+
+function loadFreeNumbers() {
+  const picker = document.getElementById('number-picker');
+  const start = parseInt(document.getElementById('numbers-from').value, 10) || 1;
+  const end = Math.min(start + FREE_NUMBERS_PAGE - 1, parseInt(picker.dataset.totalTickets, 10));
+  fetch(`${picker.dataset.numbersUrl}?start=${start}&end=${end}&limit=${FREE_NUMBERS_PAGE}`)
+    .then(response => response.ok ? response.json() : null)
+    .then(data => {
+      const list = document.getElementById('free-numbers');
+      list.innerHTML = '';
+      if (!data) { return; }
+      if (!data.free.length) { list.textContent = 'No hay números libres en este rango.'; }
+      data.free.forEach(number => {
+        const button = document.createElement('button');
+        button.type = 'button';
+        button.className = 'btn btn-sm btn-outline-light';
+        button.textContent = number;
+        button.addEventListener('click', () => chooseNumber(number));
+        list.appendChild(button);
+      });
+    })
+    .catch(() => {});
+}
+
 // --- Event Listeners ---
 document.addEventListener('DOMContentLoaded', function() {
+    const progressContainer = document.getElementById('sorteo-progress');
+    if (progressContainer && window.EventSource) {
+        watchProgress(progressContainer);
+    } else if (progressContainer) {
+        setInterval(() => {
+            if (!document.hidden) { refreshProgress(progressContainer); }
+        }, PROGRESS_POLL_SECONDS * 1000);
+    }
+
     const purchaseForm = document.getElementById('purchase-form');
     if (purchaseForm) {
         purchaseForm.addEventListener('submit', function(event) {
@@ -19,6 +19,10 @@ function sendPaymentAction(paymentId, url, csrfToken) {
             Swal.fire('¡Hecho!', data.message, 'success').then(() => {
                 location.reload(); // Recarga la página para ver los cambios
             });
+        } else if (data.status === 'queued') {
+            Swal.fire('En cola', data.message, 'info').then(() => {
+                location.reload(); // La página consultará el estado del trabajo en cola
+            });
         } else {
             Swal.fire('Error', data.message, 'error');
         }
@@ -75,4 +79,127 @@ function cancelPayment(paymentId) {
             sendPaymentAction(paymentId, '/payment/cancel/', csrfToken);
         }
     });
-}
\ No newline at end of file
+}
+
+/**
+ * Devuelve los IDs de los pagos marcados en la tabla.
+ * @returns {number[]} - Los IDs seleccionados.
+ */
+function getSelectedPaymentIds() {
+    return Array.from(document.querySelectorAll('.payment-select:checked')).map(input => Number(input.value));
+}
+
+/**
+ * Habilita el botón de verificación en lote solo si hay pagos seleccionados.
+ */
+function updateVerifySelectedButton() {
+    const button = document.getElementById('verify-selected-btn');
+    if (button) {
+        button.disabled = getSelectedPaymentIds().length === 0;
+    }
+}
+
+/**
+ * Verifica en una sola petición todos los pagos seleccionados.
+ */
+function verifySelectedPayments() {
+    const button = document.getElementById('verify-selected-btn');
+    const csrfToken = button.dataset.csrfToken;
+    const paymentIds = getSelectedPaymentIds();
+
+    Swal.fire({
+        title: '¿Estás seguro?',
+        text: `Se verificarán ${paymentIds.length} pagos y se generarán sus tickets. ¡No se puede deshacer!`,
+        icon: 'warning',
+        showCancelButton: true,
+        confirmButtonColor: '#28a745',
+        cancelButtonColor: '#6c757d',
+        confirmButtonText: 'Sí, ¡verificar!',
+        cancelButtonText: 'Cancelar'
+    }).then((result) => {
+        if (!result.isConfirmed) {
+            return;
+        }
+        fetch('/payment/verify-batch/', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': csrfToken
+            },
+            body: JSON.stringify({ payment_ids: paymentIds })
+        })
+        .then(response => response.json())
+        .then(data => {
+            if (data.status !== 'success') {
+                Swal.fire('Error', data.message, 'error');
+                return;
+            }
+            const errors = data.results
+                .filter(item => item.status === 'error')
+                .map(item => `<li>Pago #${item.payment_id}: ${item.message}</li>`)
+                .join('');
+            Swal.fire({
+                title: data.failed ? 'Verificación parcial' : (data.queued ? 'En cola' : '¡Hecho!'),
+                html: `<p>${data.message}</p>` + (errors ? `<ul class="text-start">${errors}</ul>` : ''),
+                icon: data.failed ? 'warning' : 'success'
+            }).then(() => {
+                // La página de conciliación indica a dónde ir; la lista de pagos se recarga.
+                if (button.dataset.redirectUrl) {
+                    location.href = button.dataset.redirectUrl;
+                } else {
+                    location.reload();
+                }
+            });
+        })
+        .catch(error => {
+            console.error('Error:', error);
+            Swal.fire('Error', 'Ocurrió un error al comunicarse con el servidor.', 'error');
+        });
+    });
+}
+
+/**
+ * Consulta periódicamente el estado de las verificaciones en cola y recarga la
+ * página cuando todas terminan.
+ * @param {string[]} jobIds - Los IDs de los trabajos a vigilar.
+ */
+function pollVerificationJobs(jobIds) {
+    fetch(`/payment/verify-status/?ids=${jobIds.join(',')}`)
+    .then(response => response.json())
+    .then(data => {
+        const active = data.jobs.filter(job => job.state === 'P' || job.state === 'R');
+        if (active.length === 0) {
+            const failed = data.jobs.filter(job => job.state === 'F');
+            if (failed.length) {
+                const errors = failed.map(job => `<li>Pago #${job.payment_id}: ${job.message}</li>`).join('');
+                Swal.fire({ title: 'Verificación fallida', html: `<ul class="text-start">${errors}</ul>`, icon: 'error' })
+                    .then(() => location.reload());
+            } else {
+                location.reload();
+            }
+            return;
+        }
+        setTimeout(() => pollVerificationJobs(active.map(job => job.job_id)), 3000);
+    })
+    .catch(error => console.error('Error:', error));
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    const queuedJobIds = Array.from(document.querySelectorAll('[data-job-id]')).map(badge => badge.dataset.jobId);
+    if (queuedJobIds.length) {
+        setTimeout(() => pollVerificationJobs(queuedJobIds), 3000);
+    }
+
+    const selectAll = document.getElementById('select-all-payments');
+    if (selectAll) {
+        selectAll.addEventListener('change', function() {
+            document.querySelectorAll('.payment-select').forEach(input => {
+                input.checked = selectAll.checked;
+            });
+            updateVerifySelectedButton();
+        });
+    }
+    document.querySelectorAll('.payment-select').forEach(input => {
+        input.addEventListener('change', updateVerifySelectedButton);
+    });
+});
@@ -0,0 +1,22 @@
+"""
+Motor de plantillas de Django que suma el tiempo de render a las métricas de la
+petición en curso (ver RequestMetricsMiddleware). Fuera de una petición medida se
+comporta igual que el motor de Django.
+"""
+from django.template.backends import django as backend
+
+from .metrics import rendering
+
+
+class Template(backend.Template):
+    def render(self, context=None, request=None):
+        with rendering():
+            return super().render(context, request)
+
+
+class DjangoTemplates(backend.DjangoTemplates):
+    def from_string(self, template_code):
+        return Template(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
@@ -0,0 +1,21 @@
+from django import template
+from sorteo.images import current_variants
+
+register = template.Library()
+
+
+@register.inclusion_tag('sorteo/responsive_picture.html')
+def responsive_picture(image, alt, css_class='', style='', sizes='100vw'):
+    """
+    Muestra una imagen como <picture> con sus variantes WebP y JPEG en srcset, o el
+    original si todavía no tiene variantes.
+    """
+    manifest = current_variants(image)
+    context = {'image': image, 'alt': alt, 'css_class': css_class, 'style': style, 'sizes': sizes, 'manifest': manifest}
+    if manifest:
+        context['srcsets'] = {
+            extension: ', '.join(f"{image.storage.url(name)} {width}w" for width, name in variants)
+            for extension, variants in manifest['variants'].items()
+        }
+        context['fallback'] = image.storage.url(manifest['variants']['jpeg'][-1][1])
+    return context
@@ -1,3 +1,901 @@
-from django.test import TestCase
+import asyncio
+import random
+import re
+import tempfile
+import threading
+import time
+from contextlib import nullcontext
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection, connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse
+from django.template import engines
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import resolve, reverse
+from PIL import Image
+
+from . import routers
+from .caching import aget_home_sorteo
+from .draw import run_draw, verify_draw
+from .images import current_variants
+from .media import serve_media
+from .metrics import current_metrics
+from .middleware import RequestMetricsMiddleware
+from .models import NumberBlock, Payment, Premio, Sorteo, SorteoStats, Ticket, VerificationJob
+from .pagination import keyset_paginate
+from .reconciliation import parse_amount, read_statement, reconcile
+from .pubsub import Subscription, broker, publish_progress
+from .search import search_payments
+from .serials import generate_payment_serial
+from .services import claim_verification_jobs, run_verification_jobs, verify_payments
+from .views import _progress_events
+
+
+def create_sorteo(total_tickets=50, **fields):
+    return Sorteo.objects.create(
+        title=fields.pop('title', 'Moto'), description='-', prize_picture=fields.pop('prize_picture', ''), ticket_price=2,
+        state='A', total_tickets=total_tickets, lottery_conditions='-', date_lottery_text='Al 100%', **fields
+    )
+
+
+def create_payment(sorteo, quantity, reference, **fields):
+    values = {
+        'owner_name': 'Ana Pérez', 'owner_ci': '12345678', 'owner_email': 'ana@example.com',
+        'owner_phone': '+584141234567', 'method': 'P', 'bank_of_transfer': '0102', 'state': 'E',
+        'transferred_date': date.today(),
+    }
+    values.update(fields)
+    return Payment.objects.create(
+        sorteo=sorteo, reference=reference, tickets_quantity=quantity,
+        transferred_amount=sorteo.ticket_price * quantity, **values
+    )
+
+
+def get_home_sorteo():
+    return async_to_sync(aget_home_sorteo)()
+
+
+def run_in_threads(target, count):
+    """
+    Corre `target(i)` en `count` hilos que arrancan a la vez; cada hilo usa su propia
+    conexión y la cierra al terminar. Devuelve los resultados en orden.
+    """
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def run(i):
+        try:
+            barrier.wait()
+            results[i] = target(i)
+        except Exception as e:
+            results[i] = e
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class RowLockTimer:
+    """
+    Mide cuánto tiempo tiene cada conexión bloqueada alguna fila de `table` y qué
+    sentencias corre mientras tanto: desde el UPDATE o SELECT ... FOR UPDATE que la
+    bloquea hasta el fin de su transacción. Se instala en cada hilo con
+    connection.execute_wrapper y mientras tanto se usa como contexto.
+    """
+    def __init__(self, table):
+        self.locking = re.compile(
+            rf'^UPDATE [`"]?{table}[`"]? |^SELECT .* FROM [`"]?{table}[`"]? .*FOR UPDATE', re.DOTALL
+        )
+        self.holds = []
+        self.open = {}
+        self.mutex = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        connection = context['connection']
+        hold = self.open.get(connection)
+        if hold is None and self.locking.match(sql):
+            hold = self.open[connection] = {'start': time.perf_counter(), 'statements': []}
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if hold is not None:
+                hold['statements'].append(sql)
+                if connection.get_autocommit():
+                    self.release(connection)
+
+    def release(self, connection):
+        hold = self.open.pop(connection, None)
+        if hold is not None:
+            with self.mutex:
+                self.holds.append((time.perf_counter() - hold['start'], hold['statements']))
+
+    def __enter__(self):
+        wrapper_class = type(connections['default'])
+        commit, rollback = wrapper_class.commit, wrapper_class.rollback
+
+        def ending(end):
+            def wrapped(connection):
+                try:
+                    return end(connection)
+                finally:
+                    self.release(connection)
+            return wrapped
+
+        self.patches = [
+            mock.patch.object(wrapper_class, 'commit', ending(commit)),
+            mock.patch.object(wrapper_class, 'rollback', ending(rollback)),
+        ]
+        for patch in self.patches:
+            patch.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        for patch in self.patches:
+            patch.stop()
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentTestCase(TransactionTestCase):
+    """
+    Pruebas con varios hilos que escriben a la vez. Necesitan una base con bloqueo de
+    filas, como MySQL en producción: SQLite bloquea la base entera y rechaza las
+    escrituras que se cruzan.
+    """
+
+
+class ConcurrentVerificationTests(ConcurrentTestCase):
+    def test_concurrent_verifications_do_not_oversell(self):
+        sorteo = create_sorteo(total_tickets=50)
+        payments = [create_payment(sorteo, 10, f"ref-{i}", owner_ci=f"1000000{i}") for i in range(5)]
+        # Pagos cuyo apartado venció: compiten por la capacidad al verificarse.
+        Sorteo.objects.filter(pk=sorteo.pk).update(total_tickets=80)
+        payments += [create_payment(sorteo, 10, f"ref-{i}", owner_ci=f"1000000{i}") for i in range(5, 8)]
+        Payment.objects.update(hold_expires_at=None)
+        Sorteo.objects.filter(pk=sorteo.pk).update(total_tickets=50, tickets_held=0)
+
+        with RowLockTimer(Sorteo._meta.db_table) as locks:
+            results = run_in_threads(lambda i: self.verify(payments[i], locks), 8)
+
+        self.assertEqual(
+            sorted(result['message'] if result['status'] == 'error' else 'ok' for result in results),
+            ['No hay suficientes tickets disponibles para este sorteo.'] * 3 + ['ok'] * 5,
+        )
+        sorteo.refresh_from_db()
+        serials = list(Ticket.objects.filter(sorteo=sorteo).values_list('serial', flat=True))
+        self.assertEqual((sorteo.tickets_solds, sorteo.tickets_held), (50, 0))
+        self.assertEqual(len(set(serials)), 50)
+        self.assertEqual(Payment.objects.filter(state='V').count(), 5)
+        # El sorteo queda bloqueado solo para reservar capacidad y, al final, para sumar
+        # las estadísticas: los tickets y los pagos se escriben fuera del bloqueo.
+        self.assertTrue(locks.holds)
+        for seconds, statements in locks.holds:
+            touched = [sql for sql in statements if re.match(r'(INSERT INTO|UPDATE) [`"]?sorteo_(ticket|payment)\b', sql)]
+            self.assertEqual(touched, [], f"bloqueo de {seconds * 1000:.1f} ms")
+
+    def test_a_new_buyer_is_counted_once(self):
+        sorteo = create_sorteo(total_tickets=50)
+        payments = [create_payment(sorteo, 2, f"ref-{i}", owner_ci='40000000') for i in range(8)]
+
+        results = run_in_threads(lambda i: self.verify(payments[i]), 8)
+
+        self.assertEqual([result['status'] for result in results], ['success'] * 8)
+        sorteo.refresh_from_db()
+        self.assertEqual((sorteo.tickets_solds, sorteo.tickets_held), (16, 0))
+        stats = SorteoStats.objects.get(sorteo=sorteo)
+        self.assertEqual((stats.verified_count, stats.verified_tickets, stats.unique_buyers), (8, 16, 1))
+
+    def verify(self, payment, locks=None):
+        with connection.execute_wrapper(locks) if locks else nullcontext():
+            return verify_payments([Payment.objects.select_related('sorteo').get(pk=payment.pk)])[0]
+
+
+class BatchVerificationTests(TestCase):
+    def test_a_batch_that_does_not_fit_verifies_in_order(self):
+        sorteo = create_sorteo(total_tickets=25)
+        # El tercer pago perdió su apartado al vencer, así que ya no cabe en el sorteo.
+        late = create_payment(sorteo, 10, 'ref-2')
+        Payment.objects.filter(pk=late.pk).update(hold_expires_at=datetime.now(timezone.utc) - timedelta(minutes=1))
+        Payment.release_expired_holds()
+        payments = [create_payment(sorteo, 10, f"ref-{i}") for i in range(2)] + [late]
+        self.client.force_login(User.objects.create_user('admin', password='-', is_staff=True))
+
+        response = self.client.post(
+            reverse('verify_payment_batch'), {'payment_ids': [payment.pk for payment in payments] + [0]},
+            content_type='application/json', secure=True,
+        )
+
+        data = response.json()
+        self.assertEqual((data['verified'], data['failed']), (2, 2))
+        self.assertEqual(
+            {result['payment_id']: result['status'] for result in data['results']},
+            {payments[0].pk: 'success', payments[1].pk: 'success', payments[2].pk: 'error', 0: 'error'},
+        )
+        sorteo.refresh_from_db()
+        self.assertEqual(sorteo.tickets_solds, 20)
+        self.assertEqual(Ticket.objects.filter(sorteo=sorteo).count(), 20)
+
+
+@override_settings(VERIFICATION_QUEUE_THRESHOLD=10)
+class VerificationQueueTests(TestCase):
+    def test_large_payments_are_verified_by_the_worker(self):
+        sorteo = create_sorteo(total_tickets=50)
+        payment = create_payment(sorteo, 10, 'ref-1')
+        self.client.force_login(User.objects.create_user('admin', password='-', is_staff=True))
+
+        response = self.client.post(
+            reverse('verify_payment'), {'payment_id': payment.pk}, content_type='application/json', secure=True
+        )
+
+        self.assertEqual(response.status_code, 202)
+        payment.refresh_from_db()
+        self.assertEqual(payment.state, 'E')
+
+        # Lo mismo que hace una ronda de `manage.py process_verifications` en su hilo.
+        run_verification_jobs(claim_verification_jobs(10))
+
+        job = VerificationJob.objects.get(pk=response.json()['job_id'])
+        payment.refresh_from_db()
+        self.assertEqual((job.state, job.attempts, payment.state), ('D', 1, 'V'))
+        self.assertEqual(Ticket.objects.filter(payment=payment).count(), 10)
+
+
+class RecountTicketsTests(TestCase):
+    def test_recount_repairs_a_reservation_without_tickets(self):
+        sorteo = create_sorteo(total_tickets=50)
+        payment = create_payment(sorteo, 10, 'ref-1')
+        verify_payments([Payment.objects.select_related('sorteo').get(pk=payment.pk)])
+        create_payment(sorteo, 5, 'ref-2')
+        # Una verificación que reservó 7 tickets y murió antes de insertarlos.
+        sorteo.refresh_from_db()
+        sorteo.reserve_tickets(7)
+
+        sorteo.recount_tickets()
+
+        sorteo.refresh_from_db()
+        self.assertEqual((sorteo.tickets_solds, sorteo.tickets_held), (10, 5))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class HomeCacheTests(TestCase):
+    def test_a_sale_refreshes_the_cached_main_raffle(self):
+        create_sorteo(total_tickets=50, is_main=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            get_home_sorteo()
+        with self.assertNumQueries(0):
+            get_home_sorteo()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Sorteo.objects.get(is_main=True).reserve_tickets(5)
+
+        sorteo, _ = get_home_sorteo()
+        self.assertEqual((sorteo.tickets_solds, sorteo.version), (5, 2))
+
+    def test_an_unchanged_home_answers_not_modified(self):
+        create_sorteo(total_tickets=50, is_main=True)
+        # La primera visita recibe la cookie CSRF, que forma parte de la ETag.
+        self.client.get(reverse('home'), secure=True)
+        response = self.client.get(reverse('home'), secure=True)
+
+        again = self.client.get(reverse('home'), secure=True, HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual((response.status_code, again.status_code), (200, 304))
+
+    def test_progress_revalidates_until_a_sale(self):
+        sorteo = create_sorteo(total_tickets=50)
+        url = reverse('sorteo_progress', args=[sorteo.slug])
+        etag = self.client.get(url, secure=True)['ETag']
+
+        self.assertEqual(self.client.get(url, secure=True, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        sorteo.reserve_tickets(5)
+        response = self.client.get(url, secure=True, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual((response.status_code, response.json()['tickets_solds']), (200, 5))
+
+    def test_an_admin_edit_does_not_overwrite_sales(self):
+        sorteo = create_sorteo(total_tickets=50)
+        Sorteo.objects.get(pk=sorteo.pk).reserve_tickets(5)
+
+        sorteo.title = 'Moto nueva'
+        sorteo.save()
+
+        sorteo.refresh_from_db()
+        self.assertEqual((sorteo.title, sorteo.tickets_solds, sorteo.serial_cursor), ('Moto nueva', 5, 5))
+
+
+class PaymentSearchTests(TestCase):
+    def setUp(self):
+        sorteo = create_sorteo()
+        self.ana = create_payment(sorteo, 1, '555001', owner_ci='12345678', owner_email='a@b.com')
+        self.luis = create_payment(sorteo, 1, '1234', owner_name='Luis Díaz', owner_ci='87654321', owner_email='luis@b.com')
+
+    def search(self, query):
+        return set(search_payments(Payment.objects.all(), query))
+
+    def test_exact_values_use_the_exact_match(self):
+        self.assertEqual(self.search('12345678'), {self.ana})
+        self.assertEqual(self.search('1234'), {self.luis})
+        self.assertEqual(self.search(self.ana.serial), {self.ana})
+        self.assertEqual(self.search('A@B.com'), {self.ana})
+
+    def test_fragments_fall_back_to_search_text(self):
+        self.assertEqual(self.search('345678'), {self.ana})
+        self.assertEqual(self.search('a@b'), {self.ana})
+        self.assertEqual(self.search(self.ana.serial[:4]), {self.ana, self.luis})
+        self.assertEqual(self.search('diaz'), {self.luis})
+
+
+class VerifyTicketsLookupTests(TestCase):
+    def test_owner_ci_is_normalized_on_write(self):
+        sorteo = create_sorteo()
+        payment = create_payment(sorteo, 2, 'ref-1', owner_ci=' e1234567 ', owner_email='Ana@Example.com ')
+        verify_payments([Payment.objects.select_related('sorteo').get(pk=payment.pk)])
+
+        self.assertEqual(set(Ticket.objects.values_list('owner_ci', flat=True)), {'E1234567'})
+        self.assertEqual(Ticket.owned_by('e1234567').count(), 2)
+        self.assertEqual(Ticket.owned_by('ANA@example.com').count(), 2)
+
+    def test_lookup_uses_both_owner_indexes(self):
+        plan = Ticket.owned_by('12345678').select_related('sorteo').explain()
+
+        self.assertIn('sorteo_ticket_ci_idx', plan)
+        self.assertIn('sorteo_ticket_email_idx', plan)
+
+
+class KeysetPaginationTests(TestCase):
+    ORDER = [('state_order', False), ('created_at', True), ('id', True)]
+
+    def setUp(self):
+        sorteo = create_sorteo(total_tickets=100)
+        base = datetime(2026, 1, 1, 12, 0, 0, 123000, tzinfo=timezone.utc)
+        # Grupos de pagos en el mismo milisegundo: a veces con el mismo instante exacto,
+        # a veces separados por microsegundos.
+        for index in range(40):
+            payment = create_payment(sorteo, 1, f"ref-{index}", owner_ci=f"2000{index:04d}")
+            moment = base + timedelta(milliseconds=index // 4, microseconds=(index % 4) // 2 * 250)
+            Payment.objects.filter(pk=payment.pk).update(created_at=moment)
+        self.expected = list(
+            Payment.objects.order_by('state_order', '-created_at', '-id').values_list('pk', flat=True)
+        )
+
+    def test_forward_pages_visit_every_row_once(self):
+        seen, cursor = [], None
+        while True:
+            page = keyset_paginate(Payment.objects.all(), self.ORDER, after=cursor, per_page=1)
+            seen += [payment.pk for payment in page]
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, self.expected)
+
+    def test_backward_pages_visit_every_row_once(self):
+        page = keyset_paginate(Payment.objects.all(), self.ORDER, per_page=3)
+        while page.has_next:
+            page = keyset_paginate(Payment.objects.all(), self.ORDER, after=page.next_cursor, per_page=3)
+        seen = [payment.pk for payment in page]
+        while page.has_previous:
+            page = keyset_paginate(Payment.objects.all(), self.ORDER, before=page.previous_cursor, per_page=3)
+            self.assertEqual(len(page), 3)
+            seen = [payment.pk for payment in page] + seen
+        self.assertEqual(seen, self.expected)
+
+
+class RequestMetricsMiddlewareTests(TestCase):
+    async def test_async_requests_are_measured_without_a_thread(self):
+        measured = []
+
+        async def get_response(request):
+            await Sorteo.objects.acount()
+            html = engines['django'].from_string('{{ value }}').render({'value': 1})
+            measured.append(current_metrics.get())
+            return HttpResponse(html)
+
+        with self.settings(REQUEST_METRICS=True):
+            middleware = RequestMetricsMiddleware(get_response)
+            self.assertTrue(iscoroutinefunction(middleware))
+            response = await middleware(RequestFactory().get('/'))
+
+        [metrics] = measured
+        self.assertEqual(metrics.query_count, 1)
+        self.assertGreater(metrics.render_time, 0)
+        self.assertIn('1 consultas', response['Server-Timing'])
+
+
+class TicketExportTests(TestCase):
+    def setUp(self):
+        self.sorteo = create_sorteo(total_tickets=50)
+        payment = create_payment(self.sorteo, 1, 'ref-1', owner_name='=HYPERLINK("http://x","y")')
+        verify_payments([Payment.objects.select_related('sorteo').get(pk=payment.pk)])
+        self.url = reverse('ticket_export', args=[self.sorteo.pk])
+
+    def test_only_staff_can_export(self):
+        self.client.force_login(User.objects.create_user('operador', password='-'))
+
+        response = self.client.get(self.url, secure=True)
+
+        self.assertEqual(response.status_code, 302)
+
+    def test_formulas_are_escaped(self):
+        self.client.force_login(User.objects.create_user('admin', password='-', is_staff=True))
+
+        response = self.client.get(self.url, secure=True)
+
+        row = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()[1]
+        self.assertIn('"\'=HYPERLINK(""http://x"",""y"")"', row)
+        self.assertIn("'+584141234567", row)
+
+
+class ParseAmountTests(SimpleTestCase):
+    def test_separators(self):
+        cases = {
+            '1.234': '1234.00',
+            'Bs. 1.234': '1234.00',
+            '12.345.678': '12345678.00',
+            '1.234,56': '1234.56',
+            'Bs. 1234,56': '1234.56',
+            '1234.56': '1234.56',
+            '1.5': '1.50',
+            '0.500': '0.50',
+        }
+        for value, expected in cases.items():
+            with self.subTest(value=value):
+                self.assertEqual(parse_amount(value), Decimal(expected))
+
+
+class ReconcileTests(TestCase):
+    def test_statement_lines_are_classified(self):
+        sorteo = create_sorteo()
+        exact = create_payment(sorteo, 1, '555001')
+        partial = create_payment(sorteo, 2, '555002', owner_ci='87654321')
+        missing = create_payment(sorteo, 1, '555003', owner_ci='11111111')
+        today = date.today().strftime('%d/%m/%Y')
+        statement = BytesIO('\n'.join([
+            'Fecha;Referencia;Monto',
+            f'{today};00555001;2,00',
+            f'{today};555001;2,00',
+            f'{today};555002;5,00',
+            f'{today};999999;1,00',
+            f'{today};555004',
+        ]).encode())
+
+        report = reconcile('0102', read_statement(statement))
+
+        self.assertEqual([entry['payment'] for entry in report['exact']], [exact])
+        self.assertEqual([entry['payment'] for entry in report['duplicated']], [exact])
+        self.assertEqual([entry['payments'] for entry in report['partial']], [[partial]])
+        self.assertEqual([entry['reference'] for entry in report['unmatched']], ['999999'])
+        self.assertEqual([entry['line'] for entry in report['errors']], [6])
+        self.assertEqual(report['missing'], [missing])
+
+
+class DrawTests(TestCase):
+    def setUp(self):
+        self.sorteo = create_sorteo(total_tickets=2000)
+        for index in range(2):
+            payment = create_payment(self.sorteo, 5, f"ref-{index}", owner_ci=f"3000000{index}")
+            verify_payments([Payment.objects.select_related('sorteo').get(pk=payment.pk)])
+        self.pending = create_payment(self.sorteo, 20, 'ref-late', owner_ci='30000009')
+        Premio.objects.create(sorteo=self.sorteo, name='Moto', description='-', position=1)
+        Premio.objects.create(sorteo=self.sorteo, name='Bicicleta', description='-', position=2)
+        Sorteo.objects.filter(pk=self.sorteo.pk).update(state='F')
+        self.sorteo.refresh_from_db()
+        run_draw(self.sorteo, 'semilla')
+
+    def test_draw_stores_its_mode(self):
+        self.assertEqual((self.sorteo.draw_mode, self.sorteo.draw_sold), ('R', 10))
+
+    def test_payments_are_not_verified_after_the_draw(self):
+        [result] = verify_payments([Payment.objects.select_related('sorteo').get(pk=self.pending.pk)])
+
+        self.assertEqual(result['status'], 'error')
+        self.assertEqual(Ticket.objects.filter(sorteo=self.sorteo).count(), 10)
+        self.assertTrue(verify_draw(self.sorteo)[1])
+
+    def test_the_page_replays_the_draw_only_on_demand(self):
+        self.client.force_login(User.objects.create_user('operador', password='-'))
+        url = reverse('sorteo_draw', args=[self.sorteo.pk])
+
+        with mock.patch('sorteo.views.verify_draw', wraps=verify_draw) as replay:
+            self.assertNotContains(self.client.get(url, secure=True), 'Verificado')
+            self.assertContains(self.client.get(url, {'verify': 1}, secure=True), 'Verificado')
+        self.assertEqual(replay.call_count, 1)
+
+    def test_verification_replays_the_stored_mode(self):
+        # Un contador que cambió después del sorteo no cambia el modo de la verificación.
+        Sorteo.objects.filter(pk=self.sorteo.pk).update(tickets_solds=1500)
+        self.sorteo.refresh_from_db()
+
+        self.assertTrue(verify_draw(self.sorteo)[1])
+
+
+class SalesBucketTests(TestCase):
+    def setUp(self):
+        self.sorteo = create_sorteo()
+        verified = create_payment(self.sorteo, 2, 'ref-v')
+        verify_payments([Payment.objects.select_related('sorteo').get(pk=verified.pk)])
+        create_payment(self.sorteo, 1, 'ref-c', method='Z').cancel()
+        create_payment(self.sorteo, 3, 'ref-e')
+        self.client.force_login(User.objects.create_user('operador', password='-'))
+
+    def buckets(self):
+        response = self.client.get(
+            reverse('sales_buckets', args=[self.sorteo.pk]), {'group': 'method'}, secure=True
+        )
+        return [
+            (row['method'], row['registered'], row['verified'], row['tickets'], row['cancelled'])
+            for row in response.json()['buckets']
+        ]
+
+    def test_buckets_follow_each_state_change(self):
+        self.assertEqual(self.buckets(), [('P', 2, 1, 2, 0), ('Z', 1, 0, 0, 1)])
+
+    def test_rebuild_matches_the_incremental_totals(self):
+        expected = self.buckets()
+        call_command('rebuild_sales_buckets', stdout=StringIO())
+
+        self.assertEqual(self.buckets(), expected)
+
+
+class ImageVariantsTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        picture = BytesIO()
+        Image.new('RGB', (1200, 800), (200, 30, 30)).save(picture, 'PNG')
+        self.sorteo = create_sorteo(prize_picture=SimpleUploadedFile('moto.png', picture.getvalue()))
+
+    def test_variants_are_generated_by_the_command(self):
+        self.assertIsNone(current_variants(self.sorteo.prize_picture))
+        version = Sorteo.objects.get(pk=self.sorteo.pk).version
+
+        call_command('generate_image_variants', stdout=StringIO())
+
+        self.assertTrue(current_variants(self.sorteo.prize_picture))
+        self.assertEqual(Sorteo.objects.get(pk=self.sorteo.pk).version, version + 1)
+        call_command('generate_image_variants', stdout=StringIO())
+        self.assertEqual(Sorteo.objects.get(pk=self.sorteo.pk).version, version + 1)
+
+
+class MediaTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(
+            MEDIA_ROOT=media.name,
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        )
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.content = bytes(range(100))
+        with open(f"{media.name}/video.mp4", 'wb') as video:
+            video.write(self.content)
+
+    def get(self, **headers):
+        return serve_media(RequestFactory().get('/media/video.mp4', **headers), 'video.mp4')
+
+    def test_a_range_is_served_partially(self):
+        response = self.get(HTTP_RANGE='bytes=10-19')
+
+        self.assertEqual((response.status_code, response['Content-Range']), (206, 'bytes 10-19/100'))
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+
+    def test_a_range_outside_the_file_is_rejected(self):
+        self.assertEqual(self.get(HTTP_RANGE='bytes=100-').status_code, 416)
+
+    def test_a_known_file_revalidates(self):
+        etag = self.get()['ETag']
+
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_a_new_poster_refreshes_the_cached_home(self):
+        def extract_frame(ffmpeg, source, output, at):
+            with open(output, 'wb') as poster:
+                poster.write(b'jpeg')
+            return True
+
+        create_sorteo(is_main=True, video_promo='premios/moto.mp4')
+        with self.captureOnCommitCallbacks(execute=True):
+            get_home_sorteo()
+        with mock.patch('sorteo.management.commands.generate_video_posters.shutil.which', return_value='ffmpeg'), \
+                mock.patch('sorteo.management.commands.generate_video_posters.extract_frame', extract_frame), \
+                self.captureOnCommitCallbacks(execute=True):
+            call_command('generate_video_posters', stdout=StringIO())
+
+        sorteo, _ = get_home_sorteo()
+        self.assertEqual(sorteo.video_poster.name, 'premios/posters/moto.jpg')
+
+
+class PaymentSerialTests(TestCase):
+    def test_buyers_with_the_same_ci_prefix_get_distinct_serials(self):
+        sorteo = create_sorteo()
+        with mock.patch('sorteo.serials.time.time', return_value=1760000000.0):
+            first = create_payment(sorteo, 1, 'ref-1', owner_ci='12340001')
+            second = create_payment(sorteo, 1, 'ref-2', owner_ci='12340002')
+
+        self.assertNotEqual(first.serial, second.serial)
+        self.assertEqual(len(first.serial), len('REF-') + 26)
+
+    def test_serials_sort_by_creation_time(self):
+        moments = [datetime(2026, 1, 1, tzinfo=timezone.utc) + timedelta(milliseconds=step) for step in (0, 1, 1000)]
+        serials = [generate_payment_serial(moment) for moment in moments]
+
+        self.assertEqual(sorted(serials), serials)
+
+
+class DuplicateReferenceTests(ConcurrentTestCase):
+    def test_concurrent_payments_with_the_same_reference(self):
+        sorteo = create_sorteo(total_tickets=50)
+
+        results = run_in_threads(lambda i: create_payment(sorteo, 1, 'ref-1', owner_ci=f"5000000{i}"), 8)
+
+        rejected = [result for result in results if isinstance(result, ValidationError)]
+        self.assertEqual(len([result for result in results if isinstance(result, Payment)]), 1)
+        self.assertEqual(len(rejected), 7)
+        for error in rejected:
+            self.assertEqual([e.code for e in error.error_dict['reference']], ['duplicate_reference'])
+        self.assertEqual(Payment.objects.filter(reference='ref-1').count(), 1)
+        sorteo.refresh_from_db()
+        self.assertEqual(sorteo.tickets_held, 1)
+
+
+class PaymentReferenceTests(TestCase):
+    def test_the_same_reference_is_accepted_from_another_bank(self):
+        sorteo = create_sorteo(total_tickets=50)
+        create_payment(sorteo, 1, 'ref-1')
+
+        create_payment(sorteo, 1, 'ref-1', bank_of_transfer='0105')
+        with self.assertRaises(ValidationError):
+            create_payment(sorteo, 1, 'ref-1')
+
+        self.assertEqual(Payment.objects.filter(reference='ref-1').count(), 2)
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Dos bases más, solo para estas pruebas: una réplica con la misma configuración que
+    la base principal y otra, SQLite, que no se puede abrir.
+    """
+    REPLICA, BROKEN = 'replica_test', 'replica_broken'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        default = connections.settings['default']
+        configured = connections.configure_settings({
+            'default': default,
+            cls.REPLICA: {**default, 'TEST': {}},
+            cls.BROKEN: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': '/nonexistent/replica.sqlite3'},
+        })
+        for alias in (cls.REPLICA, cls.BROKEN):
+            connections.settings[alias] = configured[alias]
+
+    @classmethod
+    def tearDownClass(cls):
+        for alias in (cls.REPLICA, cls.BROKEN):
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        super().tearDownClass()
+
+    def setUp(self):
+        self.sorteo = create_sorteo(is_main=True)
+        self.opened = []
+        connection_created.connect(self.connection_opened)
+        self.addCleanup(connection_created.disconnect, self.connection_opened)
+        self.addCleanup(routers._down_until.clear)
+
+    def connection_opened(self, sender, connection, **kwargs):
+        self.opened.append(connection.alias)
+
+    def test_home_from_the_cache_does_not_open_the_replica(self):
+        with self.settings(READ_REPLICAS=[self.REPLICA]):
+            self.client.get(reverse('home'))
+            response = self.client.get(reverse('home'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(self.REPLICA, self.opened)
+
+    def test_routed_reads_open_the_replica(self):
+        with self.settings(READ_REPLICAS=[self.REPLICA]):
+            response = self.client.get(reverse('verify_tickets'), {'q': '12345678'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(self.REPLICA, self.opened)
+
+    def test_an_unreachable_replica_falls_back_to_the_primary(self):
+        with self.settings(READ_REPLICAS=[self.BROKEN]):
+            response = self.client.get(reverse('verify_tickets'), {'q': '12345678'})
+
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(routers.choose_replica())
+
+
+class AsyncViewsTests(TestCase):
+    def test_public_views_are_async(self):
+        sorteo = create_sorteo(is_main=True)
+        payment = create_payment(sorteo, 1, 'ref-1')
+        urls = [
+            reverse('home'), reverse('verify_tickets'), reverse('sorteo_progress', args=[sorteo.slug]),
+            reverse('payment_success', args=[payment.serial]),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertTrue(iscoroutinefunction(resolve(url).func))
+
+    async def test_progress_revalidates_through_the_async_stack(self):
+        sorteo = await sync_to_async(create_sorteo)()
+        url = reverse('sorteo_progress', args=[sorteo.slug])
+
+        response = await self.async_client.get(url, secure=True)
+        again = await self.async_client.get(url, secure=True, headers={'If-None-Match': response['ETag']})
+
+        self.assertEqual((response.status_code, again.status_code), (200, 304))
+        self.assertIn('no-cache', response['Cache-Control'])
+
+
+class PublishProgressTests(TransactionTestCase):
+    def test_publishing_from_a_request_keeps_its_connection(self):
+        sorteo = create_sorteo()
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        subscription = Subscription(loop)
+        broker._subscriptions[sorteo.pk].add(subscription)
+        self.addCleanup(broker.unsubscribe, sorteo.pk, subscription)
+        connection.ensure_connection()
+        opened = connection.connection
+
+        # Como en transaction.on_commit tras una verificación, en el hilo de la petición.
+        publish_progress(sorteo.pk)
+
+        self.assertIs(connection.connection, opened)
+        data = loop.run_until_complete(subscription.next(1))
+        self.assertEqual(data, Sorteo.objects.get(pk=sorteo.pk).progress_data())
+
+
+class ProgressStreamTests(SimpleTestCase):
+    async def test_the_stream_ends_and_unsubscribes(self):
+        sorteo = Sorteo(pk=10**6, slug='moto', state='A', total_tickets=50, version=1)
+
+        with mock.patch('sorteo.views.PROGRESS_STREAM_MAX_SECONDS', 0.05), \
+                mock.patch('sorteo.views.PROGRESS_STREAM_HEARTBEAT', 0.01):
+            events = [event async for event in _progress_events(sorteo)]
+
+        self.assertTrue(events[0].startswith('retry: '))
+        self.assertIn(': ping\n\n', events)
+        self.assertFalse(broker.has_subscribers(sorteo.pk))
+
+
+class FailedVerificationTests(TestCase):
+    def test_a_failed_verification_keeps_the_hold(self):
+        sorteo = create_sorteo(total_tickets=50, choose_numbers=True)
+        payment = create_payment(sorteo, 2, 'ref-1', chosen_numbers=[7, 8])
+        expires_at = Payment.objects.get(pk=payment.pk).hold_expires_at
+
+        with mock.patch('sorteo.services.SorteoStats.record', side_effect=DatabaseError('caída')):
+            [result] = verify_payments([Payment.objects.select_related('sorteo').get(pk=payment.pk)])
+
+        self.assertEqual(result['status'], 'error')
+        self.assertEqual(Payment.objects.get(pk=payment.pk).hold_expires_at, expires_at)
+        sorteo.refresh_from_db()
+        self.assertEqual((sorteo.tickets_solds, sorteo.tickets_held), (0, 2))
+        self.assertEqual(NumberBlock.free_numbers(sorteo, 7, 8, 10), ([], 0))
+
+        [result] = verify_payments([Payment.objects.select_related('sorteo').get(pk=payment.pk)])
+
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual(sorted(Ticket.objects.filter(payment=payment).values_list('serial', flat=True)), [7, 8])
+        sorteo.refresh_from_db()
+        self.assertEqual((sorteo.tickets_solds, sorteo.tickets_held), (2, 0))
+
+
+class PaymentHoldTests(TestCase):
+    def test_a_payment_beyond_the_held_capacity_is_refused(self):
+        sorteo = create_sorteo(total_tickets=10)
+        create_payment(sorteo, 8, 'ref-1')
+
+        with self.assertRaises(ValidationError):
+            create_payment(sorteo, 3, 'ref-2')
+        sorteo.refresh_from_db()
+        self.assertEqual((sorteo.tickets_held, Payment.objects.count()), (8, 1))
+
+    def test_expired_holds_return_their_capacity(self):
+        sorteo = create_sorteo(total_tickets=10, choose_numbers=True)
+        payment = create_payment(sorteo, 2, 'ref-1', chosen_numbers=[3, 4])
+        Payment.objects.filter(pk=payment.pk).update(hold_expires_at=datetime.now(timezone.utc) - timedelta(minutes=1))
+
+        self.assertEqual(Payment.release_expired_holds(), 1)
+
+        sorteo.refresh_from_db()
+        self.assertEqual(sorteo.tickets_held, 0)
+        self.assertEqual(NumberBlock.free_numbers(sorteo, 3, 4, 10), ([3, 4], 2))
+        self.assertEqual(Payment.objects.get(pk=payment.pk).state, 'E')
+
+
+class ChooseNumbersToggleTests(TestCase):
+    def test_pending_chosen_numbers_keep_the_option_on(self):
+        sorteo = create_sorteo(total_tickets=50, choose_numbers=True)
+        payment = create_payment(sorteo, 2, 'ref-1', chosen_numbers=[7, 8])
+        sorteo.choose_numbers = False
+
+        with self.assertRaises(ValidationError) as raised:
+            sorteo.clean()
+        self.assertIn('choose_numbers', raised.exception.error_dict)
+
+        Payment.objects.filter(pk=payment.pk).update(state='C')
+        sorteo.clean()
+
+
+class NumberBlockTests(TestCase):
+    def test_a_chosen_number_is_taken_until_the_payment_is_cancelled(self):
+        sorteo = create_sorteo(total_tickets=20, choose_numbers=True)
+        payment = create_payment(sorteo, 2, 'ref-1', chosen_numbers=[7, 8])
+        url = reverse('sorteo_numbers', args=[sorteo.slug])
+
+        with self.assertRaises(ValidationError):
+            create_payment(sorteo, 1, 'ref-2', chosen_numbers=[8])
+        self.assertEqual(self.client.get(url, {'start': 5, 'end': 9}).json()['free'], [5, 6, 9])
+
+        Payment.objects.get(pk=payment.pk).cancel()
+        self.assertEqual(self.client.get(url, {'start': 5, 'end': 9}).json()['free_count'], 5)
+
+
+class SerialAllocationTests(TestCase):
+    def test_chosen_numbers_do_not_use_the_cursor(self):
+        sorteo = create_sorteo(total_tickets=50, choose_numbers=True)
+        payment = create_payment(sorteo, 2, 'ref-1', chosen_numbers=[7, 8])
+
+        verify_payments([Payment.objects.select_related('sorteo').get(pk=payment.pk)])
+
+        sorteo.refresh_from_db()
+        self.assertEqual((sorteo.tickets_solds, sorteo.serial_cursor), (2, 0))
+        self.assertEqual(sorted(Ticket.objects.filter(payment=payment).values_list('serial', flat=True)), [7, 8])
+
+    def test_verification_sells_distinct_numbers(self):
+        sorteo = create_sorteo(total_tickets=10)
+        payments = [create_payment(sorteo, 5, f"ref-{index}") for index in range(2)]
+        self.client.force_login(User.objects.create_user('admin', password='-', is_staff=True))
+
+        for payment in payments:
+            response = self.client.post(
+                reverse('verify_payment'), {'payment_id': payment.pk}, content_type='application/json', secure=True
+            )
+            self.assertEqual(response.status_code, 200)
+
+        sorteo.refresh_from_db()
+        serials = set(Ticket.objects.filter(sorteo=sorteo).values_list('serial', flat=True))
+        self.assertEqual(serials, set(range(1, 11)))
+        self.assertEqual((sorteo.tickets_solds, sorteo.serial_cursor), (10, 10))
+
+    def test_a_wrapped_cursor_refills_in_few_lookups(self):
+        # Cursor ya pasado de vuelta con el 90% vendido al azar, como tras muchas reservas liberadas.
+        sorteo = create_sorteo(total_tickets=1000, serial_key=1234)
+        payment = create_payment(sorteo, 1, 'ref-1', state='V')
+        sold = random.Random(1).sample(range(1, 1001), 900)
+        Ticket.objects.bulk_create([Ticket.for_payment(payment, serial, sorteo) for serial in sold])
+        Sorteo.objects.filter(pk=sorteo.pk).update(tickets_solds=900, serial_cursor=1000)
+        sorteo.refresh_from_db()
+
+        start = sorteo.reserve_tickets(20)
+        with CaptureQueriesContext(connection) as queries:
+            serials = sorteo.take_serials(start, 20)
+
+        self.assertEqual(len(set(serials) - set(sold)), 20)
+        lookups = [query for query in queries.captured_queries if 'sorteo_ticket' in query['sql']]
+        self.assertLessEqual(len(lookups), 4)
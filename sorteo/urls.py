@@ -7,13 +7,23 @@ urlpatterns = [
     path('login/', views.login, name='login'),
     path('sorteos/', views.sorteo_list, name='sorteo_list'),  
     path('pagos/', views.payment_list, name='payment_list'),
+    path('pagos/conciliar/', views.payment_reconcile, name='payment_reconcile'),
     path('logout', views.logout_view, name='logout'),
     path('sorteo/create/', views.sorteo_edit, name='sorteo_create'),
     path('sorteo/<int:sorteo_id>/edit/', views.sorteo_edit, name='sorteo_edit'),
     path('sorteo/<int:sorteo_id>/tickets', views.ticket_list, name='ticket_list'),
+    path('sorteo/<int:sorteo_id>/tickets.csv', views.ticket_export, name='ticket_export'),
+    path('sorteo/<int:sorteo_id>/draw/', views.sorteo_draw, name='sorteo_draw'),
+    path('sorteo/<int:sorteo_id>/sales.json', views.sales_buckets, name='sales_buckets'),
     path('sorteo/<slug:sorteo_slug>/process-payment/', views.process_payment, name='process_payment'),
+    path('sorteo/<slug:sorteo_slug>/progress.json', views.sorteo_progress, name='sorteo_progress'),
+    path('sorteo/<slug:sorteo_slug>/events/', views.sorteo_events, name='sorteo_events'),
+    path('sorteo/<slug:sorteo_slug>/numbers.json', views.sorteo_numbers, name='sorteo_numbers'),
     path('payment/success/<str:payment_serial>/', views.payment_success, name='payment_success'),
     path('payment/verify/', views.verify_payment, name='verify_payment'),
+    path('payment/verify-batch/', views.verify_payment_batch, name='verify_payment_batch'),
+    path('payment/verify-status/', views.verification_status, name='verification_status'),
     path('payment/cancel/', views.cancel_payment, name='cancel_payment'),
     path('verify-tickets/', views.verify_tickets, name='verify_tickets'),
+    path('metricas/', views.request_metrics, name='request_metrics'),
 ]
\ No newline at end of file
@@ -1,34 +1,102 @@
 from django.shortcuts import redirect, render, get_object_or_404
-from .models import Sorteo, Payment, Ticket, Premio
-from django.http import JsonResponse
+from .models import Sorteo, Payment, Ticket, Premio, VerificationJob, SalesBucket, NumberBlock
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.conf import settings
 # from .forms import PaymentForm, SorteoForm
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.db.models import Q, Case, When, Value
+from django.db.models import Q, OuterRef, Subquery, Sum
+from django.core.exceptions import ValidationError
 from django.contrib.auth.forms import AuthenticationForm
 from django.forms import inlineformset_factory
 from django.contrib.auth import login as auth_login, logout as auth_logout, authenticate
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from .forms import SorteoForm, PaymentForm, PremioForm, AdminPaymentForm
+from django.utils import timezone
+from asgiref.sync import sync_to_async
+from .forms import SorteoForm, PaymentForm, PremioForm, AdminPaymentForm, BankStatementForm
 from django.views.decorators.http import require_http_methods
-from django.db import transaction
+from .services import verify_payments
+from .caching import aget_home_sorteo
+from .decorators import async_cache_control, async_condition
+from .search import search_payments
+from .pagination import keyset_paginate, approximate_count
+from .metrics import view_stats
+from .exports import stream_ticket_csv
+from .reconciliation import read_statement, reconcile
+from .draw import run_draw, verify_draw
+from .routers import pin_to_primary, read_from_replica
+from .pubsub import broker
+import hashlib
 import logging
+import asyncio
 import json
-import random
+from datetime import datetime, time, timedelta
+
+# Máximo de pagos que se pueden verificar en una sola petición en lote.
+MAX_BATCH_VERIFY = 1000
+
+# Rango máximo y por defecto, en días, de la API de ventas según la granularidad.
+SALES_MAX_DAYS = {'H': 31, 'D': 731}
+SALES_DEFAULT_DAYS = {'H': 2, 'D': 90}
+SALES_GROUPS = {'method': 'method', 'bank': 'bank_of_transfer'}
+
+# Stream de progreso (sorteo_events): latido, duración máxima de cada conexión y
+# espera antes de reconectar, en el stream y en la respuesta única de WSGI. Django 4.2
+# no avisa cuando el cliente ASGI se desconecta: una pestaña cerrada mantiene su
+# suscripción hasta que el stream termina, así que cada conexión dura poco.
+PROGRESS_STREAM_HEARTBEAT = 15
+PROGRESS_STREAM_MAX_SECONDS = 60
+PROGRESS_STREAM_RETRY_MS = 3000
+PROGRESS_POLL_RETRY_MS = 30000
+
+# Rango máximo de la API de números libres y cuántos números devuelve como máximo.
+NUMBERS_MAX_RANGE = 100000
+NUMBERS_DEFAULT_LIMIT = 200
+NUMBERS_MAX_LIMIT = 1000
 
 # Create your views here.
 
-def home(request):
+def _visitor_stamp(request):
+    """
+    Parte de la ETag que depende del visitante: el usuario (cambia el menú) y la cookie
+    CSRF (sus formularios llevan un token derivado de ella).
+    """
+    csrf_cookie = request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')
+    return f"{request.user.pk or 0}-{hashlib.sha1(csrf_cookie.encode()).hexdigest()[:12]}"
+
+# Las vistas públicas son async: con ASGI un visitante lento no ocupa un hilo mientras
+# espera la red. request.user y el render leen la sesión con el ORM síncrono, así que
+# corren con sync_to_async.
+_avisitor_stamp = sync_to_async(_visitor_stamp)
+_arender = sync_to_async(render)
+
+async def _home_etag(request):
+    sorteo, _ = await aget_home_sorteo()
+    return f"home-{sorteo.pk if sorteo else 0}-{sorteo.version if sorteo else 0}-{await _avisitor_stamp(request)}"
+
+async def _home_last_modified(request):
+    sorteo, _ = await aget_home_sorteo()
+    # Para usuarios autenticados la página cambia con la sesión; solo usamos la ETag.
+    if sorteo and not await sync_to_async(lambda: request.user.is_authenticated)():
+        return sorteo.updated_at
+    return None
+
+@read_from_replica
+@async_condition(etag_func=_home_etag, last_modified_func=_home_last_modified)
+@async_cache_control(private=True, no_cache=True)
+async def home(request):
     form = PaymentForm()
-    sorteo = Sorteo.objects.filter(is_main=True).first()
-    premios = Premio.objects.filter(sorteo=sorteo).order_by('position')
+    # El sorteo principal y los bloques pesados de la plantilla salen de la caché.
+    sorteo, premios = await aget_home_sorteo()
 
     context = {'form': form,
                'sorteo': sorteo,
                'premios': premios
                }
 
-    return render(request, 'home.html', context)
+    return await _arender(request, 'home.html', context)
 
 @login_required
 def sorteo_list(request):
@@ -38,7 +106,7 @@ def sorteo_list(request):
     query = request.GET.get('q', '')
     state_filter = request.GET.get('state', '')
 
-    sorteo_list = Sorteo.objects.all().order_by('-date_lottery')
+    sorteo_list = Sorteo.objects.select_related('stats').order_by('-date_lottery')
 
     if state_filter:
         sorteo_list = sorteo_list.filter(state=state_filter)
@@ -73,11 +141,15 @@ def payment_list(request):
         if form.is_valid():
             payment = form.save(commit=False)
             payment.state = 'E'  # Los pagos manuales inician 'En Espera'
-            payment.save()
-            messages.success(request, f"Pago para '{payment.owner_name}' registrado exitosamente.")
-            return redirect('payment_list')
-        else:
-            messages.error(request, "Error al registrar el pago. Por favor, revisa los campos del formulario.")
+            try:
+                payment.save()
+            except ValidationError as e:
+                # Referencia ya registrada en otro pago del mismo banco.
+                form.add_error(None, e)
+            else:
+                messages.success(request, f"Pago para '{payment.owner_name}' registrado exitosamente.")
+                return redirect('payment_list')
+        messages.error(request, "Error al registrar el pago. Por favor, revisa los campos del formulario.")
     else:
         form = AdminPaymentForm()
 
@@ -85,31 +157,33 @@ def payment_list(request):
     state_filter = request.GET.get('state', '')
 
     # Ordenar por estado: 'En Espera' primero, luego el resto por fecha.
+    # El orden se guarda en state_order para poder paginar por cursor sobre un índice.
     payment_list = Payment.objects.annotate(
-        state_order=Case(
-            When(state='E', then=Value(1)),
-            When(state='V', then=Value(2)),
-            When(state='C', then=Value(3)),
-            default=Value(4)
-        )
-    ).order_by('state_order', '-created_at')
+        queued_job_id=Subquery(
+            VerificationJob.objects.filter(
+                payment=OuterRef('pk'), state__in=VerificationJob.ACTIVE_STATES
+            ).values('pk')[:1]
+        ),
+    )
 
     # Aplicar filtro de estado si se proporciona uno
     if state_filter and state_filter in ['E', 'V', 'C']:
         payment_list = payment_list.filter(state=state_filter)
     
     if query:
-        payment_list = payment_list.filter(
-            Q(owner_name__icontains=query) |
-            Q(owner_ci__icontains=query) |
-            Q(owner_email__icontains=query) |
-            Q(reference__icontains=query) |
-            Q(serial__icontains=query)
-        )
-
-    paginator = Paginator(payment_list, 15)  # Muestra 15 pagos por página
-    page_number = request.GET.get('page')
-    payments_page = paginator.get_page(page_number)
+        # Búsqueda por índices: exacta para cédula/referencia/serial/correo y
+        # FULLTEXT sobre search_text para el resto (ver sorteo/search.py).
+        payment_list = search_payments(payment_list, query)
+
+    # Paginación por cursor: 15 pagos por página, sin COUNT(*) ni OFFSET.
+    payments_page = keyset_paginate(
+        payment_list,
+        [('state_order', False), ('created_at', True), ('id', True)],
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        per_page=15,
+        approximate_total=None if query or state_filter else approximate_count(Payment),
+    )
 
     context = {
         'payments': payments_page,
@@ -186,6 +260,33 @@ def sorteo_edit(request, sorteo_id=None):
     }
     return render(request, 'sorteo/sorteo_form.html', context)
 
+@login_required
+def sorteo_draw(request, sorteo_id):
+    """
+    Realiza el sorteo de los premios y muestra los ganadores. Si ya se realizó y se
+    pide con ?verify=1, lo repite con la semilla guardada para comprobar que los
+    ganadores coinciden; no se repite en cada visita porque recorre los tickets.
+    """
+    sorteo = get_object_or_404(Sorteo, pk=sorteo_id)
+    if request.method == 'POST':
+        try:
+            run_draw(sorteo, request.POST.get('seed', '').strip() or None)
+            messages.success(request, 'Sorteo realizado. Guarde la semilla para poder verificarlo.')
+        except ValidationError as e:
+            messages.error(request, e.messages[0])
+        return redirect('sorteo_draw', sorteo_id=sorteo.pk)
+
+    verified = None
+    if sorteo.drawn_at and request.GET.get('verify'):
+        _, verified = verify_draw(sorteo)
+    premios = Premio.objects.filter(sorteo=sorteo).select_related('winning_ticket').order_by('position', 'pk')
+    context = {
+        'sorteo': sorteo,
+        'premios': premios,
+        'verified': verified,
+    }
+    return render(request, 'sorteo/sorteo_draw.html', context)
+
 @login_required
 def ticket_list(request, sorteo_id):
     """
@@ -205,9 +306,15 @@ def ticket_list(request, sorteo_id):
             Q(serial__iexact=query)
         )
 
-    paginator = Paginator(ticket_list, 20) # 20 tickets por página
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Paginación por cursor sobre el índice (sorteo, serial): 20 tickets por página.
+    page_obj = keyset_paginate(
+        ticket_list,
+        [('serial', False)],
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        per_page=20,
+        approximate_total=None if query else sorteo.tickets_solds,
+    )
 
     context = {
         'sorteo': sorteo,
@@ -216,6 +323,17 @@ def ticket_list(request, sorteo_id):
     }
     return render(request, 'ticket/ticket_list.html', context)
 
+@staff_member_required
+def ticket_export(request, sorteo_id):
+    """
+    Descarga en CSV todos los tickets de un sorteo. Las filas se envían a medida que se
+    leen de la base, así que la primera llega enseguida aunque el sorteo tenga millones.
+    """
+    sorteo = get_object_or_404(Sorteo, pk=sorteo_id)
+    response = StreamingHttpResponse(stream_ticket_csv(sorteo), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="tickets-{sorteo.slug}.csv"'
+    return response
+
 @require_http_methods(["POST"])
 def process_payment(request, sorteo_slug):
     """
@@ -229,29 +347,56 @@ def process_payment(request, sorteo_slug):
         payment = form.save(commit=False)
         payment.sorteo = sorteo
         payment.state = 'E'  # 'E' para 'En Espera'
-        payment.save()
+        payment.chosen_numbers = form.cleaned_data['chosen_numbers']
+        try:
+            payment.save()
+        except ValidationError as e:
+            # El INSERT encontró la misma referencia en otro pago del banco, o alguno
+            # de los números elegidos ya no está disponible.
+            form.add_error(None, e)
+        else:
+            messages.success(request, '¡Tu pago ha sido registrado! Está en proceso de verificación.')
+            # La confirmación y la página de inicio deben mostrar el pago aunque la réplica vaya atrasada.
+            return pin_to_primary(redirect('payment_success', payment_serial=payment.serial))
 
-        messages.success(request, '¡Tu pago ha sido registrado! Está en proceso de verificación.')
-        return redirect('payment_success', payment_serial=payment.serial)
-    else:
-        # El formulario tiene errores, lo devolvemos a la página de inicio para mostrarlos.
-        messages.error(request, 'Hubo un error al procesar tu pago. Por favor, revisa los campos marcados en rojo.')
-        
-        # Necesitamos el contexto completo de la página de inicio para re-renderizarla.
-        premios = Premio.objects.filter(sorteo=sorteo).order_by('position')
-        context = {
-            'form': form, # Pasamos el formulario con errores
-            'sorteo': sorteo,
-            'premios': premios
-        }
-        return render(request, 'home.html', context)
-
-def payment_success(request, payment_serial):
+    # El formulario tiene errores, lo devolvemos a la página de inicio para mostrarlos.
+    messages.error(request, 'Hubo un error al procesar tu pago. Por favor, revisa los campos marcados en rojo.')
+
+    # Necesitamos el contexto completo de la página de inicio para re-renderizarla.
+    premios = Premio.objects.filter(sorteo=sorteo).order_by('position')
+    context = {
+        'form': form, # Pasamos el formulario con errores
+        'sorteo': sorteo,
+        'premios': premios
+    }
+    return render(request, 'home.html', context)
+
+async def _payment_success_payment(request, payment_serial):
+    # Una sola búsqueda por el índice único de serial, compartida por la ETag y la vista.
+    if not hasattr(request, '_payment'):
+        try:
+            request._payment = await Payment.objects.aget(serial=payment_serial)
+        except Payment.DoesNotExist:
+            request._payment = None
+    return request._payment
+
+async def _payment_success_etag(request, payment_serial):
+    payment = await _payment_success_payment(request, payment_serial)
+    if payment is None:
+        return None
+    return f"pago-{payment_serial}-{payment.state}-{await _avisitor_stamp(request)}"
+
+@read_from_replica
+@async_condition(etag_func=_payment_success_etag)
+@async_cache_control(private=True, no_cache=True)
+async def payment_success(request, payment_serial):
     """
     Muestra una página de confirmación después de un pago exitoso.
     """
-    payment = get_object_or_404(Payment, serial=payment_serial)
-    return render(request, 'payment/payment_success.html', {'payment': payment})
+    payment = await _payment_success_payment(request, payment_serial)
+    if payment is None:
+        raise Http404("Pago no encontrado.")
+    return await _arender(request, 'payment/payment_success.html', {'payment': payment})
 
 @login_required
 @require_http_methods(["POST"])
@@ -261,57 +406,179 @@ def verify_payment(request):
         payment_id = data.get('payment_id')
         payment = get_object_or_404(Payment, pk=payment_id)
 
-        if payment.state != 'E':
-            return JsonResponse({'status': 'error', 'message': 'Este pago no está en espera de verificación.'}, status=400)
-
-        sorteo = payment.sorteo
-        tickets_to_generate = payment.tickets_quantity
-
-        with transaction.atomic():
-            # Bloqueamos el sorteo para evitar que otros procesos modifiquen los tickets vendidos al mismo tiempo.
-            sorteo_locked = Sorteo.objects.select_for_update().get(pk=sorteo.id)
-
-            if sorteo_locked.tickets_solds + tickets_to_generate > sorteo_locked.total_tickets:
-                return JsonResponse({'status': 'error', 'message': 'No hay suficientes tickets disponibles para este sorteo.'}, status=400)
-
-            # Obtenemos los números de tickets que ya existen para este sorteo.
-            existing_serials = set(Ticket.objects.filter(sorteo=sorteo_locked).values_list('serial', flat=True))
-            new_tickets = []
-            generated_serials = set()
-            
-            # Generamos números aleatorios hasta tener la cantidad necesaria de tickets únicos.
-            while len(generated_serials) < tickets_to_generate:
-                potential_serial = random.randint(1, sorteo_locked.total_tickets)
-                if potential_serial not in existing_serials and potential_serial not in generated_serials:
-                    generated_serials.add(potential_serial)
-
-            for serial in generated_serials:
-                new_tickets.append(Ticket(
-                    serial=serial,
-                    owner_name=payment.owner_name,
-                    owner_ci=payment.owner_ci,
-                    owner_email=payment.owner_email,
-                    owner_phone=payment.owner_phone,
-                    sorteo=sorteo_locked,
-                    payment=payment
-                ))
-            
-            Ticket.objects.bulk_create(new_tickets)
-
-            # Actualizamos el estado del pago y el contador de tickets del sorteo.
-            payment.state = 'V'
-            payment.save()
+        # Las compras grandes se verifican en segundo plano para no bloquear al worker web.
+        if payment.state == 'E' and payment.tickets_quantity >= settings.VERIFICATION_QUEUE_THRESHOLD:
+            job = VerificationJob.enqueue(payment)
+            return JsonResponse({'status': 'queued', 'message': 'La verificación quedó en cola y se procesará en breve.', 'job_id': job.pk}, status=202)
 
-            sorteo_locked.tickets_solds += tickets_to_generate
-            sorteo_locked.save()
+        # La reserva de capacidad, la numeración y la creación de tickets viven en services.
+        result = verify_payments([payment])[0]
+        status = 200 if result['status'] == 'success' else 400
 
         # Aquí podrías añadir la lógica para enviar un correo de confirmación.
-        return JsonResponse({'status': 'success', 'message': 'Pago verificado y tickets generados exitosamente.'})
+        return JsonResponse({'status': result['status'], 'message': result['message']}, status=status)
 
     except Exception as e:
         logging.error(f"Error al verificar el pago: {e}")
         return JsonResponse({'status': 'error', 'message': 'Ocurrió un error inesperado en el servidor.'}, status=500)
 
+@login_required
+@require_http_methods(["POST"])
+def verify_payment_batch(request):
+    """
+    Verifica varios pagos en una sola petición y devuelve el resultado de cada uno.
+    """
+    try:
+        data = json.loads(request.body)
+        payment_ids = data.get('payment_ids')
+        if not isinstance(payment_ids, list) or not 0 < len(payment_ids) <= MAX_BATCH_VERIFY:
+            return JsonResponse({'status': 'error', 'message': f'Debe enviar una lista de 1 a {MAX_BATCH_VERIFY} pagos.'}, status=400)
+        try:
+            payment_ids = list(dict.fromkeys(int(pk) for pk in payment_ids))
+        except (TypeError, ValueError):
+            return JsonResponse({'status': 'error', 'message': 'La lista de pagos contiene identificadores inválidos.'}, status=400)
+
+        payments_by_id = Payment.objects.select_related('sorteo').in_bulk(payment_ids)
+        payments = [payments_by_id[pk] for pk in payment_ids if pk in payments_by_id]
+
+        # Las compras grandes se encolan igual que en la verificación individual.
+        queued = [
+            payment for payment in payments
+            if payment.state == 'E' and payment.tickets_quantity >= settings.VERIFICATION_QUEUE_THRESHOLD
+        ]
+        results = verify_payments([payment for payment in payments if payment not in queued])
+        results += [
+            {'payment_id': payment.pk, 'status': 'queued', 'message': 'La verificación quedó en cola.', 'job_id': VerificationJob.enqueue(payment).pk}
+            for payment in queued
+        ]
+        results += [
+            {'payment_id': pk, 'status': 'error', 'message': 'El pago no existe.'}
+            for pk in payment_ids if pk not in payments_by_id
+        ]
+
+        verified = sum(1 for result in results if result['status'] == 'success')
+        failed = sum(1 for result in results if result['status'] == 'error')
+        message = f'{verified} de {len(payment_ids)} pagos verificados.'
+        if queued:
+            message += f' {len(queued)} quedaron en cola.'
+        return JsonResponse({
+            'status': 'success',
+            'message': message,
+            'verified': verified,
+            'queued': len(queued),
+            'failed': failed,
+            'results': results,
+        })
+
+    except Exception as e:
+        logging.error(f"Error al verificar pagos en lote: {e}")
+        return JsonResponse({'status': 'error', 'message': 'Ocurrió un error inesperado en el servidor.'}, status=500)
+
+@login_required
+def payment_reconcile(request):
+    """
+    Concilia un estado de cuenta bancario con los pagos en espera de ese banco y muestra
+    el informe; las coincidencias exactas se pueden verificar en lote desde la misma página.
+    """
+    report = None
+    if request.method == 'POST':
+        form = BankStatementForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                report = reconcile(form.cleaned_data['bank'], read_statement(form.cleaned_data['statement'].file))
+            except ValidationError as e:
+                form.add_error('statement', e)
+    else:
+        form = BankStatementForm()
+
+    context = {
+        'form': form,
+        'report': report,
+        'max_batch_verify': MAX_BATCH_VERIFY,
+    }
+    return render(request, 'payment/payment_reconcile.html', context)
+
+@login_required
+def sales_buckets(request, sorteo_id):
+    """
+    Ventas de un sorteo por hora o por día, leídas de SalesBucket.
+
+    Parámetros: `granularity` (hour|day), `start` y `end` (AAAA-MM-DD, ambos incluidos)
+    y `group` (method|bank) para separar por método de pago o banco.
+    """
+    sorteo = get_object_or_404(Sorteo, pk=sorteo_id)
+    granularity = {'hour': 'H', 'day': 'D'}.get(request.GET.get('granularity', 'day'))
+    group = request.GET.get('group', '')
+    if granularity is None or (group and group not in SALES_GROUPS):
+        return JsonResponse({'status': 'error', 'message': 'Parámetros inválidos.'}, status=400)
+
+    try:
+        end = datetime.strptime(request.GET['end'], '%Y-%m-%d').date() if request.GET.get('end') else timezone.localdate()
+        start = (
+            datetime.strptime(request.GET['start'], '%Y-%m-%d').date() if request.GET.get('start')
+            else end - timedelta(days=SALES_DEFAULT_DAYS[granularity] - 1)
+        )
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Las fechas deben tener el formato AAAA-MM-DD.'}, status=400)
+    if start > end or (end - start).days >= SALES_MAX_DAYS[granularity]:
+        return JsonResponse({'status': 'error', 'message': f'El rango debe tener entre 1 y {SALES_MAX_DAYS[granularity]} días.'}, status=400)
+
+    tz = timezone.get_current_timezone()
+    fields = ['start'] + ([SALES_GROUPS[group]] if group else [])
+    rows = (
+        SalesBucket.objects.filter(
+            sorteo=sorteo, granularity=granularity,
+            start__gte=timezone.make_aware(datetime.combine(start, time.min), tz),
+            start__lt=timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz),
+        )
+        .values(*fields)
+        .annotate(
+            registered=Sum('registered_count'), registered_amount=Sum('registered_amount'),
+            verified=Sum('verified_count'), verified_amount=Sum('verified_amount'),
+            tickets=Sum('verified_tickets'),
+            cancelled=Sum('cancelled_count'), cancelled_amount=Sum('cancelled_amount'),
+        )
+        .order_by(*fields)
+    )
+    return JsonResponse({
+        'status': 'success',
+        'sorteo': sorteo.pk,
+        'granularity': request.GET.get('granularity', 'day'),
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'group': group or None,
+        'buckets': [
+            {**row, 'start': timezone.localtime(row['start']).isoformat()}
+            for row in rows
+        ],
+    })
+
+@login_required
+def verification_status(request):
+    """
+    Devuelve el estado de los trabajos de verificación indicados en `?ids=1,2,3`.
+    La lista de pagos lo consulta periódicamente mientras haya verificaciones en cola.
+    """
+    try:
+        job_ids = [int(pk) for pk in request.GET.get('ids', '').split(',') if pk]
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Identificadores inválidos.'}, status=400)
+
+    jobs = VerificationJob.objects.filter(pk__in=job_ids[:MAX_BATCH_VERIFY])
+    return JsonResponse({
+        'status': 'success',
+        'jobs': [
+            {
+                'job_id': job.pk,
+                'payment_id': job.payment_id,
+                'state': job.state,
+                'state_display': job.get_state_display(),
+                'message': job.message,
+            }
+            for job in jobs
+        ],
+    })
+
 @login_required
 @require_http_methods(["POST"])
 def cancel_payment(request):
@@ -320,17 +587,129 @@ def cancel_payment(request):
         payment_id = data.get('payment_id')
         payment = get_object_or_404(Payment, pk=payment_id)
 
-        if payment.state != 'E':
+        if not payment.cancel():
             return JsonResponse({'status': 'error', 'message': 'Solo se pueden cancelar pagos que están en espera.'}, status=400)
 
-        payment.state = 'C'
-        payment.save()
         return JsonResponse({'status': 'success', 'message': 'El pago ha sido cancelado exitosamente.'})
     except Exception as e:
         logging.error(f"Error al cancelar el pago: {e}")
         return JsonResponse({'status': 'error', 'message': 'Ocurrió un error inesperado en el servidor.'}, status=500)
 
-def verify_tickets(request):
+async def _progress_stamp(request, sorteo_slug):
+    # condition() pide la ETag y Last-Modified por separado; consultamos una sola vez.
+    if not hasattr(request, '_progress_stamp'):
+        request._progress_stamp = await Sorteo.objects.filter(slug=sorteo_slug).values_list('version', 'updated_at').afirst()
+    return request._progress_stamp
+
+async def _progress_etag(request, sorteo_slug):
+    stamp = await _progress_stamp(request, sorteo_slug)
+    return f"progreso-{sorteo_slug}-{stamp[0]}" if stamp else None
+
+async def _progress_last_modified(request, sorteo_slug):
+    stamp = await _progress_stamp(request, sorteo_slug)
+    return stamp[1] if stamp else None
+
+@read_from_replica
+@async_condition(etag_func=_progress_etag, last_modified_func=_progress_last_modified)
+@async_cache_control(no_cache=True)
+async def sorteo_progress(request, sorteo_slug):
+    """
+    Devuelve en JSON el avance de ventas del sorteo. La página de inicio lo consulta
+    periódicamente en lugar de recargarse; si nada cambió responde 304 sin tocar el sorteo.
+    """
+    try:
+        sorteo = await Sorteo.objects.aget(slug=sorteo_slug)
+    except Sorteo.DoesNotExist:
+        raise Http404("Sorteo no encontrado.")
+    return JsonResponse(sorteo.progress_data())
+
+@read_from_replica
+@async_cache_control(no_cache=True)
+async def sorteo_numbers(request, sorteo_slug):
+    """
+    Números libres de un sorteo con elección de números entre `start` y `end`
+    (inclusive), leídos del mapa de bits del sorteo sin consultar los tickets.
+    Devuelve hasta `limit` números y cuántos hay libres en todo el rango.
+    """
+    try:
+        sorteo = await Sorteo.objects.only('total_tickets', 'choose_numbers').aget(slug=sorteo_slug)
+    except Sorteo.DoesNotExist:
+        raise Http404("Sorteo no encontrado.")
+    if not sorteo.choose_numbers:
+        raise Http404("Este sorteo no permite elegir números.")
+
+    try:
+        start = int(request.GET.get('start', 1))
+        end = int(request.GET.get('end', start + NUMBERS_DEFAULT_LIMIT - 1))
+        limit = min(int(request.GET.get('limit', NUMBERS_DEFAULT_LIMIT)), NUMBERS_MAX_LIMIT)
+    except ValueError:
+        return JsonResponse({'error': 'start, end y limit deben ser números enteros.'}, status=400)
+    if end < start or end - start >= NUMBERS_MAX_RANGE or limit < 0:
+        return JsonResponse({'error': f'El rango debe tener entre 1 y {NUMBERS_MAX_RANGE} números.'}, status=400)
+
+    free, count = await sync_to_async(NumberBlock.free_numbers)(sorteo, start, end, limit)
+    return JsonResponse({
+        'start': max(start, 1),
+        'end': min(end, sorteo.total_tickets),
+        'free_count': count,
+        'free': free,
+        'truncated': count > len(free),
+    })
+
+def _progress_event(data):
+    return f"event: progress\nid: {data['version']}\ndata: {json.dumps(data)}\n\n"
+
+async def _progress_events(sorteo):
+    """
+    Envía el avance actual y luego cada cambio, con un comentario cada
+    PROGRESS_STREAM_HEARTBEAT segundos para que los proxies no corten la conexión.
+    Termina a los PROGRESS_STREAM_MAX_SECONDS; el navegador se reconecta solo.
+    """
+    subscription = broker.subscribe(sorteo.pk)
+    try:
+        yield f"retry: {PROGRESS_STREAM_RETRY_MS}\n" + _progress_event(sorteo.progress_data())
+        version = sorteo.version
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + PROGRESS_STREAM_MAX_SECONDS
+        while loop.time() < deadline:
+            data = await subscription.next(PROGRESS_STREAM_HEARTBEAT)
+            if data is None:
+                yield ": ping\n\n"
+            elif data['version'] != version:
+                version = data['version']
+                yield _progress_event(data)
+    finally:
+        broker.unsubscribe(sorteo.pk, subscription)
+
+async def sorteo_events(request, sorteo_slug):
+    """
+    Stream Server-Sent Events con el avance de ventas del sorteo. Con ASGI una sola
+    conexión abierta por visitante, sin hilo propio, reemplaza las consultas periódicas
+    a sorteo_progress. Con WSGI cada conexión ocuparía un hilo, así que se envía el
+    avance actual y se cierra: el navegador vuelve a conectarse tras `retry`, como
+    una consulta periódica.
+    """
+    try:
+        sorteo = await Sorteo.objects.only(
+            'slug', 'state', 'total_tickets', 'tickets_solds', 'version'
+        ).aget(slug=sorteo_slug)
+    except Sorteo.DoesNotExist:
+        raise Http404("Sorteo no encontrado.")
+
+    if isinstance(request, ASGIRequest):
+        response = StreamingHttpResponse(_progress_events(sorteo), content_type='text/event-stream')
+    else:
+        response = HttpResponse(
+            f"retry: {PROGRESS_POLL_RETRY_MS}\n" + _progress_event(sorteo.progress_data()),
+            content_type='text/event-stream',
+        )
+    response['Cache-Control'] = 'no-cache'
+    # Sin esto nginx acumula la respuesta y los eventos no llegan a tiempo.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@read_from_replica
+async def verify_tickets(request):
     """
     Busca y muestra los tickets de un usuario por su correo o cédula.
     """
@@ -338,13 +717,29 @@ def verify_tickets(request):
     tickets_found = []
 
     if query:
-        # Busca tickets que coincidan exactamente con el correo o la cédula.
-        tickets_found = Ticket.objects.filter(
-            Q(owner_email__iexact=query) | Q(owner_ci__iexact=query)
-        ).select_related('sorteo').order_by('-created_at')
+        # Busca tickets que coincidan exactamente con el correo o la cédula
+        # normalizados, usando los índices de owner_email_key y owner_ci.
+        tickets_found = [ticket async for ticket in Ticket.owned_by(query).select_related('sorteo')]
 
     context = {
         'query': query,
         'tickets': tickets_found,
     }
-    return render(request, 'ticket/ticket_verify_results.html', context)
+    return await _arender(request, 'ticket/ticket_verify_results.html', context)
+
+@staff_member_required
+def request_metrics(request):
+    """
+    Resumen de latencia y consultas por vista de este proceso del servidor.
+    """
+    if request.method == 'POST':
+        view_stats.reset()
+        messages.success(request, 'Métricas reiniciadas.')
+        return redirect('request_metrics')
+
+    context = {
+        'enabled': settings.REQUEST_METRICS,
+        'window': settings.REQUEST_METRICS_WINDOW,
+        'rows': view_stats.summary(),
+    }
+    return render(request, 'administration/request_metrics.html', context)